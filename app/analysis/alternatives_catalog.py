@@ -0,0 +1,375 @@
+# app/analysis/alternatives_catalog.py
+"""
+External, compiled alternatives catalog.
+
+The source catalog is a JSON file mapping each service key either to a list of
+alternatives or to {"alternatives": [...], "aliases": [...], "exact_aliases": [...]}
+(see `AlternativesIndex` for exact aliases). It is compiled into a
+read-only SQLite index that every worker opens with memory-mapped I/O, so the
+catalog pages live once in the OS page cache instead of in each worker's heap.
+
+Compile with:
+
+    python -m app.analysis.alternatives_catalog compile catalog.json alternatives.sqlite3
+    python -m app.analysis.alternatives_catalog export-builtin catalog.json
+"""
+import argparse
+import functools
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from app.models.schemas import AlternativeDetail
+from app.analysis.alternatives_index import (
+    MIN_FUZZY_TOKEN_LENGTH,
+    AlternativesMatch,
+    normalize_service_tokens,
+    pattern_fuzzy_score,
+    trigrams,
+)
+
+# Configure a logger for this module
+logger = logging.getLogger(__name__)
+
+CATALOG_FORMAT_VERSION = "3"
+_MMAP_SIZE_BYTES = 256 * 1024 * 1024
+_MAX_QUERY_TOKENS = 32  # Keeps span queries well under SQLite's bound-parameter limit
+
+
+def compile_catalog(
+    source: Mapping[str, Any],
+    output_path: str,
+    aliases: Optional[Mapping[str, Iterable[str]]] = None,
+    exact_aliases: Optional[Mapping[str, Iterable[str]]] = None
+) -> Dict[str, Any]:
+    """
+    Compiles a catalog mapping into a SQLite index at `output_path`.
+    The file is written next to the target and atomically renamed into place, so
+    workers watching `output_path` never observe a half-written index.
+    """
+    started = time.perf_counter()
+    aliases = aliases or {}
+    exact_aliases = exact_aliases or {}
+    target_dir = os.path.dirname(os.path.abspath(output_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".alternatives-", suffix=".sqlite3", dir=target_dir)
+    os.close(fd)
+
+    try:
+        conn = sqlite3.connect(tmp_path)
+        conn.executescript(
+            "PRAGMA journal_mode=OFF;"
+            "CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+            "CREATE TABLE services (id INTEGER PRIMARY KEY, key TEXT NOT NULL, alternatives TEXT NOT NULL);"
+            "CREATE TABLE patterns (id INTEGER PRIMARY KEY, tokens TEXT NOT NULL UNIQUE, service_id INTEGER NOT NULL,"
+            " whole_only INTEGER NOT NULL DEFAULT 0);"
+            "CREATE TABLE pattern_tokens (pattern_id INTEGER NOT NULL, position INTEGER NOT NULL, trigram_count INTEGER NOT NULL,"
+            " PRIMARY KEY (pattern_id, position)) WITHOUT ROWID;"
+            "CREATE TABLE trigrams (gram TEXT NOT NULL, pattern_id INTEGER NOT NULL, position INTEGER NOT NULL,"
+            " PRIMARY KEY (gram, pattern_id, position)) WITHOUT ROWID;"
+        )
+        service_count = pattern_count = max_pattern_tokens = 0
+        whole_only_patterns: List[Tuple[str, int]] = []
+        for service_id, (key, entry) in enumerate(source.items()):
+            if isinstance(entry, Mapping):
+                alternatives = list(entry.get("alternatives", []))
+                entry_aliases = list(entry.get("aliases", []))
+                entry_exact_aliases = list(entry.get("exact_aliases", []))
+            else:
+                alternatives = list(entry)
+                entry_aliases = entry_exact_aliases = []
+            whole_only_patterns.extend((pattern, service_id) for pattern in [*entry_exact_aliases, *exact_aliases.get(key, ())])
+            # Validate up front so a bad catalog fails the compile, not a request.
+            validated = [AlternativeDetail(**alt).model_dump(exclude_none=True) for alt in alternatives]
+            conn.execute("INSERT INTO services (id, key, alternatives) VALUES (?, ?, ?)", (service_id, key, json.dumps(validated)))
+            service_count += 1
+
+            for pattern in [key, *entry_aliases, *aliases.get(key, ())]:
+                tokens = normalize_service_tokens(pattern)
+                if not tokens:
+                    continue
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO patterns (tokens, service_id) VALUES (?, ?)", (" ".join(tokens), service_id)
+                )
+                if cursor.rowcount == 0:
+                    continue  # First service to claim a pattern keeps it
+                pattern_id = cursor.lastrowid
+                for position, token in enumerate(tokens):
+                    if len(token) < MIN_FUZZY_TOKEN_LENGTH:
+                        continue
+                    grams = set(trigrams(token))
+                    conn.execute(
+                        "INSERT INTO pattern_tokens (pattern_id, position, trigram_count) VALUES (?, ?, ?)",
+                        (pattern_id, position, len(grams))
+                    )
+                    conn.executemany(
+                        "INSERT INTO trigrams (gram, pattern_id, position) VALUES (?, ?, ?)",
+                        [(g, pattern_id, position) for g in grams]
+                    )
+                pattern_count += 1
+                max_pattern_tokens = max(max_pattern_tokens, len(tokens))
+
+        # After all regular patterns, so an exact alias never shadows one of them. They get
+        # no trigrams: they are not fuzzy-matched either.
+        for pattern, service_id in whole_only_patterns:
+            tokens = normalize_service_tokens(pattern)
+            if not tokens:
+                continue
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO patterns (tokens, service_id, whole_only) VALUES (?, ?, 1)", (" ".join(tokens), service_id)
+            )
+            if cursor.rowcount:
+                pattern_count += 1
+                max_pattern_tokens = max(max_pattern_tokens, len(tokens))
+
+        conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [
+            ("format_version", CATALOG_FORMAT_VERSION),
+            ("max_pattern_tokens", str(max_pattern_tokens)),
+            ("compiled_at", str(time.time())),
+        ])
+        conn.commit()
+        conn.execute("VACUUM")
+        conn.close()
+        os.replace(tmp_path, output_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+    stats = {
+        "services": service_count,
+        "patterns": pattern_count,
+        "bytes": os.path.getsize(output_path),
+        "compile_seconds": round(time.perf_counter() - started, 4),
+    }
+    logger.info(f"Compiled alternatives catalog to '{output_path}': {stats}")
+    return stats
+
+
+class CompiledAlternativesIndex:
+    """
+    Read-only, memory-mapped view of a compiled catalog with the same lookup API as
+    `AlternativesIndex`. Only a bounded LRU of decoded results lives in the heap.
+    """
+
+    def __init__(self, path: str, fuzzy_threshold: float = 0.6, cache_size: int = 4096):
+        self.path = path
+        self.fuzzy_threshold = fuzzy_threshold
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+        self._conn.execute(f"PRAGMA mmap_size={_MMAP_SIZE_BYTES}")
+        meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+        if meta.get("format_version") != CATALOG_FORMAT_VERSION:
+            self._conn.close()
+            raise ValueError(f"Unsupported alternatives catalog format {meta.get('format_version')!r} in '{path}'.")
+        self._max_pattern_tokens = int(meta.get("max_pattern_tokens", "1"))
+        self._service_count = self._conn.execute("SELECT COUNT(*) FROM services").fetchone()[0]
+        self._lookup_cached = functools.lru_cache(maxsize=cache_size)(self._lookup_uncached)
+        self._details_cached = functools.lru_cache(maxsize=cache_size)(self._load_details)
+
+    def __len__(self) -> int:
+        return self._service_count
+
+    def close(self):
+        """Closes the database (and unmaps it) now rather than whenever GC collects the index."""
+        with self._lock:
+            self._conn.close()
+        self._lookup_cached.cache_clear()
+        self._details_cached.cache_clear()
+
+    def _query(self, sql: str, params: Sequence[Any]) -> List[Tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _load_details(self, service_id: int) -> Tuple[str, Tuple[AlternativeDetail, ...]]:
+        key, alternatives = self._query("SELECT key, alternatives FROM services WHERE id = ?", (service_id,))[0]
+        return key, tuple(AlternativeDetail(**alt) for alt in json.loads(alternatives))
+
+    def _match_for(self, service_id: int, match_type: str, score: float) -> AlternativesMatch:
+        key, details = self._details_cached(service_id)
+        return AlternativesMatch(key, details, match_type, score)
+
+    def _lookup_uncached(self, tokens: Tuple[str, ...]) -> Optional[AlternativesMatch]:
+        tokens = tokens[:_MAX_QUERY_TOKENS]
+        # Every contiguous token span that could be a pattern, longest then leftmost first.
+        spans = [
+            (length, start, " ".join(tokens[start:start + length]))
+            for length in range(min(len(tokens), self._max_pattern_tokens), 0, -1)
+            for start in range(len(tokens) - length + 1)
+        ]
+        if spans:
+            found = {
+                text: (service_id, whole_only) for text, service_id, whole_only in self._query(
+                    f"SELECT tokens, service_id, whole_only FROM patterns WHERE tokens IN ({','.join('?' * len(spans))})",
+                    [text for _, _, text in spans]
+                )
+            }
+            for length, start, text in spans:
+                if text not in found:
+                    continue
+                service_id, whole_only = found[text]
+                is_whole = length == len(tokens)
+                if whole_only and not is_whole:
+                    continue
+                key, _ = self._details_cached(service_id)
+                exact = is_whole and normalize_service_tokens(key) == tokens
+                return self._match_for(service_id, "exact" if exact else "alias", 1.0)
+
+        # Same scoring as `AlternativesIndex._fuzzy`: every pattern token must be covered.
+        query = set(tokens)
+        token_scores: Dict[int, Dict[int, float]] = {}
+        for token in query:
+            grams = sorted(set(trigrams(token)))
+            rows = self._query(
+                "SELECT t.pattern_id, t.position, pt.trigram_count, COUNT(*) FROM trigrams t"
+                " JOIN pattern_tokens pt ON pt.pattern_id = t.pattern_id AND pt.position = t.position"
+                f" WHERE t.gram IN ({','.join('?' * len(grams))}) GROUP BY t.pattern_id, t.position",
+                grams
+            )
+            for pattern_id, position, trigram_count, overlap in rows:
+                score = 2.0 * overlap / (len(grams) + trigram_count)
+                scores = token_scores.setdefault(pattern_id, {})
+                if score > scores.get(position, 0.0):
+                    scores[position] = score
+        best_service, best_score = None, 0.0
+        if token_scores:
+            candidates = self._query(
+                f"SELECT id, tokens, service_id FROM patterns WHERE id IN ({','.join('?' * len(token_scores))})",
+                list(token_scores)
+            )
+            for pattern_id, pattern_tokens, service_id in candidates:
+                score = pattern_fuzzy_score(pattern_tokens.split(" "), query, token_scores[pattern_id])
+                if score > best_score:
+                    best_service, best_score = service_id, score
+        if best_service is not None and best_score >= self.fuzzy_threshold:
+            return self._match_for(best_service, "fuzzy", round(best_score, 3))
+        return None
+
+    def match(self, service_name: str) -> Optional[AlternativesMatch]:
+        tokens = normalize_service_tokens(service_name)
+        if not tokens:
+            return None
+        return self._lookup_cached(tokens)
+
+    def lookup(self, service_name: str) -> List[AlternativeDetail]:
+        found = self.match(service_name)
+        return list(found.alternatives) if found else []
+
+    def lookup_many(self, service_names: Iterable[str]) -> Dict[str, List[AlternativeDetail]]:
+        return {name: self.lookup(name) for name in service_names}
+
+
+class ReloadingAlternativesCatalog:
+    """
+    Serves lookups from a compiled catalog file and swaps in a new index when the file
+    is replaced. The check is a cheap `os.stat` at most every `check_interval` seconds
+    and happens before a lookup starts, never during one, so the replaced index is
+    closed as soon as it is swapped out.
+    If the file is missing or invalid, `fallback` (e.g. the built-in index) is used.
+    """
+
+    def __init__(self, path: str, fallback: Any = None, check_interval: float = 5.0):
+        self.path = path
+        self.fallback = fallback
+        self.check_interval = check_interval
+        self.last_reload_seconds: Optional[float] = None
+        self._index: Any = fallback
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+        self._maybe_reload(force=True)
+
+    def _file_signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _maybe_reload(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return
+        if not self._reload_lock.acquire(blocking=False):
+            return  # Another thread is already reloading; keep serving the current index
+        try:
+            self._next_check = now + self.check_interval
+            signature = self._file_signature()
+            if signature == self._signature:
+                return
+            if signature is None:
+                logger.warning(f"Alternatives catalog '{self.path}' not found; using built-in catalog.")
+                self._swap(self.fallback, None)
+                return
+            started = time.perf_counter()
+            try:
+                new_index = CompiledAlternativesIndex(self.path)
+            except Exception as e:
+                logger.error(f"Failed to load alternatives catalog '{self.path}', keeping current index: {e}")
+                self._signature = signature  # Do not retry a broken file on every request
+                return
+            self._swap(new_index, signature)
+            self.last_reload_seconds = round(time.perf_counter() - started, 4)
+            logger.info(f"Loaded alternatives catalog '{self.path}' ({len(new_index)} services) in {self.last_reload_seconds}s.")
+        finally:
+            self._reload_lock.release()
+
+    def _swap(self, index: Any, signature: Optional[Tuple[int, int, int]]):
+        previous = self._index
+        self._index, self._signature = index, signature
+        if previous is not self.fallback and previous is not index:
+            previous.close()
+
+    @property
+    def index(self) -> Any:
+        self._maybe_reload()
+        return self._index
+
+
+def _export_builtin(output_path: str):
+    from app.analysis.alternatives_suggester import ALTERNATIVES_DB, SERVICE_ALIASES, SERVICE_EXACT_ALIASES
+
+    catalog = {
+        key: {
+            "aliases": SERVICE_ALIASES.get(key, []),
+            "exact_aliases": SERVICE_EXACT_ALIASES.get(key, []),
+            "alternatives": alternatives
+        }
+        for key, alternatives in ALTERNATIVES_DB.items()
+    }
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(catalog, f, indent=2)
+    print(f"Exported {len(catalog)} built-in services to {output_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the alternatives catalog into a memory-mappable index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    compile_cmd = sub.add_parser("compile", help="Compile a JSON catalog into a SQLite index.")
+    compile_cmd.add_argument("source")
+    compile_cmd.add_argument("output")
+    export_cmd = sub.add_parser("export-builtin", help="Write the built-in catalog as JSON to start an external one.")
+    export_cmd.add_argument("output")
+    args = parser.parse_args()
+
+    if args.command == "export-builtin":
+        _export_builtin(args.output)
+        return
+
+    with open(args.source, encoding="utf-8") as f:
+        source = json.load(f)
+    stats = compile_catalog(source, args.output)
+    started = time.perf_counter()
+    index = CompiledAlternativesIndex(args.output)
+    open_seconds = time.perf_counter() - started
+    sample = [key for key in islice(source, 3)]
+    print(json.dumps(dict(stats, open_seconds=round(open_seconds, 4), sample_hits={k: len(index.lookup(k)) for k in sample}), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# app/analysis/alternatives_index.py
+import functools
+import logging
+import re
+from collections import Counter
+from typing import AbstractSet, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from app.models.schemas import AlternativeDetail
+
+# Configure a logger for this module
+logger = logging.getLogger(__name__)
+
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9]+")
+# Shorter pattern tokens ("hbo", "365", "us") only count when they appear verbatim.
+MIN_FUZZY_TOKEN_LENGTH = 4
+
+
+def normalize_service_tokens(text: str) -> Tuple[str, ...]:
+    """Lowercases, spells out '+' (as in "Disney+") and splits on anything non-alphanumeric."""
+    text = text.lower().replace("+", " plus ")
+    return tuple(token for token in _NON_ALNUM_RE.split(text) if token)
+
+
+def trigrams(text: str) -> List[str]:
+    padded = f"  {text} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def pattern_fuzzy_score(pattern_tokens: Sequence[str], query_tokens: AbstractSet[str], token_scores: Mapping[int, float]) -> float:
+    """
+    Fuzzy score of a pattern against a descriptor: the score of its worst-covered token.
+    `token_scores` maps a token position to its best trigram similarity with any
+    descriptor token, so every token of "google drive" must be found for it to match
+    and a shared brand prefix ("google play") is not enough.
+    """
+    worst = 1.0
+    for position, token in enumerate(pattern_tokens):
+        if token in query_tokens:
+            continue
+        if len(token) < MIN_FUZZY_TOKEN_LENGTH:
+            return 0.0
+        worst = min(worst, token_scores.get(position, 0.0))
+    return worst
+
+
+class AlternativesMatch:
+    __slots__ = ("key", "alternatives", "match_type", "score")
+
+    def __init__(self, key: str, alternatives: Tuple[AlternativeDetail, ...], match_type: str, score: float):
+        self.key = key
+        self.alternatives = alternatives
+        self.match_type = match_type  # "exact", "alias" or "fuzzy"
+        self.score = score
+
+
+class AlternativesIndex:
+    """
+    Prebuilt lookup over the alternatives catalog.
+
+    Every catalog key and alias is compiled into a single token-level Aho-Corasick
+    automaton, so a messy descriptor like "SPOTIFY P0A1B2 STOCKHOLM" is matched in one
+    pass over its tokens regardless of catalog size. When nothing matches on token
+    boundaries, a trigram index over the pattern tokens provides a fuzzy fallback: a
+    pattern matches when each of its tokens is similar to some descriptor token above
+    `fuzzy_threshold` (see `pattern_fuzzy_score`).
+    `exact_aliases` only match a descriptor that consists of nothing else ("Max" is HBO
+    Max, "MAX FITNESS GYM" is not); they are kept out of the automaton and fuzzy index.
+    Validated, frozen `AlternativeDetail` instances are built once and shared.
+    """
+
+    def __init__(
+        self,
+        catalog: Mapping[str, Iterable[Mapping[str, Optional[str]]]],
+        aliases: Optional[Mapping[str, Iterable[str]]] = None,
+        exact_aliases: Optional[Mapping[str, Iterable[str]]] = None,
+        fuzzy_threshold: float = 0.6,
+        cache_size: int = 4096
+    ):
+        self.fuzzy_threshold = fuzzy_threshold
+        self._keys: List[str] = []
+        self._details: List[Tuple[AlternativeDetail, ...]] = []
+        self._exact: Dict[Tuple[str, ...], int] = {}
+        # Aho-Corasick automaton over tokens: goto edges, failure links, outputs (key id, pattern length).
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, int]]] = [[]]
+        # Trigram postings per pattern token: gram -> (pattern id, token position).
+        self._trigram_postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._token_trigram_count: Dict[Tuple[int, int], int] = {}
+        self._pattern_key: List[int] = []
+        self._pattern_tokens: List[Tuple[str, ...]] = []
+
+        aliases = aliases or {}
+        exact_aliases = exact_aliases or {}
+        for key, alternatives in catalog.items():
+            key_id = len(self._keys)
+            self._keys.append(key)
+            self._details.append(tuple(AlternativeDetail(**alt) for alt in alternatives))
+            for pattern in [key, *aliases.get(key, ())]:
+                self._add_pattern(normalize_service_tokens(pattern), key_id)
+        # After all regular patterns, so an exact alias never shadows one of them.
+        key_ids = {key: key_id for key_id, key in enumerate(self._keys)}
+        for key, patterns in exact_aliases.items():
+            for pattern in patterns:
+                tokens = normalize_service_tokens(pattern)
+                if tokens and key in key_ids:
+                    self._exact.setdefault(tokens, key_ids[key])
+        self._build_failure_links()
+
+        self._lookup_cached = functools.lru_cache(maxsize=cache_size)(self._lookup_uncached)
+        logger.info(f"Built alternatives index: {len(self._keys)} services, {len(self._pattern_key)} patterns, {len(self._goto)} automaton states.")
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _add_pattern(self, tokens: Tuple[str, ...], key_id: int):
+        if not tokens or tokens in self._exact:
+            return
+        self._exact[tokens] = key_id
+
+        state = 0
+        for token in tokens:
+            next_state = self._goto[state].get(token)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][token] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = next_state
+        self._out[state].append((key_id, len(tokens)))
+
+        pattern_id = len(self._pattern_key)
+        self._pattern_key.append(key_id)
+        self._pattern_tokens.append(tokens)
+        for position, token in enumerate(tokens):
+            if len(token) < MIN_FUZZY_TOKEN_LENGTH:
+                continue
+            grams = set(trigrams(token))
+            self._token_trigram_count[(pattern_id, position)] = len(grams)
+            for gram in grams:
+                self._trigram_postings.setdefault(gram, []).append((pattern_id, position))
+
+    def _build_failure_links(self):
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for token, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                candidate = self._goto[fallback].get(token, 0)
+                self._fail[child] = candidate if candidate != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def _scan(self, tokens: Sequence[str]) -> Optional[int]:
+        """Returns the key id of the longest (then leftmost) pattern occurring in `tokens`."""
+        best: Optional[Tuple[int, int, int]] = None  # (length, -start, key id)
+        state = 0
+        for position, token in enumerate(tokens):
+            while state and token not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(token, 0)
+            for key_id, length in self._out[state]:
+                candidate = (length, -(position - length + 1), key_id)
+                if best is None or candidate[:2] > best[:2]:
+                    best = candidate
+        return best[2] if best else None
+
+    def _fuzzy(self, tokens: Sequence[str]) -> Tuple[Optional[int], float]:
+        # Bank strings pad the service name with location and reference noise, so each
+        # pattern token is compared with every descriptor token and the noise is ignored.
+        query = set(tokens)
+        token_scores: Dict[int, Dict[int, float]] = {}
+        for token in query:
+            grams = set(trigrams(token))
+            shared: Counter = Counter()
+            for gram in grams:
+                shared.update(self._trigram_postings.get(gram, ()))
+            for (pattern_id, position), overlap in shared.items():
+                score = 2.0 * overlap / (len(grams) + self._token_trigram_count[(pattern_id, position)])
+                scores = token_scores.setdefault(pattern_id, {})
+                if score > scores.get(position, 0.0):
+                    scores[position] = score
+        best_key, best_score = None, 0.0
+        for pattern_id, scores in token_scores.items():
+            score = pattern_fuzzy_score(self._pattern_tokens[pattern_id], query, scores)
+            if score > best_score:
+                best_key, best_score = self._pattern_key[pattern_id], score
+        if best_score >= self.fuzzy_threshold:
+            return best_key, best_score
+        return None, best_score
+
+    def _lookup_uncached(self, tokens: Tuple[str, ...]) -> Optional[AlternativesMatch]:
+        key_id = self._exact.get(tokens)
+        if key_id is not None:
+            match_type = "exact" if normalize_service_tokens(self._keys[key_id]) == tokens else "alias"
+            return AlternativesMatch(self._keys[key_id], self._details[key_id], match_type, 1.0)
+
+        key_id = self._scan(tokens)
+        if key_id is not None:
+            return AlternativesMatch(self._keys[key_id], self._details[key_id], "alias", 1.0)
+
+        key_id, score = self._fuzzy(tokens)
+        if key_id is not None:
+            return AlternativesMatch(self._keys[key_id], self._details[key_id], "fuzzy", round(score, 3))
+        return None
+
+    def match(self, service_name: str) -> Optional[AlternativesMatch]:
+        tokens = normalize_service_tokens(service_name)
+        if not tokens:
+            return None
+        return self._lookup_cached(tokens)
+
+    def lookup(self, service_name: str) -> List[AlternativeDetail]:
+        found = self.match(service_name)
+        return list(found.alternatives) if found else []
+
+    def lookup_many(self, service_names: Iterable[str]) -> Dict[str, List[AlternativeDetail]]:
+        return {name: self.lookup(name) for name in service_names}
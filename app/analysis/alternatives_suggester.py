@@ -1,7 +1,10 @@
 # app/analysis/alternatives_suggester.py
 import logging
-from typing import List, Dict, Optional
+from typing import Any, Iterable, List, Dict, Optional
+from app.config import settings
 from app.models.schemas import AlternativeDetail
+from app.analysis.alternatives_index import AlternativesIndex
+from app.analysis.alternatives_catalog import ReloadingAlternativesCatalog
 
 # Configure a logger for this module
 logger = logging.getLogger(__name__)
@@ -115,27 +118,60 @@ ALTERNATIVES_DB: Dict[str, List[Dict[str, Optional[str]]]] = {
     # Add more services and their alternatives as needed
 }
 
+# Alternative spellings seen in bank descriptors and user input, keyed by ALTERNATIVES_DB key.
+SERVICE_ALIASES: Dict[str, List[str]] = {
+    "netflix": ["netflix com"],
+    "amazon prime video": ["prime video", "primevideo", "amazon prime", "amzn prime"],
+    "disney+": ["disney plus", "disneyplus"],
+    "hbo max": ["hbomax", "hbo"],
+    "apple music": ["applemusic"],
+    "youtube premium": ["youtube music", "yt premium", "youtubepremium"],
+    "google drive": ["google one", "google storage"],
+    "microsoft onedrive": ["onedrive"],
+    "icloud": ["icloud storage", "apple icloud"],
+    "adobe creative cloud": ["creative cloud"],
+    "microsoft 365": ["office 365", "microsoft office", "msft 365", "m365"],
+    "zoom": ["zoom us", "zoom video"],
+    "github pro": ["github"],
+}
+
+# Names that identify a service only when they are the whole descriptor: "Max" is HBO Max,
+# but "MAX FITNESS GYM" is not, so these never match inside a longer descriptor.
+SERVICE_EXACT_ALIASES: Dict[str, List[str]] = {
+    "hbo max": ["max"],
+}
+
+# Built once at import; lookups never touch the raw dicts again.
+_ALTERNATIVES_INDEX = AlternativesIndex(ALTERNATIVES_DB, SERVICE_ALIASES, SERVICE_EXACT_ALIASES)
+
+# An external compiled catalog, when configured, takes over from the built-in one and
+# is hot-reloaded when the file is replaced.
+_EXTERNAL_CATALOG: Optional[ReloadingAlternativesCatalog] = (
+    ReloadingAlternativesCatalog(
+        settings.alternatives_catalog_path,
+        fallback=_ALTERNATIVES_INDEX,
+        check_interval=settings.alternatives_catalog_check_seconds
+    )
+    if settings.alternatives_catalog_path else None
+)
+
+def _current_index() -> Any:
+    return _EXTERNAL_CATALOG.index if _EXTERNAL_CATALOG is not None else _ALTERNATIVES_INDEX
+
 def get_gemini_alternatives(service_name: str) -> List[AlternativeDetail]:
     """
-    Looks up a service in the hardcoded knowledge base and returns its alternatives.
-    Note: Currently uses a hardcoded DB. "Gemini" in the name suggests future AI integration.
+    Looks up a service in the alternatives knowledge base and returns its alternatives.
+    Matches exact names, known aliases anywhere in the descriptor, then fuzzy spellings.
+    Note: Uses the hardcoded DB unless an external catalog is configured. "Gemini" in the name suggests future AI integration.
     """
-    normalized_service_name = service_name.lower().strip()
-    
-    logger.info(f"Looking for alternatives for: '{normalized_service_name}' in hardcoded DB.")
+    match = _current_index().match(service_name)
+    if match is None:
+        logger.info(f"No alternatives found for '{service_name}' in alternatives catalog.")
+        return []
 
-    # Simple direct match first
-    if normalized_service_name in ALTERNATIVES_DB:
-        alternatives = ALTERNATIVES_DB[normalized_service_name]
-        logger.info(f"Found {len(alternatives)} direct match alternatives for '{normalized_service_name}'.")
-        return [AlternativeDetail(**alt) for alt in alternatives]
+    logger.info(f"Found {len(match.alternatives)} {match.match_type} match alternatives for '{service_name}' (matched with key '{match.key}').")
+    return list(match.alternatives)
 
-    # Try partial matching (e.g., "icloud storage" should match "icloud")
-    for key in ALTERNATIVES_DB.keys():
-        if key in normalized_service_name:
-            alternatives = ALTERNATIVES_DB[key]
-            logger.info(f"Found {len(alternatives)} partial match alternatives for '{normalized_service_name}' (matched with key '{key}').")
-            return [AlternativeDetail(**alt) for alt in alternatives]
-            
-    logger.info(f"No alternatives found for '{normalized_service_name}' in hardcoded DB.")
-    return []
\ No newline at end of file
+def get_gemini_alternatives_batch(service_names: Iterable[str]) -> Dict[str, List[AlternativeDetail]]:
+    """Looks up many service names in one call; unknown names map to an empty list."""
+    return _current_index().lookup_many(service_names)
@@ -0,0 +1,149 @@
+# app/analysis/email_receipts.py
+"""
+Local preprocessing of emails before receipt extraction: HTML stripping, boilerplate
+removal, a cheap receipt pre-filter, content hashing for dedupe, and packing into
+model-call sized batches.
+"""
+import hashlib
+import html
+import logging
+import re
+from html.parser import HTMLParser
+from typing import Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_RECEIPT_SUBJECT_RE = re.compile(
+    r"\b(receipt|invoice|order|payment|paid|charged?|billing|bill|renew(al|ed|s)?|subscription|membership|"
+    r"trial|purchase|your plan|statement|confirmation)\b",
+    re.IGNORECASE
+)
+_RECEIPT_BODY_RE = re.compile(
+    r"\b(total|amount (paid|due|charged)|subtotal|order (number|#)|invoice (number|#)|billed|"
+    r"payment method|next (billing|payment)|renews? on|receipt)\b",
+    re.IGNORECASE
+)
+_NOT_RECEIPT_RE = re.compile(
+    r"\b(newsletter|webinar|password reset|verify your (email|account)|security alert|"
+    r"sign[- ]in attempt|shipped|out for delivery|survey|% off|sale ends)\b",
+    re.IGNORECASE
+)
+MONEY_RE = re.compile(
+    r"(?:[$€£¥₹]\s?\d[\d,]*(?:\.\d{2})?|\b\d[\d,]*[.,]\d{2}\s?(?:USD|EUR|GBP|CAD|AUD|INR|JPY)\b|"
+    r"\b(?:USD|EUR|GBP|CAD|AUD|INR|JPY)\s?\d[\d,]*(?:[.,]\d{2})?)"
+)
+_BOILERPLATE_LINE_RE = re.compile(
+    r"(unsubscribe|manage (your )?(email )?preferences|privacy (policy|notice)|terms (of (service|use)|and conditions)|"
+    r"view (this email )?in (your )?browser|all rights reserved|©|\(c\) \d{4}|do not reply|"
+    r"this (email|message) was sent (to|by)|download (the|our) app|follow us|update your preferences)",
+    re.IGNORECASE
+)
+_WHITESPACE_RE = re.compile(r"[ \t\u00a0]+")
+
+
+class _TextExtractor(HTMLParser):
+    _SKIP = {"script", "style", "head", "title", "noscript", "svg"}
+    _BLOCK = {"br", "p", "div", "tr", "li", "table", "h1", "h2", "h3", "h4", "h5", "h6", "section", "td"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self._SKIP:
+            self._skip_depth += 1
+        elif tag in self._BLOCK:
+            self.parts.append("\n" if tag != "td" else " ")
+
+    def handle_endtag(self, tag):
+        if tag in self._SKIP and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag in self._BLOCK:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(data)
+
+
+def html_to_text(markup: str) -> str:
+    parser = _TextExtractor()
+    try:
+        parser.feed(markup)
+        parser.close()
+    except Exception as e:
+        # Malformed markup: fall back to dropping tags with a regex.
+        logger.debug(f"HTML parse failed, stripping tags instead: {e}")
+        return html.unescape(re.sub(r"<[^>]+>", " ", markup))
+    return "".join(parser.parts)
+
+
+def clean_email_body(body: str, is_html: bool = False) -> str:
+    """Plain text with markup, boilerplate footer lines, blank runs and repeated whitespace removed."""
+    text = html_to_text(body) if is_html or ("<" in body and re.search(r"</?(html|body|div|table|p|br)\b", body, re.IGNORECASE)) else body
+    lines = []
+    for line in text.splitlines():
+        line = _WHITESPACE_RE.sub(" ", line).strip()
+        if not line or line.startswith(">") or _BOILERPLATE_LINE_RE.search(line):
+            continue
+        if lines and lines[-1] == line:
+            continue
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def condense(text: str, max_chars: int) -> str:
+    """
+    Fits `text` into `max_chars`. Keeps the opening (merchant, greeting, line items)
+    and then the later lines that mention amounts, since totals usually sit at the bottom.
+    """
+    if len(text) <= max_chars:
+        return text
+    head_budget = max_chars * 2 // 3
+    head = text[:head_budget].rstrip()
+    kept = [head]
+    used = len(head)
+    for line in text[head_budget:].splitlines()[1:]:
+        if MONEY_RE.search(line) or _RECEIPT_BODY_RE.search(line):
+            if used + len(line) + 1 > max_chars:
+                break
+            kept.append(line)
+            used += len(line) + 1
+    return "\n".join(kept)
+
+
+def looks_like_receipt(subject: Optional[str], text: str) -> bool:
+    """
+    Cheap pre-filter run before any model call: a receipt names an amount and uses
+    receipt vocabulary in the subject or body. Marketing and account-notice wording
+    in the subject rules an email out.
+    """
+    subject = subject or ""
+    if _NOT_RECEIPT_RE.search(subject):
+        return False
+    if not MONEY_RE.search(text) and not MONEY_RE.search(subject):
+        return False
+    return bool(_RECEIPT_SUBJECT_RE.search(subject) or _RECEIPT_BODY_RE.search(text))
+
+
+def content_hash(subject: Optional[str], text: str) -> str:
+    """Identifies the same receipt delivered twice (forwards, duplicates across folders)."""
+    normalized = f"{(subject or '').strip().lower()}\n{_WHITESPACE_RE.sub(' ', text).strip().lower()}"
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def pack_batches(items: Iterable[Tuple[str, str]], max_items: int, max_chars: int) -> List[List[Tuple[str, str]]]:
+    """Groups (item id, text) pairs greedily, in order, under both an item and a character budget."""
+    batches: List[List[Tuple[str, str]]] = []
+    current: List[Tuple[str, str]] = []
+    used = 0
+    for item_id, text in items:
+        if current and (len(current) >= max_items or used + len(text) > max_chars):
+            batches.append(current)
+            current, used = [], 0
+        current.append((item_id, text))
+        used += len(text)
+    if current:
+        batches.append(current)
+    return batches
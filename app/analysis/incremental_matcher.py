@@ -0,0 +1,105 @@
+# app/analysis/incremental_matcher.py
+import decimal
+import logging
+from typing import List, Optional, Set, Tuple
+
+from app.models.schemas import TransactionInput, IdentifiedSubscription
+from app.analysis.recurrence_detector import PERIODS, next_billing_date, normalize_merchant
+
+# Configure a logger for this module
+logger = logging.getLogger(__name__)
+
+# A delta may skip a few billing cycles (e.g. the client polled late or the bank
+# delayed a posting); allow up to this many missed cycles when matching cadence.
+_MAX_CYCLES_BETWEEN_MATCHES = 3
+
+
+class TrackedSubscription:
+    """A previously identified subscription plus the merchant keys its charges were seen under."""
+
+    def __init__(self, subscription: IdentifiedSubscription, merchant_keys: Set[str]):
+        self.subscription = subscription
+        self.merchant_keys = set(merchant_keys)
+
+    @classmethod
+    def from_transactions(cls, subscription: IdentifiedSubscription, members: List[TransactionInput]) -> "TrackedSubscription":
+        keys = {normalize_merchant(tx.description) for tx in members}
+        keys.add(normalize_merchant(subscription.name))
+        return cls(subscription, keys)
+
+
+def _fits_cadence(subscription: IdentifiedSubscription, tx: TransactionInput) -> bool:
+    period = PERIODS.get(subscription.detected_frequency)
+    if period is None:
+        # Unknown cadence (e.g. a Gemini answer of "irregular"): merchant and amount decide.
+        return True
+    if subscription.first_transaction_date <= tx.transaction_date <= subscription.last_transaction_date:
+        # Late-arriving backfill inside the already observed range.
+        return True
+
+    expected, tolerance, _ = period
+    gap = abs((tx.transaction_date - subscription.last_transaction_date).days)
+    return any(
+        abs(gap - cycles * expected) <= cycles * tolerance
+        for cycles in range(1, _MAX_CYCLES_BETWEEN_MATCHES + 1)
+    )
+
+
+def _amount_distance(subscription: IdentifiedSubscription, tx: TransactionInput) -> Optional[float]:
+    if tx.currency.upper() != subscription.currency.upper():
+        return None
+    average = subscription.average_amount
+    if average == 0:
+        return 0.0 if tx.amount == 0 else None
+    return float(abs(tx.amount - average) / abs(average))
+
+
+def _attach(tracked: TrackedSubscription, tx: TransactionInput):
+    sub = tracked.subscription
+    count = len(sub.transaction_ids)
+    total = sub.average_amount * count + tx.amount
+    last = max(sub.last_transaction_date, tx.transaction_date)
+    update = {
+        "transaction_ids": sub.transaction_ids + [tx.id],
+        "average_amount": (total / (count + 1)).quantize(decimal.Decimal("0.01"), rounding=decimal.ROUND_HALF_UP),
+        "first_transaction_date": min(sub.first_transaction_date, tx.transaction_date),
+        "last_transaction_date": last,
+    }
+    if sub.detected_frequency in PERIODS:
+        update["potential_next_billing_date"] = next_billing_date(last, sub.detected_frequency)
+    tracked.subscription = sub.model_copy(update=update)
+
+
+def attach_to_known_subscriptions(
+    tracked_subscriptions: List[TrackedSubscription],
+    transactions: List[TransactionInput],
+    amount_tolerance: float = 0.15
+) -> Tuple[List[TransactionInput], List[TransactionInput]]:
+    """
+    Attaches new transactions to known subscriptions in place when merchant, currency,
+    amount (within `amount_tolerance`, relative) and cadence all agree.
+    Returns (attached, unexplained) transactions.
+    """
+    attached: List[TransactionInput] = []
+    unexplained: List[TransactionInput] = []
+
+    for tx in sorted(transactions, key=lambda t: t.transaction_date):
+        merchant_key = normalize_merchant(tx.description)
+        best: Optional[TrackedSubscription] = None
+        best_distance = amount_tolerance
+        for tracked in tracked_subscriptions:
+            if merchant_key not in tracked.merchant_keys:
+                continue
+            distance = _amount_distance(tracked.subscription, tx)
+            if distance is None or distance > best_distance or not _fits_cadence(tracked.subscription, tx):
+                continue
+            best, best_distance = tracked, distance
+
+        if best is None:
+            unexplained.append(tx)
+        else:
+            _attach(best, tx)
+            attached.append(tx)
+
+    logger.info(f"Incremental matching attached {len(attached)} of {len(transactions)} new transactions to known subscriptions.")
+    return attached, unexplained
@@ -0,0 +1,193 @@
+# app/analysis/prompt_chunker.py
+import decimal
+import logging
+from collections import defaultdict
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from app.models.schemas import TransactionInput
+from app.analysis.recurrence_detector import normalize_merchant
+
+# Configure a logger for this module
+logger = logging.getLogger(__name__)
+
+# Rough characters-per-token ratio for English/JSON-ish prompt text.
+# Good enough for budgeting; the model's own tokenizer is not needed here.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def format_transaction_line(tx: TransactionInput) -> str:
+    return f"- ID: {tx.id}, Date: {tx.transaction_date}, Description: \"{tx.description}\", Amount: {tx.amount} {tx.currency}"
+
+
+def plan_transaction_chunks(
+    transactions: List[TransactionInput],
+    max_tokens_per_chunk: int,
+    strategy: str = "merchant",
+    format_line: Callable[[TransactionInput], str] = format_transaction_line,
+    format_merchant: Optional[Callable[[str], str]] = None
+) -> List[List[TransactionInput]]:
+    """
+    Splits transactions into chunks whose transaction lines fit in `max_tokens_per_chunk`.
+
+    With the "merchant" strategy, all transactions of one normalized merchant are kept
+    in the same chunk whenever they fit, so the model still sees each recurrence as a
+    whole. Merchants too large for one chunk, and the "time" strategy, split by date.
+    `format_line` is the row format the prompt uses, for estimating each row's size.
+    `format_merchant`, for prompts that list each merchant once per chunk (the compact
+    encoding), is that dictionary line; it is counted once in every chunk the merchant
+    appears in.
+    """
+    if not transactions:
+        return []
+
+    line_tokens = {tx.id: estimate_tokens(format_line(tx)) for tx in transactions}
+    merchant_of = {tx.id: normalize_merchant(tx.description) for tx in transactions}
+    merchant_tokens: Dict[str, int] = {}
+    if format_merchant is not None:
+        merchant_tokens = {merchant: estimate_tokens(format_merchant(merchant)) for merchant in set(merchant_of.values())}
+    if sum(line_tokens.values()) + sum(merchant_tokens.values()) <= max_tokens_per_chunk:
+        return [list(transactions)]
+
+    if strategy == "time":
+        groups = [sorted(transactions, key=lambda t: t.transaction_date)]
+    else:
+        by_merchant: Dict[str, List[TransactionInput]] = defaultdict(list)
+        for tx in transactions:
+            by_merchant[merchant_of[tx.id]].append(tx)
+        # Largest merchants first gives a tighter first-fit packing.
+        groups = sorted(
+            (sorted(group, key=lambda t: t.transaction_date) for group in by_merchant.values()),
+            key=len,
+            reverse=True
+        )
+
+    chunks: List[List[TransactionInput]] = []
+    chunk_tokens: List[int] = []
+    chunk_merchants: List[Set[str]] = []
+
+    def cost(rows_tokens: int, merchants: Set[str], present: Set[str]) -> int:
+        return rows_tokens + sum(merchant_tokens.get(merchant, 0) for merchant in merchants - present)
+
+    def place(group: List[TransactionInput], rows_tokens: int, merchants: Set[str]):
+        for index, used in enumerate(chunk_tokens):
+            tokens = cost(rows_tokens, merchants, chunk_merchants[index])
+            if used + tokens <= max_tokens_per_chunk:
+                chunks[index].extend(group)
+                chunk_tokens[index] += tokens
+                chunk_merchants[index] |= merchants
+                return
+        chunks.append(list(group))
+        chunk_tokens.append(cost(rows_tokens, merchants, set()))
+        chunk_merchants.append(set(merchants))
+
+    for group in groups:
+        group_rows = sum(line_tokens[tx.id] for tx in group)
+        group_merchants = {merchant_of[tx.id] for tx in group}
+        if cost(group_rows, group_merchants, set()) <= max_tokens_per_chunk:
+            place(group, group_rows, group_merchants)
+            continue
+        # Oversized group: cut it into consecutive date windows.
+        window: List[TransactionInput] = []
+        window_rows = 0
+        window_merchants: Set[str] = set()
+        for tx in group:
+            tx_tokens = cost(line_tokens[tx.id], {merchant_of[tx.id]}, window_merchants)
+            if window and cost(window_rows, window_merchants, set()) + tx_tokens > max_tokens_per_chunk:
+                place(window, window_rows, window_merchants)
+                window, window_rows, window_merchants = [], 0, set()
+            window.append(tx)
+            window_rows += line_tokens[tx.id]
+            window_merchants.add(merchant_of[tx.id])
+        if window:
+            place(window, window_rows, window_merchants)
+
+    logger.info(f"Planned {len(chunks)} prompt chunks for {len(transactions)} transactions (budget {max_tokens_per_chunk} tokens each).")
+    return chunks
+
+
+def _as_date(value: Any) -> Optional[date]:
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str):
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            return None
+    return None
+
+
+def _as_confidence(value: Any) -> float:
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def coerce_transaction_ids(value: Any) -> List[str]:
+    """`transaction_ids` from a model answer as a list of strings; anything but a list is no IDs."""
+    if not isinstance(value, (list, tuple)):
+        return []
+    return [str(item) for item in value]
+
+
+def merge_subscription_lists(
+    partial_results: List[List[Dict[str, Any]]],
+    transactions: List[TransactionInput]
+) -> List[Dict[str, Any]]:
+    """
+    Merges raw subscription dicts returned for separate chunks.
+
+    Entries are deduplicated by (lowercased name, currency). Each transaction ID is
+    assigned to at most one subscription, preferring the higher confidence one, and
+    unknown IDs are dropped. Dates and average amount are recomputed from the input
+    transactions rather than trusted from the partial answers.
+    """
+    tx_by_id = {tx.id: tx for tx in transactions}
+
+    merged: Dict[Any, Dict[str, Any]] = {}
+    for partial in partial_results:
+        for sub in partial:
+            if not isinstance(sub, dict) or not sub.get("name"):
+                continue
+            key = (str(sub["name"]).strip().lower(), str(sub.get("currency", "")).upper())
+            existing = merged.get(key)
+            if existing is None:
+                merged[key] = dict(sub, transaction_ids=coerce_transaction_ids(sub.get("transaction_ids")))
+                continue
+            existing["transaction_ids"].extend(coerce_transaction_ids(sub.get("transaction_ids")))
+            if _as_confidence(sub.get("confidence_score")) > _as_confidence(existing.get("confidence_score")):
+                existing["confidence_score"] = sub.get("confidence_score")
+                existing["detected_frequency"] = sub.get("detected_frequency", existing.get("detected_frequency"))
+            next_billing = _as_date(sub.get("potential_next_billing_date"))
+            if next_billing and (_as_date(existing.get("potential_next_billing_date")) or date.min) < next_billing:
+                existing["potential_next_billing_date"] = sub.get("potential_next_billing_date")
+
+    claimed: Dict[str, Any] = {}
+    for key, sub in sorted(merged.items(), key=lambda item: -_as_confidence(item[1].get("confidence_score"))):
+        unique_ids = []
+        for tx_id in dict.fromkeys(sub["transaction_ids"]):
+            if tx_id in tx_by_id and tx_id not in claimed:
+                claimed[tx_id] = key
+                unique_ids.append(tx_id)
+        sub["transaction_ids"] = unique_ids
+
+    results = []
+    for sub in merged.values():
+        members = [tx_by_id[tx_id] for tx_id in sub["transaction_ids"]]
+        if not members:
+            continue
+        members.sort(key=lambda t: t.transaction_date)
+        total = sum((t.amount for t in members), decimal.Decimal("0"))
+        sub["transaction_ids"] = [t.id for t in members]
+        sub["first_transaction_date"] = members[0].transaction_date
+        sub["last_transaction_date"] = members[-1].transaction_date
+        sub["average_amount"] = (total / len(members)).quantize(decimal.Decimal("0.01"), rounding=decimal.ROUND_HALF_UP)
+        results.append(sub)
+
+    logger.info(f"Merged {sum(len(p) for p in partial_results)} partial subscriptions into {len(results)}.")
+    return results
@@ -0,0 +1,112 @@
+# app/analysis/prompt_encoding.py
+import logging
+import re
+from collections import Counter
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+from app.models.schemas import TransactionInput
+from app.analysis.prompt_chunker import coerce_transaction_ids
+from app.analysis.recurrence_detector import normalize_merchant
+
+# Configure a logger for this module
+logger = logging.getLogger(__name__)
+
+
+# Characters that would break the table layout if a merchant name contained them.
+_TABLE_SEPARATORS_RE = re.compile(r"\s*[|\r\n]+\s*")
+
+
+def dictionary_merchant_name(merchant: str) -> str:
+    """
+    `merchant` as it is listed in the merchant dictionary. Normalized merchants are plain
+    words, but the raw-description fallback of `normalize_merchant` may contain column
+    separators or line breaks, which are replaced by spaces.
+    """
+    return _TABLE_SEPARATORS_RE.sub(" ", merchant).strip()
+
+
+def approximate_compact_row(tx: TransactionInput) -> str:
+    """
+    A row as long as `tx` would typically be in a compact table, for chunk budgeting:
+    row IDs and day offsets of up to four digits. Merchant dictionary lines are
+    estimated separately by `approximate_merchant_entry`.
+    """
+    return f"0000|0000|m00|{tx.amount}"
+
+
+def approximate_merchant_entry(merchant: str) -> str:
+    """The merchant dictionary line for a normalized merchant, with a two-digit code."""
+    return f"m00={dictionary_merchant_name(merchant)}"
+
+
+class CompactTransactionTable:
+    """
+    Token-compact rendering of a transaction list for the subscription prompt.
+
+    The verbose format repeats labels, the full description and the currency on every
+    row. Here each normalized merchant is listed once in a dictionary and rows reference
+    it by code, dates are day offsets from a base date, the most common currency is
+    stated once (other currencies are appended to their rows), and rows get short
+    sequential IDs. `restore` maps the short IDs in a model answer back to the original
+    transaction IDs.
+    """
+
+    def __init__(self, transactions: List[TransactionInput]):
+        rows = sorted(transactions, key=lambda t: (t.transaction_date, t.id))
+        self.base_date: date = rows[0].transaction_date if rows else date.today()
+        self.currency: str = Counter(tx.currency.upper() for tx in rows).most_common(1)[0][0] if rows else "USD"
+
+        self.merchant_codes: Dict[str, str] = {}
+        self.rows: Dict[str, TransactionInput] = {}
+        lines = []
+        for index, tx in enumerate(rows, start=1):
+            merchant = dictionary_merchant_name(normalize_merchant(tx.description))
+            code = self.merchant_codes.setdefault(merchant, f"m{len(self.merchant_codes) + 1}")
+            row_id = str(index)
+            self.rows[row_id] = tx
+            line = f"{row_id}|{(tx.transaction_date - self.base_date).days}|{code}|{tx.amount}"
+            if tx.currency.upper() != self.currency:
+                line += f"|{tx.currency.upper()}"
+            lines.append(line)
+        self._row_lines = lines
+
+    def render(self) -> str:
+        merchants = "\n".join(f"{code}={merchant}" for merchant, code in self.merchant_codes.items())
+        rows = "\n".join(self._row_lines)
+        return (
+            f"Base date: {self.base_date} (column d is the number of days after it)\n"
+            f"Currency: {self.currency} (unless a row ends with another currency)\n"
+            f"Merchants (code=name):\n{merchants}\n"
+            f"Rows (row_id|d|merchant|amount[|currency]):\n{rows}\n"
+        )
+
+    def original_id(self, row_id: Any) -> Optional[str]:
+        tx = self.rows.get(str(row_id).strip())
+        return tx.id if tx is not None else None
+
+    def restore(self, subscription: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Returns a copy of a raw subscription dict with its row IDs replaced by the original
+        transaction IDs. Unknown row IDs are dropped. First and last dates are taken from the
+        matched transactions, since the model only saw day offsets.
+        """
+        if not isinstance(subscription, dict):
+            return subscription
+        members = []
+        unknown = 0
+        for row_id in dict.fromkeys(i.strip() for i in coerce_transaction_ids(subscription.get("transaction_ids"))):
+            tx = self.rows.get(row_id)
+            if tx is None:
+                unknown += 1
+                continue
+            members.append(tx)
+        if unknown:
+            logger.warning(f"Dropped {unknown} unknown row IDs from subscription '{subscription.get('name')}'.")
+
+        restored = dict(subscription, transaction_ids=[tx.id for tx in members])
+        if members:
+            dates = [tx.transaction_date for tx in members]
+            restored["first_transaction_date"] = min(dates).isoformat()
+            restored["last_transaction_date"] = max(dates).isoformat()
+        return restored
@@ -0,0 +1,204 @@
+# app/analysis/recurrence_detector.py
+import calendar
+import decimal
+import logging
+import re
+import statistics
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from app.models.schemas import TransactionInput, IdentifiedSubscription
+
+# Configure a logger for this module
+logger = logging.getLogger(__name__)
+
+# --- MERCHANT NORMALIZATION ---
+# Bank descriptors carry processor prefixes, reference numbers, domains and locations
+# around the merchant name. These rules strip the usual noise so that
+# "NETFLIX.COM 866-579-7172 CA" and "Netflix.com" land in the same group.
+_PROCESSOR_PREFIX_RE = re.compile(r"^(?:sq|tst|pp|paypal|sp|pos|ach|dd|ck)\s*\*\s*", re.IGNORECASE)
+_DOMAIN_SUFFIX_RE = re.compile(r"\.(?:com|net|org|io|co|tv|us|uk)\b", re.IGNORECASE)
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9+&\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+_NOISE_TOKENS = {
+    "pos", "purchase", "debit", "credit", "card", "recurring", "payment", "pmt", "autopay",
+    "bill", "billing", "www", "com", "inc", "llc", "ltd", "co", "corp", "subscription",
+    "online", "intl", "international", "ref", "txn", "id",
+}
+_MAX_MERCHANT_TOKENS = 3
+
+# --- CADENCES ---
+# name -> (expected interval in days, tolerance in days, intervals needed for full confidence)
+PERIODS: Dict[str, Tuple[float, float, int]] = {
+    "weekly": (7.0, 2.0, 4),
+    "bi-weekly": (14.0, 3.0, 3),
+    "monthly": (30.44, 4.0, 3),
+    "yearly": (365.25, 15.0, 1),
+}
+
+
+class RecurrenceDetectionResult(NamedTuple):
+    subscriptions: List[IdentifiedSubscription]  # Confidently detected, no model call needed
+    ambiguous_transactions: List[TransactionInput]  # Repeating but not clearly periodic; worth asking Gemini
+    unmatched_transactions: List[TransactionInput]  # One-off charges
+
+
+def normalize_merchant(description: str) -> str:
+    """
+    Reduces a raw transaction description to a stable merchant key.
+    """
+    text = _PROCESSOR_PREFIX_RE.sub("", description.strip())
+    text = _DOMAIN_SUFFIX_RE.sub(" ", text.lower())
+    text = _NON_ALNUM_RE.sub(" ", text)
+
+    tokens = []
+    for token in _WHITESPACE_RE.split(text):
+        if not token or token in _NOISE_TOKENS:
+            continue
+        # Reference numbers, phone numbers and store IDs rarely help identify the merchant.
+        if any(ch.isdigit() for ch in token):
+            continue
+        # Trailing state/country codes ("CA", "GB") follow the merchant name.
+        if tokens and len(token) <= 2:
+            continue
+        tokens.append(token)
+        if len(tokens) == _MAX_MERCHANT_TOKENS:
+            break
+
+    return " ".join(tokens) or description.strip().lower()
+
+
+def _add_months(start: date, months: int) -> date:
+    month_index = start.month - 1 + months
+    year = start.year + month_index // 12
+    month = month_index % 12 + 1
+    day = min(start.day, calendar.monthrange(year, month)[1])
+    return date(year, month, day)
+
+
+def next_billing_date(last: date, frequency: str) -> date:
+    if frequency == "monthly":
+        return _add_months(last, 1)
+    if frequency == "yearly":
+        return _add_months(last, 12)
+    return last + timedelta(days=int(PERIODS[frequency][0]))
+
+
+def _split_by_amount(transactions: List[TransactionInput], tolerance: float) -> List[List[TransactionInput]]:
+    """
+    Buckets a merchant's transactions by amount so that a fixed-price subscription is
+    not diluted by ad-hoc purchases at the same merchant (e.g. Prime vs. Amazon orders).
+    """
+    buckets: List[List[TransactionInput]] = []
+    for tx in sorted(transactions, key=lambda t: t.amount):
+        if buckets:
+            anchor = buckets[-1][0].amount
+            if anchor == 0 or abs(tx.amount - anchor) <= abs(anchor) * decimal.Decimal(str(tolerance)):
+                buckets[-1].append(tx)
+                continue
+        buckets.append([tx])
+    return buckets
+
+
+def _match_period(intervals: List[int]) -> Tuple[Optional[str], float]:
+    """
+    Returns the best matching cadence and the fraction of intervals consistent with it.
+    A single skipped cycle (double interval) still counts as consistent.
+    """
+    if not intervals:
+        return None, 0.0
+
+    median_interval = statistics.median(intervals)
+    for name, (expected, tol, _) in PERIODS.items():
+        if abs(median_interval - expected) > tol:
+            continue
+        consistent = sum(
+            1 for gap in intervals
+            if abs(gap - expected) <= tol or abs(gap - 2 * expected) <= 2 * tol
+        )
+        return name, consistent / len(intervals)
+    return None, 0.0
+
+
+def _score_bucket(bucket: List[TransactionInput], tolerance: float) -> Tuple[Optional[str], float]:
+    ordered = sorted(bucket, key=lambda t: t.transaction_date)
+    intervals = [
+        (later.transaction_date - earlier.transaction_date).days
+        for earlier, later in zip(ordered, ordered[1:])
+        if later.transaction_date != earlier.transaction_date
+    ]
+    frequency, regularity = _match_period(intervals)
+    if frequency is None:
+        return None, 0.0
+
+    full_confidence_intervals = PERIODS[frequency][2]
+    count_factor = min(1.0, len(intervals) / full_confidence_intervals)
+
+    amounts = [float(t.amount) for t in bucket]
+    median_amount = statistics.median(amounts)
+    if median_amount and tolerance:
+        max_deviation = max(abs(a - median_amount) for a in amounts) / abs(median_amount)
+        amount_score = max(0.5, 1.0 - 0.5 * (max_deviation / tolerance))
+    else:
+        amount_score = 1.0
+
+    confidence = regularity * (0.6 + 0.4 * count_factor) * amount_score
+    return frequency, round(min(1.0, confidence), 2)
+
+
+def _build_subscription(merchant_key: str, bucket: List[TransactionInput], frequency: str, confidence: float) -> IdentifiedSubscription:
+    ordered = sorted(bucket, key=lambda t: t.transaction_date)
+    total = sum((t.amount for t in ordered), decimal.Decimal("0"))
+    average = (total / len(ordered)).quantize(decimal.Decimal("0.01"), rounding=decimal.ROUND_HALF_UP)
+    return IdentifiedSubscription(
+        name=merchant_key.title(),
+        transaction_ids=[t.id for t in ordered],
+        average_amount=average,
+        currency=ordered[0].currency,
+        detected_frequency=frequency,
+        first_transaction_date=ordered[0].transaction_date,
+        last_transaction_date=ordered[-1].transaction_date,
+        confidence_score=confidence,
+        potential_next_billing_date=next_billing_date(ordered[-1].transaction_date, frequency),
+        metadata={"source": "local", "normalized_merchant": merchant_key},
+    )
+
+
+def detect_recurring_subscriptions(
+    transactions: List[TransactionInput],
+    amount_tolerance: float = 0.15,
+    min_confidence: float = 0.7
+) -> RecurrenceDetectionResult:
+    """
+    Deterministically detects recurring charges without calling any model.
+    Transactions are grouped by normalized merchant and currency, split by amount
+    within `amount_tolerance` (relative), and each group is checked for a weekly,
+    bi-weekly, monthly or yearly cadence. Groups scoring at least `min_confidence`
+    become subscriptions; other repeating groups are returned as ambiguous.
+    """
+    groups: Dict[Tuple[str, str], List[TransactionInput]] = defaultdict(list)
+    for tx in transactions:
+        groups[(normalize_merchant(tx.description), tx.currency.upper())].append(tx)
+
+    subscriptions: List[IdentifiedSubscription] = []
+    ambiguous: List[TransactionInput] = []
+    unmatched: List[TransactionInput] = []
+
+    for (merchant_key, _currency), group in groups.items():
+        for bucket in _split_by_amount(group, amount_tolerance):
+            if len(bucket) < 2:
+                unmatched.extend(bucket)
+                continue
+            frequency, confidence = _score_bucket(bucket, amount_tolerance)
+            if frequency is not None and confidence >= min_confidence:
+                subscriptions.append(_build_subscription(merchant_key, bucket, frequency, confidence))
+            else:
+                ambiguous.extend(bucket)
+
+    logger.info(
+        f"Local recurrence detection: {len(subscriptions)} subscriptions, "
+        f"{len(ambiguous)} ambiguous and {len(unmatched)} one-off transactions out of {len(transactions)}."
+    )
+    return RecurrenceDetectionResult(subscriptions, ambiguous, unmatched)
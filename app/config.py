@@ -1,15 +1,130 @@
 from pydantic_settings import BaseSettings
-import os
-from dotenv import load_dotenv
-
-load_dotenv()
+from typing import Literal, Optional
 
 class Settings(BaseSettings):
-    gemini_api_key: str = os.getenv("GEMINI_API_KEY")
+    # Read from the environment or `.env` (see Config below) when settings are loaded.
+    gemini_api_key: Optional[str] = None
     gemini_model_name: str = "gemini-1.5-flash-latest" # Or gemini-pro or other suitable model
+    # "gemini" calls the real API; "fake" is a deterministic local stand-in for offline
+    # benchmarks and CI (no network or key needed), with injectable latency and errors.
+    model_backend: Literal["gemini", "fake"] = "gemini"
+    fake_model_latency_ms: float = 200.0
+    fake_model_latency_jitter_ms: float = 0.0
+    fake_model_error_rate: float = 0.0
+    fake_model_seed: int = 0
+    # Maximum number of Gemini calls allowed in flight at once per worker process.
+    # Requests beyond this wait on the event loop instead of blocking it.
+    gemini_max_concurrency: int = 32
+    # How subscriptions are detected: "gemini" sends every transaction to the model,
+    # "local" uses only the deterministic recurrence detector, and "hybrid" runs the
+    # detector first and only sends ambiguous clusters to the model.
+    subscription_detection_mode: Literal["local", "gemini", "hybrid"] = "gemini"
+    local_detection_amount_tolerance: float = 0.15 # Relative amount drift allowed within one subscription
+    local_detection_min_confidence: float = 0.7
+    # Large histories are split into prompts of at most this many (estimated) tokens
+    # of transaction data, with up to `gemini_chunk_parallelism` chunks in flight per request.
+    gemini_chunk_max_tokens: int = 6000
+    gemini_chunk_parallelism: int = 4
+    # "compact" lists each merchant once, dates as day offsets and rows under short IDs
+    # (mapped back after parsing), which cuts prompt tokens for long histories.
+    gemini_prompt_encoding: Literal["verbose", "compact"] = "verbose"
+    # Dispatcher in front of the model for transaction analyses. Identical analyses in flight
+    # at the same time share one model call. With a window above 0, analyses that fit one
+    # prompt and arrive within `model_batch_window_ms` of each other are packed into one
+    # model call with a section per analysis (at most `model_batch_max_requests` of them,
+    # and at most `gemini_chunk_max_tokens` of transaction data).
+    model_coalesce_identical: bool = True
+    model_batch_window_ms: float = 0.0
+    model_batch_max_requests: int = 8
+    # Response cache in front of Gemini. "sqlite" shares entries across worker processes;
+    # its expired and excess entries are removed every `cache_sqlite_prune_interval_seconds`.
+    cache_backend: Literal["memory", "sqlite", "none"] = "memory"
+    cache_max_entries: int = 1024
+    cache_ttl_seconds: float = 3600.0
+    cache_sqlite_path: str = "payright_cache.sqlite3"
+    cache_sqlite_prune_interval_seconds: float = 60.0
+    # Per-user state for /analyze-transactions-incremental.
+    incremental_state_path: str = "payright_state.sqlite3"
+    incremental_max_users: int = 10000
+    incremental_state_ttl_days: int = 90 # Users not seen for this long are forgotten
+    incremental_max_pending_per_user: int = 2000
+    incremental_max_processed_ids_per_user: int = 50000
+    # Batch analysis: per-user analyses running at once per worker, shared fairly across batch requests.
+    batch_max_concurrency: int = 16
+    batch_user_timeout_seconds: float = 120.0
+    # Asynchronous analysis jobs (/jobs/...). Jobs wait in a SQLite queue shared by the worker
+    # processes, so accepted work survives restarts. Each process runs up to `job_workers`
+    # jobs at once (0 only accepts jobs). A running job whose worker stops renewing its
+    # lease for `job_lease_seconds` is queued again; model outages are retried with backoff
+    # up to `job_max_attempts`. Finished jobs and results are kept for `job_result_ttl_seconds`.
+    job_queue_path: str = "payright_jobs.sqlite3"
+    job_workers: int = 2
+    job_poll_interval_seconds: float = 1.0
+    job_lease_seconds: float = 30.0
+    job_max_attempts: int = 3
+    job_retry_base_delay_seconds: float = 5.0
+    job_result_ttl_seconds: float = 86400.0
+    job_max_queued_per_user: int = 20
+    job_submit_rate_per_user_per_minute: int = 30
+    job_max_running_per_user: int = 1
+    job_callback_timeout_seconds: float = 10.0
+    # Comma-separated callback hosts trusted as is. Any other callback_url must resolve to
+    # public addresses only (no loopback, link-local/metadata or private ranges).
+    job_callback_allowed_hosts: str = ""
+    # Limits for streaming NDJSON uploads to /ingest-transactions.
+    ingest_max_rows_per_request: int = 250000
+    ingest_max_line_bytes: int = 65536
+    # Optional compiled alternatives catalog (see app/analysis/alternatives_catalog.py).
+    # When unset or missing, the built-in catalog is used. The file is re-checked for
+    # replacement at most every `alternatives_catalog_check_seconds`.
+    alternatives_catalog_path: Optional[str] = None
+    alternatives_catalog_check_seconds: float = 5.0
+    # Ask the model for alternatives when the catalog has no match for a service.
+    alternatives_use_model_fallback: bool = False
+
+    # Bulk email receipt ingestion: several cleaned emails are packed into each model call.
+    email_ingest_max_emails: int = 5000
+    email_batch_max_items: int = 8
+    email_batch_max_chars: int = 16000
+    email_max_body_chars: int = 4000
+    email_batch_concurrency: int = 4
+
+    # Resilience around model calls. Retryable errors (timeouts, 429, 5xx) are retried with
+    # exponential backoff and full jitter; consecutive failures open the circuit breaker,
+    # which fast-fails calls until a probe succeeds after the recovery period.
+    model_retry_max_attempts: int = 3
+    model_retry_base_delay_seconds: float = 0.5
+    model_retry_max_delay_seconds: float = 8.0
+    model_call_timeout_seconds: float = 60.0
+    circuit_breaker_failure_threshold: int = 5
+    circuit_breaker_recovery_seconds: float = 30.0
+    # Send a duplicate request when a call outlives this latency percentile (e.g. 0.95); None disables hedging.
+    model_hedge_percentile: Optional[float] = None
+    model_hedge_min_samples: int = 50
+    # Use local recurrence detection when the model is unavailable instead of failing the request.
+    model_fallback_to_local: bool = True
+
+    # Observability: Prometheus metrics are always collected and served on /metrics.
+    # Tracing adds per-request spans, returned in a Server-Timing header and logged for slow requests.
+    tracing_enabled: bool = False
+    tracing_slow_request_seconds: float = 2.0
+
+    # Production run mode (`python -m app.server`): a supervisor process binds the port and
+    # runs `server_workers` worker processes (default: one per CPU core). Each worker builds
+    # and warms its services before accepting traffic. On SIGTERM a worker first reports
+    # not-ready on /ready for `server_drain_delay_seconds` while still serving, then stops
+    # accepting and gives in-flight requests up to `server_graceful_shutdown_seconds`.
+    server_host: str = "0.0.0.0"
+    server_port: int = 8000
+    server_workers: Optional[int] = None
+    server_drain_delay_seconds: float = 0.0
+    server_graceful_shutdown_seconds: float = 30.0
+    server_warmup: bool = True
 
     class Config:
         env_file = ".env"
         env_file_encoding = 'utf-8'
+        # Several settings start with "model_", which pydantic reserves by default.
+        protected_namespaces = ()
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
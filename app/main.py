@@ -1,19 +1,41 @@
-from fastapi import FastAPI, HTTPException, Body
-from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Body, Query, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+from collections import defaultdict
+import asyncio
+import decimal
+import functools
 import logging
-import decimal  # Import decimal
-from datetime import date  # Import date
+import weakref
+from datetime import date
 
 from app.models.schemas import (
     TransactionInput,
+    EmailInput,
     AnalysisResult,
+    AnalysisJob,
     IdentifiedSubscription,
+    AlternativeDetail,
     SubscriptionAlternativeRequest,
-    SubscriptionAlternativeResponse
+    SubscriptionAlternativeResponse,
+    SubscriptionAlternativeBatchRequest,
+    SubscriptionAlternativeBatchResponse
 )
 from app.services.gemini_service import GeminiService
 from app.config import settings  # Import settings for API key check
-from app.analysis.alternatives_suggester import get_gemini_alternatives
+from app.analysis.alternatives_suggester import get_gemini_alternatives, get_gemini_alternatives_batch
+from app.analysis.recurrence_detector import detect_recurring_subscriptions
+from app.analysis.incremental_matcher import TrackedSubscription, attach_to_known_subscriptions
+from app.services.incremental_state import IncrementalStateStore, StateConflict
+from app.services.batch_scheduler import FairScheduler
+from app.services.ndjson_ingest import IngestionLimitExceeded, iter_ndjson_transactions
+from app.services.email_ingest import extract_receipts
+from app.services import metrics
+from app.services.codecs import TRANSACTION_LIST, FastJSONResponse, dumps, transaction_list_body, ndjson_line, parse_transactions, validate_subscriptions
+from app.services.lifecycle import lifecycle
+from app.services.model_dispatcher import ModelCallDispatcher
+from app.services.job_queue import JobRateLimited, JobRunner, JobStore, check_callback_url
+from app.services.resilience import ModelUnavailableError
 
 # Configure basic logging
 logging.basicConfig(level=logging.INFO)
@@ -24,58 +46,316 @@ app = FastAPI(
     description="Analyzes transaction data and email content using Google Gemini to detect recurring subscriptions.",
     version="0.2.0"
 )
+app.add_middleware(
+    metrics.MetricsMiddleware,
+    tracing=settings.tracing_enabled,
+    slow_request_seconds=settings.tracing_slow_request_seconds
+)
 
 # Initialize Gemini Service (singleton-like for the app instance)
 gemini_service: Optional[GeminiService] = None
+# Coalesces identical concurrent analyses and micro-batches small ones; wraps `gemini_service`.
+model_dispatcher: Optional[ModelCallDispatcher] = None
+incremental_store: Optional[IncrementalStateStore] = None
+# Durable queue and in-process workers for /jobs.
+job_store: Optional[JobStore] = None
+job_runner: Optional[JobRunner] = None
+_CALLBACK_ALLOWED_HOSTS = frozenset(
+    host.strip().lower() for host in settings.job_callback_allowed_hosts.split(",") if host.strip()
+)
+# One lock per user so this worker's concurrent deltas for a user run one at a time;
+# deltas in other workers are caught by the state store's version check and re-applied.
+_user_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+_INCREMENTAL_SAVE_ATTEMPTS = 3
+# Shared by all batch requests on this worker so that concurrent batches are interleaved fairly.
+batch_scheduler = FairScheduler(
+    max_concurrency=settings.batch_max_concurrency,
+    job_timeout=settings.batch_user_timeout_seconds
+)
+
+_CACHE_REQUESTS = metrics.registry.counter("payright_cache_requests_total", "Response cache lookups.", ["result"])
+_CACHE_EVICTIONS = metrics.registry.counter("payright_cache_evictions_total", "Response cache evictions.")
+_CACHE_HIT_RATIO = metrics.registry.gauge("payright_cache_hit_ratio", "Response cache hits / lookups since startup.")
+_BATCH_JOBS = metrics.registry.gauge("payright_batch_jobs", "Per-user batch analyses on this worker.", ["state"])
+_CIRCUIT_OPEN = metrics.registry.gauge("payright_model_circuit_open", "1 while the model circuit breaker is open or half-open.")
+_LOCAL_FALLBACKS = metrics.registry.counter("payright_model_local_fallbacks_total", "Analyses answered by local detection because the model was unavailable.")
+_JOBS = metrics.registry.gauge("payright_jobs", "Analysis jobs in the shared job queue.", ["state"])
+
+def _collect_service_metrics():
+    _BATCH_JOBS.set(batch_scheduler.running, state="running")
+    _BATCH_JOBS.set(batch_scheduler.queued, state="queued")
+    if job_store is not None:
+        for state, count in job_store.counts().items():
+            _JOBS.set(count, state=state)
+    if gemini_service is None:
+        return
+    _CIRCUIT_OPEN.set(0 if gemini_service.resilience.breaker.state == "closed" else 1)
+    if gemini_service.cache is None:
+        return
+    stats = gemini_service.cache.stats.as_dict()
+    _CACHE_REQUESTS.set(stats["hits"], result="hit")
+    _CACHE_REQUESTS.set(stats["misses"], result="miss")
+    _CACHE_EVICTIONS.set(stats["evictions"])
+    _CACHE_HIT_RATIO.set(stats["hit_rate"])
+
+metrics.registry.add_collector(_collect_service_metrics)
+
+def _warm_up():
+    """
+    Runs the request hot paths once on a tiny synthetic history (validation, local
+    detection, prompt building, alternatives lookup, serialization), so the first real
+    request does not pay for lazily built validators, regexes and indexes.
+    """
+    sample = [
+        TransactionInput(
+            id=f"warmup_{month}",
+            userId="warmup",
+            transaction_date=date(2024, month, 5),
+            description="NETFLIX.COM",
+            amount=decimal.Decimal("15.49"),
+            currency="USD"
+        )
+        for month in range(1, 4)
+    ]
+    sample = TRANSACTION_LIST.validate_json(dumps(sample))
+    subscriptions = detect_recurring_subscriptions(sample).subscriptions
+    get_gemini_alternatives_batch([sub.name for sub in subscriptions])
+    if gemini_service is not None:
+        gemini_service.warm_up(sample)
+    dumps(AnalysisResult(user_id="warmup", processed_transaction_ids=[t.id for t in sample], identified_subscriptions=subscriptions))
 
 @app.on_event("startup")
 async def startup_event():
-    global gemini_service
+    global gemini_service, model_dispatcher, incremental_store, job_store, job_runner
     logger.info("PayRight AI Service (Gemini Enhanced) starting up...")
-    if not settings.gemini_api_key or settings.gemini_api_key == "YOUR_GEMINI_API_KEY_HERE":
+    lifecycle.mark("imported")
+    try:
+        incremental_store = IncrementalStateStore(
+            settings.incremental_state_path,
+            max_users=settings.incremental_max_users,
+            ttl_seconds=settings.incremental_state_ttl_days * 24 * 3600,
+            max_pending_per_user=settings.incremental_max_pending_per_user,
+            max_processed_ids_per_user=settings.incremental_max_processed_ids_per_user
+        )
+    except Exception as e:
+        logger.error(f"Failed to open incremental state store at '{settings.incremental_state_path}': {e}")
+        incremental_store = None
+    if settings.model_backend == "gemini" and (not settings.gemini_api_key or settings.gemini_api_key == "YOUR_GEMINI_API_KEY_HERE"):
         logger.error("GEMINI_API_KEY is not configured. Service will not function correctly.")
         gemini_service = None  # Explicitly set to None
     else:
         try:
             gemini_service = GeminiService()
+            model_dispatcher = ModelCallDispatcher(
+                gemini_service,
+                window_ms=settings.model_batch_window_ms,
+                max_batch_size=settings.model_batch_max_requests,
+                coalesce=settings.model_coalesce_identical
+            )
             logger.info("Gemini Service initialized.")
         except Exception as e:
             logger.error(f"Failed to initialize Gemini Service during startup: {e}")
             gemini_service = None  # Ensure it's None if init fails
+    try:
+        job_store = JobStore(
+            settings.job_queue_path,
+            lease_seconds=settings.job_lease_seconds,
+            max_attempts=settings.job_max_attempts,
+            result_ttl_seconds=settings.job_result_ttl_seconds,
+            max_queued_per_user=settings.job_max_queued_per_user,
+            submit_rate_per_minute=settings.job_submit_rate_per_user_per_minute,
+            max_running_per_user=settings.job_max_running_per_user
+        )
+        job_runner = JobRunner(
+            job_store,
+            _run_analysis_job,
+            concurrency=settings.job_workers,
+            poll_interval=settings.job_poll_interval_seconds,
+            retry_base_delay=settings.job_retry_base_delay_seconds,
+            callback_timeout=settings.job_callback_timeout_seconds,
+            callback_allowed_hosts=_CALLBACK_ALLOWED_HOSTS
+        )
+    except Exception as e:
+        logger.error(f"Failed to open job queue at '{settings.job_queue_path}': {e}")
+        job_store, job_runner = None, None
+    lifecycle.mark("services")
+
+    if settings.server_warmup:
+        try:
+            _warm_up()
+            lifecycle.mark("warmed_up")
+        except Exception as e:
+            # A failed warm-up only costs latency on the first requests.
+            logger.error(f"Warm-up failed: {e}", exc_info=True)
+    if job_runner is not None:
+        job_runner.start()
+    lifecycle.mark_ready()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Runs after the server stopped accepting connections and in-flight requests finished."""
+    lifecycle.begin_drain()
+    if job_runner is not None:
+        # Jobs still running go back to the queue for the next worker.
+        await job_runner.stop(timeout=settings.server_graceful_shutdown_seconds)
+    if job_store is not None:
+        job_store.close()
+    if incremental_store is not None:
+        incremental_store.close()
+    if gemini_service is not None and gemini_service.cache is not None:
+        gemini_service.cache.close()
+    logger.info("PayRight AI Service (Gemini Enhanced) shut down.")
 
 @app.get("/", tags=["General"])
 async def root():
     """Root endpoint providing service status."""
     status = "running"
-    if gemini_service is None and (not settings.gemini_api_key or settings.gemini_api_key == "YOUR_GEMINI_API_KEY_HERE"):
+    upstream = gemini_service.resilience.describe() if gemini_service is not None else None
+    if gemini_service is None and settings.model_backend == "gemini" and (not settings.gemini_api_key or settings.gemini_api_key == "YOUR_GEMINI_API_KEY_HERE"):
         status = "degraded - GEMINI_API_KEY not configured"
     elif gemini_service is None:
         status = "degraded - Gemini Service initialization failed"
+    elif upstream["circuit"]["state"] != "closed":
+        fallback = "using local detection" if settings.model_fallback_to_local else "failing fast"
+        status = f"degraded - model upstream unhealthy (circuit {upstream['circuit']['state']}, {fallback})"
+
+    return {"message": f"PayRight AI Service (Gemini Enhanced) is {status}.", "model_upstream": upstream}
+
+@app.get("/ready", tags=["General"])
+async def ready():
+    """Readiness probe: 200 once this worker has warmed up, 503 while starting or draining."""
+    body = lifecycle.describe()
+    if not lifecycle.is_ready:
+        return FastJSONResponse(body, status_code=503)
+    return body
 
-    return {"message": f"PayRight AI Service (Gemini Enhanced) is {status}."}
+@app.get("/cache/stats", tags=["General"])
+async def cache_stats():
+    """Hit/miss/eviction counters of the Gemini response cache."""
+    if gemini_service is None or gemini_service.cache is None:
+        return {"enabled": False}
+    # Counting SQLite entries can wait on other workers' writes.
+    return dict(await asyncio.to_thread(gemini_service.cache.describe), enabled=True)
+
+@app.get("/dispatch/stats", tags=["General"])
+async def dispatch_stats():
+    """How transaction analyses reached the model: direct, batched, coalesced, cached or streamed."""
+    if model_dispatcher is None:
+        return {"enabled": False}
+    return dict(model_dispatcher.describe(), enabled=True)
+
+@app.get("/metrics", tags=["General"], response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """This worker's metrics in the Prometheus text exposition format."""
+    # In a thread: collectors read the job queue and cache databases.
+    return PlainTextResponse(await asyncio.to_thread(metrics.registry.render), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def _validate_gemini_subscriptions(gemini_identified_subs_raw: List[dict]) -> List[IdentifiedSubscription]:
+    """Coerces Gemini's raw subscription dicts into validated models, dropping invalid entries."""
+    with metrics.stage("validation"):
+        validated_subscriptions, rejected = validate_subscriptions(gemini_identified_subs_raw)
+    for sub_data, error in rejected:
+        logger.error(f"Failed to validate subscription data from Gemini: {sub_data}. Error: {error}")
+        metrics.VALIDATION_FAILURES.inc(model="IdentifiedSubscription")
+    return validated_subscriptions
+
+def _model_unavailable(error: ModelUnavailableError) -> HTTPException:
+    """503 with a Retry-After hint, so clients can tell an outage from "no subscriptions"."""
+    logger.error(f"Model unavailable and local fallback disabled: {error}")
+    retry_in = gemini_service.resilience.breaker.describe()["retry_in_seconds"] if gemini_service is not None else None
+    return HTTPException(
+        status_code=503,
+        detail=f"Model is temporarily unavailable: {error}",
+        headers={"Retry-After": str(int(retry_in or settings.circuit_breaker_recovery_seconds))}
+    )
+
+async def _identify_subscriptions(
+    transactions: List[TransactionInput],
+    use_cache: bool = True,
+    on_subscription: Optional[Callable[[IdentifiedSubscription], None]] = None
+) -> List[IdentifiedSubscription]:
+    """
+    Runs the configured detection mode (local, gemini or hybrid) over one user's transactions.
+    `on_subscription` is called with each subscription as soon as it is found and validated.
+    """
+    mode = settings.subscription_detection_mode
+    validated_subscriptions: List[IdentifiedSubscription] = []
+    transactions_for_gemini = transactions
+
+    if mode in ("local", "hybrid"):
+        with metrics.stage("local_detection"):
+            detection = detect_recurring_subscriptions(
+                transactions,
+                amount_tolerance=settings.local_detection_amount_tolerance,
+                min_confidence=settings.local_detection_min_confidence
+            )
+        validated_subscriptions.extend(detection.subscriptions)
+        if on_subscription is not None:
+            for sub in detection.subscriptions:
+                on_subscription(sub)
+        # In hybrid mode only the clusters the detector could not settle are worth a model call.
+        transactions_for_gemini = detection.ambiguous_transactions if mode == "hybrid" else []
+
+    if transactions_for_gemini:
+        on_raw_subscription = None
+        if on_subscription is not None:
+            def on_raw_subscription(raw: Dict[str, Any]):
+                for sub in _validate_gemini_subscriptions([raw]):
+                    on_subscription(sub)
+
+        try:
+            gemini_identified_subs_raw = await model_dispatcher.analyze(
+                transactions_for_gemini,
+                use_cache=use_cache,
+                on_subscription=on_raw_subscription
+            )
+        except ModelUnavailableError as e:
+            if not settings.model_fallback_to_local:
+                raise
+            logger.warning(f"Model unavailable, falling back to local detection for {len(transactions_for_gemini)} transactions: {e}")
+            _LOCAL_FALLBACKS.inc()
+            if mode == "gemini":
+                # In hybrid mode the confident local results are already in; the ambiguous rest stays unresolved.
+                with metrics.stage("local_detection"):
+                    fallback = detect_recurring_subscriptions(
+                        transactions_for_gemini,
+                        amount_tolerance=settings.local_detection_amount_tolerance,
+                        min_confidence=settings.local_detection_min_confidence
+                    ).subscriptions
+                validated_subscriptions.extend(fallback)
+                if on_subscription is not None:
+                    for sub in fallback:
+                        on_subscription(sub)
+            return validated_subscriptions
+        validated_subscriptions.extend(_validate_gemini_subscriptions(gemini_identified_subs_raw))
+
+    return validated_subscriptions
 
 @app.post("/analyze-transactions-gemini",
           response_model=AnalysisResult,
           tags=["Subscription Analysis"],
-          summary="Analyze a list of transactions using Gemini to detect subscriptions")
+          summary="Analyze a list of transactions using Gemini to detect subscriptions",
+          openapi_extra=transaction_list_body(example=[
+              # Example transactions
+              {
+                  "id": "txn_001",
+                  "userId": "user123",
+                  "transaction_date": "2023-01-15",
+                  "description": "NETFLIX.COM",
+                  "amount": 15.99,
+                  "currency": "USD",
+                  "source": "Bank A"
+              }
+          ]))
 async def analyze_transactions_gemini_endpoint(
-    transactions: List[TransactionInput] = Body(
-        ...,
-        example=[
-            # Example transactions
-            {
-                "id": "txn_001",
-                "userId": "user123",
-                "transaction_date": "2023-01-15",
-                "description": "NETFLIX.COM",
-                "amount": 15.99,
-                "currency": "USD",
-                "source": "Bank A"
-            }
-        ]
-    )
+    request: Request,
+    use_cache: bool = Query(True, description="Set to false to bypass cached Gemini results and force a fresh analysis."),
+    stream: bool = Query(False, description="Stream NDJSON: one line per subscription as soon as it is parsed, then the final result.")
 ):
-    if gemini_service is None:
+    # The body is a JSON list of TransactionInput, validated in one pass from the raw bytes.
+    transactions = parse_transactions(await request.body())
+    mode = settings.subscription_detection_mode
+    if gemini_service is None and mode != "local":
         logger.error("Gemini service not available for /analyze-transactions-gemini")
         raise HTTPException(status_code=503, detail="Gemini service is not available. Check API key or initialization.")
 
@@ -83,40 +363,377 @@ async def analyze_transactions_gemini_endpoint(
         logger.warning("Received empty transaction list for Gemini analysis.")
         raise HTTPException(status_code=400, detail="No transactions provided for analysis.")
 
-    logger.info(f"Received {len(transactions)} transactions for Gemini analysis. UserID: {transactions[0].userId if transactions else 'N/A'}")
-
-    try:
-        gemini_identified_subs_raw = gemini_service.analyze_transactions_for_subscriptions(transactions)
-
-        validated_subscriptions = []
-        for sub_data in gemini_identified_subs_raw:
-            try:
-                if 'average_amount' in sub_data and isinstance(sub_data['average_amount'], (float, int)):
-                    sub_data['average_amount'] = decimal.Decimal(str(sub_data['average_amount']))
+    logger.info(f"Received {len(transactions)} transactions for Gemini analysis ({mode} mode). UserID: {transactions[0].userId if transactions else 'N/A'}")
+    if any(t.userId != transactions[0].userId for t in transactions):
+        logger.warning("Transactions for several users were sent to /analyze-transactions-gemini; use /analyze-transactions-batch to analyze them per user.")
 
-                for date_field in ['first_transaction_date', 'last_transaction_date', 'potential_next_billing_date']:
-                    if date_field in sub_data and isinstance(sub_data[date_field], str):
-                        sub_data[date_field] = date.fromisoformat(sub_data[date_field])
-                    elif date_field in sub_data and sub_data[date_field] is None:
-                        pass
+    if stream:
+        return StreamingResponse(_stream_subscriptions(transactions, use_cache), media_type="application/x-ndjson")
 
-                validated_subscriptions.append(IdentifiedSubscription(**sub_data))
-            except Exception as pydantic_exc:
-                logger.error(f"Failed to validate subscription data from Gemini: {sub_data}. Error: {pydantic_exc}")
+    try:
+        validated_subscriptions = await _identify_subscriptions(transactions, use_cache)
 
-        logger.info(f"Gemini identified and validated {len(validated_subscriptions)} potential subscriptions.")
+        logger.info(f"Identified and validated {len(validated_subscriptions)} potential subscriptions.")
 
         user_id_from_data = transactions[0].userId if transactions else None
 
-        return AnalysisResult(
+        return FastJSONResponse(AnalysisResult(
             user_id=user_id_from_data,
             processed_transaction_ids=[t.id for t in transactions],
             identified_subscriptions=validated_subscriptions
-        )
+        ))
+    except ModelUnavailableError as e:
+        raise _model_unavailable(e)
     except Exception as e:
         logger.error(f"Error during Gemini transaction analysis endpoint: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Internal server error during Gemini analysis: {str(e)}")
 
+async def _stream_subscriptions(transactions: List[TransactionInput], use_cache: bool) -> AsyncIterator[bytes]:
+    """
+    Lines are `{"type": "subscription", "subscription": ...}` while parsing, then one
+    `{"type": "result", "result": AnalysisResult}` or `{"type": "error", "detail": ...}`.
+    Streamed subscriptions come from individual prompt chunks; for histories split into
+    several chunks, the final result holds the merged (deduplicated) list.
+    """
+    found: asyncio.Queue = asyncio.Queue()
+    task = asyncio.create_task(_identify_subscriptions(transactions, use_cache, on_subscription=found.put_nowait))
+    task.add_done_callback(lambda _: found.put_nowait(None))
+    try:
+        while True:
+            sub = await found.get()
+            if sub is None:
+                break
+            yield ndjson_line({"type": "subscription", "subscription": sub})
+        result = AnalysisResult(
+            user_id=transactions[0].userId,
+            processed_transaction_ids=[t.id for t in transactions],
+            identified_subscriptions=task.result()
+        )
+        yield ndjson_line({"type": "result", "result": result})
+    except Exception as e:
+        logger.error(f"Error during streamed Gemini transaction analysis: {e}", exc_info=True)
+        yield ndjson_line({"type": "error", "detail": f"Internal server error during Gemini analysis: {str(e)}"})
+    finally:
+        task.cancel()
+
+@app.post("/analyze-transactions-incremental",
+          response_model=AnalysisResult,
+          tags=["Subscription Analysis"],
+          summary="Analyze only the transactions added since the previous run for a user")
+async def analyze_transactions_incremental_endpoint(
+    transactions: List[TransactionInput] = Body(...),
+    use_cache: bool = Query(True, description="Set to false to bypass cached Gemini results and force a fresh analysis.")
+):
+    """
+    Accepts only new transactions (a delta) for a single user. Transactions that fit a
+    previously identified subscription's merchant, amount and cadence are attached
+    locally; only the unexplained ones go through subscription detection.
+    The response lists every subscription known for the user after this delta.
+    """
+    if incremental_store is None:
+        raise HTTPException(status_code=503, detail="Incremental state store is not available.")
+    if gemini_service is None and settings.subscription_detection_mode != "local":
+        logger.error("Gemini service not available for /analyze-transactions-incremental")
+        raise HTTPException(status_code=503, detail="Gemini service is not available. Check API key or initialization.")
+    if not transactions:
+        raise HTTPException(status_code=400, detail="No transactions provided for analysis.")
+
+    user_ids = {t.userId for t in transactions}
+    if len(user_ids) != 1:
+        raise HTTPException(status_code=400, detail="Incremental analysis accepts transactions for exactly one user per request.")
+    user_id = user_ids.pop()
+
+    lock = _user_locks.get(user_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _user_locks[user_id] = lock
+
+    try:
+        # The lock serializes this worker's deltas for the user; the store's version check
+        # catches a delta for the same user saved by another worker meanwhile, and the
+        # delta is then re-applied on top of that worker's state.
+        async with lock:
+            for attempt in range(1, _INCREMENTAL_SAVE_ATTEMPTS + 1):
+                # In threads: the state file is shared by the workers and may be locked for a while.
+                state = await asyncio.to_thread(incremental_store.load, user_id)
+                fresh = await asyncio.to_thread(incremental_store.unprocessed, user_id, transactions)
+                _, unexplained = attach_to_known_subscriptions(
+                    state.tracked_subscriptions,
+                    fresh,
+                    amount_tolerance=settings.local_detection_amount_tolerance
+                )
+
+                if unexplained:
+                    candidates = state.pending_transactions + unexplained
+                    candidates_by_id = {tx.id: tx for tx in candidates}
+                    claimed = set()
+                    for sub in await _identify_subscriptions(candidates, use_cache):
+                        members = [candidates_by_id[i] for i in sub.transaction_ids if i in candidates_by_id and i not in claimed]
+                        if not members:
+                            continue
+                        claimed.update(tx.id for tx in members)
+                        state.tracked_subscriptions.append(TrackedSubscription.from_transactions(sub, members))
+                    state.pending_transactions = [tx for tx in candidates if tx.id not in claimed]
+
+                try:
+                    await asyncio.to_thread(incremental_store.save, state, [tx.id for tx in fresh])
+                    break
+                except StateConflict:
+                    if attempt == _INCREMENTAL_SAVE_ATTEMPTS:
+                        raise HTTPException(status_code=409, detail=f"Incremental state of user '{user_id}' kept changing concurrently; retry the request.")
+                    logger.info(f"Incremental state of user {user_id} changed concurrently; re-applying delta (attempt {attempt + 1}).")
+
+        logger.info(f"Incremental analysis for user {user_id}: {len(fresh)} new of {len(transactions)} received, {len(unexplained)} unexplained.")
+        return FastJSONResponse(AnalysisResult(
+            user_id=user_id,
+            processed_transaction_ids=[tx.id for tx in fresh],
+            identified_subscriptions=[t.subscription for t in state.tracked_subscriptions]
+        ))
+    except HTTPException:
+        raise
+    except ModelUnavailableError as e:
+        raise _model_unavailable(e)
+    except Exception as e:
+        logger.error(f"Error during incremental transaction analysis for user {user_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Internal server error during incremental analysis: {str(e)}")
+
+async def _analyze_user(user_id: str, transactions: List[TransactionInput], use_cache: bool = True) -> AnalysisResult:
+    return AnalysisResult(
+        user_id=user_id,
+        processed_transaction_ids=[t.id for t in transactions],
+        identified_subscriptions=await _identify_subscriptions(transactions, use_cache)
+    )
+
+async def _stream_batch_results(
+    partitions: Dict[str, List[TransactionInput]],
+    use_cache: bool,
+    header: Optional[Dict[str, Any]] = None
+) -> AsyncIterator[bytes]:
+    if header is not None:
+        yield ndjson_line(header)
+    # Partitions are handed to the scheduler one by one and dropped here, so each
+    # user's transactions can be freed as soon as that user's analysis finishes.
+    jobs = [
+        (user_id, functools.partial(_analyze_user, user_id, partitions.pop(user_id), use_cache))
+        for user_id in list(partitions)
+    ]
+    completed = 0
+    async for item in batch_scheduler.run(jobs):
+        line = {"user_id": item["key"], "status": item["status"]}
+        if item["status"] == "ok":
+            line["result"] = item["result"]
+        else:
+            line["detail"] = item["detail"]
+        completed += 1
+        yield ndjson_line(line)
+    logger.info(f"Batch analysis streamed results for {completed} users.")
+
+@app.post("/analyze-transactions-batch",
+          tags=["Subscription Analysis"],
+          summary="Analyze transactions for many users, streaming one NDJSON line per user",
+          openapi_extra=transaction_list_body())
+async def analyze_transactions_batch_endpoint(
+    request: Request,
+    use_cache: bool = Query(True, description="Set to false to bypass cached Gemini results and force a fresh analysis.")
+):
+    """
+    Partitions the payload by `userId` and analyzes each user separately under the
+    worker's batch concurrency cap, with a per-user timeout. Each line of the
+    `application/x-ndjson` response is `{"user_id", "status", "result" | "detail"}`
+    and is sent as soon as that user completes, so lines arrive out of input order.
+    """
+    transactions = parse_transactions(await request.body())
+    if gemini_service is None and settings.subscription_detection_mode != "local":
+        logger.error("Gemini service not available for /analyze-transactions-batch")
+        raise HTTPException(status_code=503, detail="Gemini service is not available. Check API key or initialization.")
+    if not transactions:
+        raise HTTPException(status_code=400, detail="No transactions provided for analysis.")
+
+    partitions: Dict[str, List[TransactionInput]] = defaultdict(list)
+    for tx in transactions:
+        partitions[tx.userId].append(tx)
+    logger.info(f"Received batch of {len(transactions)} transactions for {len(partitions)} users.")
+
+    return StreamingResponse(_stream_batch_results(partitions, use_cache), media_type="application/x-ndjson")
+
+async def _run_analysis_job(job: Dict[str, Any], payload: bytes) -> bytes:
+    """Job handler: the same analysis as /analyze-transactions-gemini, serialized for the job store."""
+    if gemini_service is None and settings.subscription_detection_mode != "local":
+        raise RuntimeError("Gemini service is not available. Check API key or initialization.")
+    transactions = TRANSACTION_LIST.validate_json(payload)
+    result = AnalysisResult(
+        user_id=job["user_id"],
+        processed_transaction_ids=[t.id for t in transactions],
+        identified_subscriptions=await _identify_subscriptions(transactions, job["use_cache"])
+    )
+    return dumps(result)
+
+def _job_store_or_503() -> JobStore:
+    if job_store is None:
+        raise HTTPException(status_code=503, detail="The job queue is not available.")
+    return job_store
+
+@app.post("/jobs/analyze-transactions",
+          response_model=AnalysisJob,
+          status_code=202,
+          tags=["Analysis Jobs"],
+          summary="Queue an analysis of a transaction list and return a job ID immediately",
+          openapi_extra=transaction_list_body())
+async def submit_analysis_job_endpoint(
+    request: Request,
+    use_cache: bool = Query(True, description="Set to false to bypass cached Gemini results and force a fresh analysis."),
+    priority: int = Query(0, ge=0, le=9, description="Jobs with a higher priority are started first."),
+    callback_url: Optional[str] = Query(None, description="http(s) URL that receives the finished job (as returned by GET /jobs/{job_id}) by POST. Its host must resolve to public addresses.")
+):
+    """
+    Same input and analysis as /analyze-transactions-gemini, for histories that may take
+    longer than a client can wait. Poll `GET /jobs/{job_id}` or pass `callback_url`.
+    Answers 429 with `Retry-After` when the user has too many jobs queued or submitted.
+    """
+    store = _job_store_or_503()
+    body = await request.body()
+    transactions = parse_transactions(body)
+    if gemini_service is None and settings.subscription_detection_mode != "local":
+        raise HTTPException(status_code=503, detail="Gemini service is not available. Check API key or initialization.")
+    if not transactions:
+        raise HTTPException(status_code=400, detail="No transactions provided for analysis.")
+    if callback_url is not None:
+        try:
+            # In a thread: checking the address resolves the host name.
+            await asyncio.to_thread(check_callback_url, callback_url, _CALLBACK_ALLOWED_HOSTS)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        # In a thread: the insert waits for the disk, so an accepted job survives a crash.
+        job = await asyncio.to_thread(
+            store.submit,
+            transactions[0].userId,
+            body,
+            len(transactions),
+            priority=priority,
+            use_cache=use_cache,
+            callback_url=callback_url
+        )
+    except JobRateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(int(e.retry_after + 0.999))})
+    job_runner.notify()
+    logger.info(f"Queued job {job['job_id']} with {len(transactions)} transactions for user {job['user_id']} (priority {priority}).")
+    return FastJSONResponse(job, status_code=202, headers={"Location": f"/jobs/{job['job_id']}"})
+
+@app.get("/jobs/{job_id}", response_model=AnalysisJob, tags=["Analysis Jobs"])
+async def get_analysis_job_endpoint(job_id: str):
+    """State of a job, with its `result` once it has succeeded. 404 for unknown or expired jobs."""
+    job = await asyncio.to_thread(_job_store_or_503().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found or expired.")
+    return FastJSONResponse(job)
+
+@app.delete("/jobs/{job_id}", response_model=AnalysisJob, tags=["Analysis Jobs"])
+async def cancel_analysis_job_endpoint(job_id: str):
+    """Cancels a queued or running job; finished jobs are returned unchanged."""
+    job = await asyncio.to_thread(_job_store_or_503().cancel, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found or expired.")
+    if job["cancel_requested"] and job_runner is not None:
+        job_runner.cancel_local(job_id)
+    return FastJSONResponse(job)
+
+@app.post("/ingest-transactions",
+          tags=["Subscription Analysis"],
+          summary="Stream an NDJSON transaction upload and analyze it per user")
+async def ingest_transactions_endpoint(
+    request: Request,
+    use_cache: bool = Query(True, description="Set to false to bypass cached Gemini results and force a fresh analysis.")
+):
+    """
+    Accepts an `application/x-ndjson` body (optionally sent chunked), one
+    `TransactionInput` object per line. Rows are parsed and validated as the body
+    arrives instead of materializing a JSON array first. Invalid rows are skipped
+    and reported in the first response line; the remaining lines are the per-user
+    results, in the same format as `/analyze-transactions-batch`.
+    """
+    if gemini_service is None and settings.subscription_detection_mode != "local":
+        logger.error("Gemini service not available for /ingest-transactions")
+        raise HTTPException(status_code=503, detail="Gemini service is not available. Check API key or initialization.")
+
+    partitions: Dict[str, List[TransactionInput]] = defaultdict(list)
+    rejected_rows: List[Dict[str, Any]] = []
+    accepted = 0
+    try:
+        async for tx in iter_ndjson_transactions(
+            request.stream(),
+            max_line_bytes=settings.ingest_max_line_bytes,
+            max_rows=settings.ingest_max_rows_per_request,
+            errors=rejected_rows
+        ):
+            partitions[tx.userId].append(tx)
+            accepted += 1
+    except IngestionLimitExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    if not partitions:
+        raise HTTPException(status_code=400, detail={"message": "No valid transactions in upload.", "errors": rejected_rows})
+
+    header = {"status": "ingested", "transactions": accepted, "users": len(partitions), "rejected_rows": rejected_rows}
+    return StreamingResponse(_stream_batch_results(partitions, use_cache, header=header), media_type="application/x-ndjson")
+
+@app.post("/ingest-emails",
+          tags=["Subscription Analysis"],
+          summary="Extract receipts from a batch of emails and analyze them per user")
+async def ingest_emails_endpoint(
+    emails: List[EmailInput] = Body(...),
+    use_cache: bool = Query(True, description="Set to false to bypass cached Gemini results and force a fresh analysis.")
+):
+    """
+    Accepts emails from one or many inboxes. Non-receipts are filtered out locally,
+    bodies are stripped of HTML and boilerplate, identical receipts are deduplicated,
+    and the rest are sent to the model several per call. Each extracted receipt becomes
+    a transaction (`id` = "email:<email id>", `source` = "email") for subscription detection.
+
+    The `application/x-ndjson` response starts with an extraction summary line that
+    includes the receipts; the remaining lines are per-user results in the same format
+    as `/analyze-transactions-batch`.
+    """
+    if gemini_service is None:
+        logger.error("Gemini service not available for /ingest-emails")
+        raise HTTPException(status_code=503, detail="Gemini service is not available. Check API key or initialization.")
+    if not emails:
+        raise HTTPException(status_code=400, detail="No emails provided.")
+    if len(emails) > settings.email_ingest_max_emails:
+        raise HTTPException(status_code=413, detail=f"At most {settings.email_ingest_max_emails} emails are accepted per request.")
+
+    extraction = await extract_receipts(
+        gemini_service,
+        emails,
+        batch_max_items=settings.email_batch_max_items,
+        batch_max_chars=settings.email_batch_max_chars,
+        max_body_chars=settings.email_max_body_chars,
+        concurrency=settings.email_batch_concurrency,
+        use_cache=use_cache
+    )
+    partitions: Dict[str, List[TransactionInput]] = defaultdict(list)
+    for tx in extraction.transactions:
+        partitions[tx.userId].append(tx)
+
+    header = dict(
+        extraction.stats,
+        status="extracted",
+        users=len(partitions),
+        receipts=extraction.receipts
+    )
+    return StreamingResponse(_stream_batch_results(partitions, use_cache, header=header), media_type="application/x-ndjson")
+
+def _validate_model_alternatives(raw_alternatives: List[dict]) -> List[AlternativeDetail]:
+    validated = []
+    for alt in raw_alternatives:
+        try:
+            validated.append(AlternativeDetail(**alt))
+        except Exception as pydantic_exc:
+            logger.error(f"Failed to validate alternative from Gemini: {alt}. Error: {pydantic_exc}")
+            metrics.VALIDATION_FAILURES.inc(model="AlternativeDetail")
+    return validated
+
 @app.post("/suggest-alternatives-gemini", response_model=SubscriptionAlternativeResponse)
 async def suggest_alternatives_gemini_endpoint(request: SubscriptionAlternativeRequest):
     """
@@ -127,7 +744,10 @@ async def suggest_alternatives_gemini_endpoint(request: SubscriptionAlternativeR
         raise HTTPException(status_code=400, detail="Service name must be provided.")
 
     try:
-        alternatives = get_gemini_alternatives(service_name)
+        with metrics.stage("alternatives_lookup"):
+            alternatives = get_gemini_alternatives(service_name)
+        if not alternatives and settings.alternatives_use_model_fallback and gemini_service is not None:
+            alternatives = _validate_model_alternatives(await gemini_service.suggest_alternatives(service_name))
         message = f"Found {len(alternatives)} alternatives for '{service_name}'."
         return SubscriptionAlternativeResponse(
             requested_service=service_name,
@@ -136,4 +756,24 @@ async def suggest_alternatives_gemini_endpoint(request: SubscriptionAlternativeR
         )
     except Exception as e:
         logger.error(f"Error suggesting alternatives for {service_name}: {e}")
+        raise HTTPException(status_code=500, detail=f"Internal server error while suggesting alternatives: {str(e)}")
+
+@app.post("/suggest-alternatives-batch", response_model=SubscriptionAlternativeBatchResponse)
+async def suggest_alternatives_batch_endpoint(request: SubscriptionAlternativeBatchRequest):
+    """
+    Suggests alternatives for many subscription service names in one call.
+    """
+    try:
+        with metrics.stage("alternatives_lookup"):
+            found = get_gemini_alternatives_batch(request.service_names)
+        return SubscriptionAlternativeBatchResponse(results=[
+            SubscriptionAlternativeResponse(
+                requested_service=name,
+                alternatives=found[name],
+                message=f"Found {len(found[name])} alternatives for '{name}'."
+            )
+            for name in request.service_names
+        ])
+    except Exception as e:
+        logger.error(f"Error suggesting alternatives for batch of {len(request.service_names)} services: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error while suggesting alternatives: {str(e)}")
\ No newline at end of file
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
-from datetime import date
+from datetime import date, datetime
 import decimal
 
 # Ensure __init__.py files are present in app, app/models, app/analysis folders.
@@ -51,12 +51,60 @@ class AnalysisResult(BaseModel):
     model_config = {
         "from_attributes": True
     }
+class AnalysisJob(BaseModel):
+    job_id: str
+    user_id: str
+    state: str = Field(..., description="'queued', 'running', 'succeeded', 'failed' or 'cancelled'")
+    priority: int = Field(..., description="Higher priorities are started first")
+    transaction_count: int
+    attempts: int = Field(..., description="Attempts started so far; model outages are retried")
+    created_at: datetime
+    queued_at: datetime = Field(..., description="When the job was last put in the queue (submitted or retried)")
+    started_at: Optional[datetime] = Field(None, description="Start of the latest attempt")
+    finished_at: Optional[datetime] = None
+    expires_at: Optional[datetime] = Field(None, description="When the finished job and its result are deleted")
+    callback_url: Optional[str] = None
+    callback_state: Optional[str] = Field(None, description="Delivery of the completion callback, once attempted")
+    cancel_requested: bool = False
+    error: Optional[str] = None
+    result: Optional[AnalysisResult] = Field(None, description="Set once the job has succeeded")
+
+class EmailInput(BaseModel):
+    id: str = Field(..., description="Unique identifier for the email")
+    userId: str = Field(..., description="Identifier for the user whose inbox the email is from")
+    subject: Optional[str] = Field(None, description="Email subject line")
+    body: str = Field(..., description="Email body, plain text or HTML")
+    content_type: str = Field("text/plain", description="'text/plain' or 'text/html'")
+    received_date: Optional[date] = Field(None, description="Used as the transaction date when the receipt shows none")
+
+class ExtractedReceipt(BaseModel):
+    email_id: str = Field(..., description="ID of the email the receipt was extracted from")
+    user_id: str
+    merchant_name: str
+    transaction_amount: decimal.Decimal
+    currency: str
+    transaction_date: date
+    is_recurring: bool = False
+    recurrence_details: Optional[str] = None
+    duplicate_email_ids: List[str] = Field(default_factory=list, description="Other emails with identical content, not sent to the model")
+
+    model_config = {
+        "json_encoders": {
+            decimal.Decimal: lambda v: str(v)
+        }
+    }
+
 class AlternativeDetail(BaseModel):
     name: str
     description: Optional[str] = None
     category: Optional[str] = None # e.g., "Streaming Video", "Music", "Cloud Storage"
     notes: Optional[str] = None # e.g., "Ad-supported free tier available"
 
+    # Instances are built once by the alternatives index and shared between requests.
+    model_config = {
+        "frozen": True
+    }
+
 class SubscriptionAlternativeRequest(BaseModel):
     service_name: str = Field(..., example="Netflix", description="The name of the subscription service to find alternatives for.")
     # Optionally, you could add current_price, features_used, etc., for more tailored suggestions later.
@@ -66,6 +114,12 @@ class SubscriptionAlternativeResponse(BaseModel):
     alternatives: List[AlternativeDetail]
     message: Optional[str] = None
 
+class SubscriptionAlternativeBatchRequest(BaseModel):
+    service_names: List[str] = Field(..., example=["Netflix", "SPOTIFY P0A1B2 STOCKHOLM"], description="Subscription service names or raw bank descriptors.")
+
+class SubscriptionAlternativeBatchResponse(BaseModel):
+    results: List[SubscriptionAlternativeResponse]
+
 # Update AISuggestionOutput if you want to use it generically,
 # or keep it separate if preferred. For clarity, let's keep it separate for now.
 class AISuggestionOutput(BaseModel):
@@ -0,0 +1,156 @@
+"""
+Production entry point: runs the API in several uvicorn worker processes.
+
+    python -m app.server                  # one worker per CPU core (SERVER_WORKERS to override)
+    python -m app.server --workers 4 --port 8080
+
+The supervisor binds the port once and starts the workers, which share the listening
+socket. Connections wait in the socket backlog until a worker has finished its startup
+(services built, hot paths warmed up), so no request reaches a cold worker. A worker
+that dies unexpectedly is replaced.
+
+On SIGTERM or SIGINT, every worker drains: /ready turns 503 for
+`server_drain_delay_seconds` while requests are still served (time for the load balancer
+to notice), then the worker stops accepting connections and waits up to
+`server_graceful_shutdown_seconds` for in-flight requests and streams to finish.
+
+With more than one worker, the in-memory response cache is replaced by the SQLite one,
+so analysis results are shared between workers and survive restarts.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from typing import List, Optional
+
+import uvicorn
+
+from app.config import settings
+from app.services.lifecycle import lifecycle
+
+logger = logging.getLogger(__name__)
+
+# A worker exiting this soon after it was started is treated as a startup failure, not restarted.
+_MIN_WORKER_UPTIME_SECONDS = 10.0
+# Workers start from a fresh interpreter rather than a fork of the supervisor.
+_spawn = multiprocessing.get_context("spawn")
+
+
+class DrainingServer(uvicorn.Server):
+    """uvicorn server that reports not-ready for `drain_delay` seconds before stopping."""
+
+    def __init__(self, config: uvicorn.Config, drain_delay: float = 0.0):
+        super().__init__(config)
+        self.drain_delay = drain_delay
+        self._drain_timer: Optional[threading.Timer] = None
+
+    def handle_exit(self, sig, frame):
+        if self._drain_timer is not None or self.drain_delay <= 0:
+            lifecycle.begin_drain()
+            super().handle_exit(sig, frame)
+            return
+        lifecycle.begin_drain()
+        logger.info(f"Received signal {sig}; stopping in {self.drain_delay:.1f}s.")
+        self._drain_timer = threading.Timer(self.drain_delay, super().handle_exit, args=(sig, frame))
+        self._drain_timer.daemon = True
+        self._drain_timer.start()
+
+
+def _run_worker(config: uvicorn.Config, drain_delay: float, sockets):
+    config.configure_logging()
+    DrainingServer(config, drain_delay=drain_delay).run(sockets=sockets)
+
+
+class WorkerSupervisor:
+    """Starts `workers` processes on a shared socket, replaces crashed ones and stops them gracefully."""
+
+    def __init__(self, config: uvicorn.Config, workers: int, drain_delay: float, graceful_shutdown: float):
+        self.config = config
+        self.workers = workers
+        self.drain_delay = drain_delay
+        self.graceful_shutdown = graceful_shutdown
+        self.should_exit = threading.Event()
+        self._processes: List = []
+
+    def _spawn(self, sockets):
+        process = _spawn.Process(target=_run_worker, args=(self.config, self.drain_delay, sockets))
+        process.start()
+        process.started_at = time.monotonic()
+        logger.info(f"Started worker process {process.pid}.")
+        return process
+
+    def run(self):
+        sockets = [self.config.bind_socket()]
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: self.should_exit.set())
+        logger.info(f"Supervisor {os.getpid()} starting {self.workers} workers on {self.config.host}:{self.config.port}.")
+        self._processes = [self._spawn(sockets) for _ in range(self.workers)]
+
+        while not self.should_exit.wait(0.5):
+            for i, process in enumerate(self._processes):
+                if process.is_alive():
+                    continue
+                if time.monotonic() - process.started_at < _MIN_WORKER_UPTIME_SECONDS:
+                    logger.error(f"Worker {process.pid} exited with code {process.exitcode} during startup; shutting down.")
+                    self.should_exit.set()
+                    break
+                logger.warning(f"Worker {process.pid} exited with code {process.exitcode}; starting a replacement.")
+                self._processes[i] = self._spawn(sockets)
+
+        self.shutdown()
+        for sock in sockets:
+            sock.close()
+
+    def shutdown(self):
+        started = time.monotonic()
+        for process in self._processes:
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+        deadline = started + self.drain_delay + self.graceful_shutdown + 5.0
+        for process in self._processes:
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.error(f"Worker {process.pid} did not stop within the graceful shutdown timeout; killing it.")
+                process.kill()
+                process.join()
+        logger.info(f"All workers stopped in {time.monotonic() - started:.2f}s.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the PayRight AI service with several worker processes.")
+    parser.add_argument("--host", default=settings.server_host)
+    parser.add_argument("--port", type=int, default=settings.server_port)
+    parser.add_argument("--workers", type=int, default=settings.server_workers, help="Default: number of CPU cores.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    workers = max(1, args.workers or os.cpu_count() or 1)
+    if workers > 1 and settings.cache_backend == "memory":
+        # Workers are separate processes; only the SQLite cache is visible to all of them.
+        logger.info(f"Using the shared SQLite response cache at '{settings.cache_sqlite_path}' for {workers} workers.")
+        os.environ["CACHE_BACKEND"] = "sqlite"
+
+    config = uvicorn.Config(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        lifespan="on",
+        timeout_graceful_shutdown=settings.server_graceful_shutdown_seconds
+    )
+    if workers == 1:
+        DrainingServer(config, drain_delay=settings.server_drain_delay_seconds).run(sockets=[config.bind_socket()])
+        return
+    WorkerSupervisor(
+        config,
+        workers,
+        drain_delay=settings.server_drain_delay_seconds,
+        graceful_shutdown=settings.server_graceful_shutdown_seconds
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
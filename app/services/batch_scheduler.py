@@ -0,0 +1,115 @@
+import asyncio
+import itertools
+import logging
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Job = Tuple[str, Callable[[], Awaitable[Any]]]
+
+
+class _Stream:
+    def __init__(self, jobs: Iterable[Job], max_outstanding: int):
+        self.jobs: Deque[Job] = deque(jobs)
+        self.results: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+        self.tasks: set = set()
+        self.max_outstanding = max_outstanding
+        self.remaining = len(self.jobs)
+
+    @property
+    def outstanding(self) -> int:
+        # Running jobs plus finished results the consumer has not read yet.
+        return len(self.tasks) + self.results.qsize()
+
+
+class FairScheduler:
+    """
+    Runs keyed async jobs for many concurrent batches under one concurrency cap.
+
+    Each batch is a stream; free slots are handed out round-robin across streams so a
+    50k-user nightly run cannot starve a small batch submitted after it. A stream only
+    gets new slots while its unread results stay below `max_outstanding_per_stream`,
+    which bounds memory when the consumer (e.g. a slow HTTP client) falls behind.
+    """
+
+    def __init__(self, max_concurrency: int = 16, job_timeout: Optional[float] = None, max_outstanding_per_stream: Optional[int] = None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.job_timeout = job_timeout
+        self.max_outstanding_per_stream = max_outstanding_per_stream or 2 * self.max_concurrency
+        self._streams: "OrderedDict[int, _Stream]" = OrderedDict()
+        self._stream_ids = itertools.count()
+        self._running = 0
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def queued(self) -> int:
+        return sum(len(stream.jobs) for stream in self._streams.values())
+
+    async def run(self, jobs: Iterable[Job]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Schedules `(key, job)` pairs and yields one dict per job as it completes:
+        {"key", "status": "ok" | "timeout" | "error", "result" or "detail"}.
+        Closing the iterator early cancels whatever is still queued or running.
+        """
+        stream_id = next(self._stream_ids)
+        stream = _Stream(jobs, self.max_outstanding_per_stream)
+        self._streams[stream_id] = stream
+        try:
+            self._pump()
+            while stream.remaining:
+                item = await stream.results.get()
+                stream.remaining -= 1
+                self._pump()
+                yield item
+        finally:
+            self._streams.pop(stream_id, None)
+            for task in list(stream.tasks):
+                task.cancel()
+            self._pump()
+
+    def _pump(self):
+        while self._running < self.max_concurrency:
+            picked = self._next_job()
+            if picked is None:
+                return
+            stream, (key, job) = picked
+            self._running += 1
+            task = asyncio.ensure_future(self._execute(key, job))
+            stream.tasks.add(task)
+            # Accounting happens in the callback so that tasks cancelled before they
+            # ever started still release their slot.
+            task.add_done_callback(lambda t, stream=stream: self._on_done(stream, t))
+
+    def _next_job(self) -> Optional[Tuple[_Stream, Job]]:
+        for _ in range(len(self._streams)):
+            stream_id, stream = next(iter(self._streams.items()))
+            # Rotate so the next free slot goes to the following stream.
+            self._streams.move_to_end(stream_id)
+            if stream.jobs and stream.outstanding < stream.max_outstanding:
+                return stream, stream.jobs.popleft()
+        return None
+
+    async def _execute(self, key: str, job: Callable[[], Awaitable[Any]]) -> Dict[str, Any]:
+        try:
+            if self.job_timeout:
+                result = await asyncio.wait_for(job(), timeout=self.job_timeout)
+            else:
+                result = await job()
+            return {"key": key, "status": "ok", "result": result}
+        except asyncio.TimeoutError:
+            logger.warning(f"Batch job '{key}' timed out after {self.job_timeout}s.")
+            return {"key": key, "status": "timeout", "detail": f"Timed out after {self.job_timeout} seconds."}
+        except Exception as e:
+            logger.error(f"Batch job '{key}' failed: {e}", exc_info=True)
+            return {"key": key, "status": "error", "detail": str(e)}
+
+    def _on_done(self, stream: _Stream, task: "asyncio.Future"):
+        self._running -= 1
+        stream.tasks.discard(task)
+        if not task.cancelled():
+            stream.results.put_nowait(task.result())
+        self._pump()
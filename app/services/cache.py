@@ -0,0 +1,298 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(kind: str, payload: Any, namespace: str) -> str:
+    """
+    Stable content hash for a model request.
+    `payload` must already be normalized (e.g. transactions sorted) so that
+    logically identical inputs hash the same; `namespace` carries the model name
+    and generation config so a config change never serves stale answers.
+    """
+    canonical = json.dumps(
+        {"kind": kind, "namespace": namespace, "payload": payload},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def record(self, hits: int = 0, misses: int = 0, evictions: int = 0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self.evictions += evictions
+
+    def as_dict(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class CacheBackend:
+    """Interface for response cache stores. Values are JSON strings."""
+
+    # Whether calls may wait on disk or locks held by other processes; `ResponseCache`
+    # then makes them from a worker thread instead of the event loop.
+    blocking = False
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str) -> int:
+        """Stores a value and returns how many entries were evicted to make room."""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def prune(self) -> int:
+        """Drops expired entries and entries over the size bound; returns how many."""
+        return 0
+
+    def close(self):
+        """Releases the store's resources; the backend is not used afterwards."""
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+
+class InMemoryLRUCache(CacheBackend):
+    """Per-process LRU cache bounded by entry count and TTL."""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600.0):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> int:
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        return evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCache(CacheBackend):
+    """
+    On-disk cache shared by every worker pointing at the same file.
+    WAL mode lets readers in other processes proceed while one process writes.
+    Writes do not enforce the TTL and size bound themselves; `prune` does, on a timer
+    (see `ResponseCache`), so the table can briefly hold more than `max_entries`.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl_seconds: float = 3600.0):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS response_cache_last_access ON response_cache (last_access)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS response_cache_expires_at ON response_cache (expires_at)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE response_cache SET last_access = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, value: str) -> int:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, now + self.ttl_seconds, now)
+            )
+        return 0
+
+    def prune(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = self._conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (now,)).rowcount
+            overflow = self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM response_cache WHERE key IN ("
+                    " SELECT key FROM response_cache ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,)
+                )
+            return max(0, expired) + max(0, overflow)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM response_cache")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+
+class ResponseCache:
+    """
+    Counts hits/misses/evictions around a `CacheBackend` and (de)serializes values.
+    With `prune_interval_seconds` > 0, a daemon thread calls `backend.prune()` that often.
+    """
+
+    def __init__(self, backend: CacheBackend, prune_interval_seconds: float = 0.0):
+        self.backend = backend
+        self.stats = CacheStats()
+        self._closed = threading.Event()
+        if prune_interval_seconds > 0:
+            threading.Thread(
+                target=self._prune_periodically, args=(prune_interval_seconds,), name="cache-prune", daemon=True
+            ).start()
+
+    def _prune_periodically(self, interval: float):
+        while not self._closed.wait(interval):
+            try:
+                self.stats.record(evictions=self.backend.prune())
+            except Exception as e:
+                logger.error(f"Response cache pruning failed: {e}")
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            raw = self.backend.get(key)
+        except Exception as e:
+            logger.error(f"Response cache read failed, treating as miss: {e}")
+            raw = None
+        if raw is None:
+            self.stats.record(misses=1)
+            return None
+        self.stats.record(hits=1)
+        return json.loads(raw)
+
+    def set(self, key: str, value: Any):
+        try:
+            evicted = self.backend.set(key, json.dumps(value, default=str))
+            self.stats.record(evictions=evicted)
+        except Exception as e:
+            logger.error(f"Response cache write failed: {e}")
+
+    async def get_async(self, key: str) -> Optional[Any]:
+        """`get` for the event loop: blocking backends are read from a worker thread."""
+        if self.backend.blocking:
+            return await asyncio.to_thread(self.get, key)
+        return self.get(key)
+
+    async def set_async(self, key: str, value: Any):
+        if self.backend.blocking:
+            await asyncio.to_thread(self.set, key, value)
+        else:
+            self.set(key, value)
+
+    def close(self):
+        self._closed.set()
+        try:
+            self.backend.close()
+        except Exception as e:
+            logger.error(f"Failed to close response cache: {e}")
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        bypass: bool = False,
+        store: Callable[[], bool] = lambda: True
+    ) -> Any:
+        """
+        Returns the cached value for `key`, or awaits `compute()` and stores its result.
+        With `bypass` the lookup is skipped but the fresh result still refreshes the entry.
+        Empty results are not stored, since the service also returns them on upstream failure,
+        and neither are results for which `store()` (asked after computing) returns False.
+        """
+        if not bypass:
+            cached = await self.get_async(key)
+            if cached is not None:
+                return cached
+        value = await compute()
+        if value and store():
+            await self.set_async(key, value)
+        return value
+
+    def describe(self) -> Dict[str, Any]:
+        try:
+            size = len(self.backend)
+        except Exception:
+            size = None
+        return dict(self.stats.as_dict(), backend=type(self.backend).__name__, entries=size)
+
+
+def build_response_cache(
+    backend: str,
+    max_entries: int,
+    ttl_seconds: float,
+    sqlite_path: str,
+    prune_interval_seconds: float = 60.0
+) -> Optional[ResponseCache]:
+    if backend == "none":
+        return None
+    if backend == "sqlite":
+        return ResponseCache(
+            SQLiteCache(sqlite_path, max_entries=max_entries, ttl_seconds=ttl_seconds),
+            prune_interval_seconds=prune_interval_seconds
+        )
+    return ResponseCache(InMemoryLRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds))
@@ -0,0 +1,135 @@
+import asyncio
+import decimal
+import logging
+from collections import defaultdict
+from datetime import date
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from app.analysis.email_receipts import clean_email_body, condense, content_hash, looks_like_receipt, pack_batches
+from app.models.schemas import EmailInput, ExtractedReceipt, TransactionInput
+from app.services import metrics
+from app.services.resilience import ModelUnavailableError
+
+logger = logging.getLogger(__name__)
+
+
+class EmailIngestionResult(NamedTuple):
+    receipts: List[ExtractedReceipt]
+    transactions: List[TransactionInput]
+    stats: Dict[str, Any]
+
+
+def _to_receipt(raw: Dict[str, Any], email: EmailInput, duplicates: List[str]) -> Optional[ExtractedReceipt]:
+    try:
+        amount = raw.get("transaction_amount")
+        charged_on = raw.get("transaction_date")
+        return ExtractedReceipt(
+            email_id=email.id,
+            user_id=email.userId,
+            merchant_name=raw["merchant_name"],
+            transaction_amount=decimal.Decimal(str(amount)),
+            currency=str(raw.get("currency") or "USD").upper(),
+            transaction_date=date.fromisoformat(charged_on) if isinstance(charged_on, str) else email.received_date,
+            is_recurring=bool(raw.get("is_recurring")),
+            recurrence_details=raw.get("recurrence_details"),
+            duplicate_email_ids=duplicates
+        )
+    except Exception as e:
+        logger.error(f"Failed to validate receipt extracted from email {email.id}: {raw}. Error: {e}")
+        metrics.VALIDATION_FAILURES.inc(model="ExtractedReceipt")
+        return None
+
+
+def receipt_to_transaction(receipt: ExtractedReceipt) -> TransactionInput:
+    """The receipt as a transaction, so it can go through the same subscription detection."""
+    return TransactionInput(
+        id=f"email:{receipt.email_id}",
+        userId=receipt.user_id,
+        transaction_date=receipt.transaction_date,
+        description=receipt.merchant_name,
+        amount=receipt.transaction_amount,
+        currency=receipt.currency,
+        source="email"
+    )
+
+
+async def extract_receipts(
+    gemini_service,
+    emails: List[EmailInput],
+    batch_max_items: int = 8,
+    batch_max_chars: int = 16000,
+    max_body_chars: int = 4000,
+    concurrency: int = 4,
+    use_cache: bool = True
+) -> EmailIngestionResult:
+    """
+    Runs an inbox through the receipt pipeline:
+
+    1. clean each body (HTML and boilerplate stripped, condensed to `max_body_chars`);
+    2. drop emails the local pre-filter says are not receipts;
+    3. dedupe identical receipts per user by content hash;
+    4. pack the rest into batches of at most `batch_max_items` emails / `batch_max_chars`
+       characters, one model call each, with at most `concurrency` batches in flight.
+
+    Batches that fail, because the model is unavailable or rejected that batch's prompt,
+    are counted in the stats and skipped, so one failure does not discard the receipts
+    extracted from the other batches.
+    """
+    stats = {"emails": len(emails), "prefiltered_out": 0, "duplicates": 0, "model_batches": 0, "failed_emails": 0, "not_receipts": 0}
+    by_prompt_id: Dict[str, Tuple[EmailInput, str]] = {}
+    first_by_hash: Dict[Tuple[str, str], str] = {}
+    duplicates: Dict[str, List[str]] = defaultdict(list)
+
+    with metrics.stage("email_prefilter"):
+        for email in emails:
+            text = clean_email_body(email.body, is_html=email.content_type == "text/html")
+            if not looks_like_receipt(email.subject, text):
+                stats["prefiltered_out"] += 1
+                continue
+            text = condense(text, max_body_chars)
+            key = (email.userId, content_hash(email.subject, text))
+            if key in first_by_hash:
+                duplicates[first_by_hash[key]].append(email.id)
+                stats["duplicates"] += 1
+                continue
+            # Short positional ids keep the prompt small and cannot collide across users.
+            prompt_id = f"e{len(by_prompt_id)}"
+            first_by_hash[key] = prompt_id
+            by_prompt_id[prompt_id] = (email, text)
+
+    batches = pack_batches(((pid, text) for pid, (_, text) in by_prompt_id.items()), batch_max_items, batch_max_chars)
+    stats["model_batches"] = len(batches)
+    fan_out = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_batch(batch: List[Tuple[str, str]]) -> Dict[str, Optional[Dict[str, Any]]]:
+        async with fan_out:
+            try:
+                return await gemini_service.extract_receipts_batch(
+                    [(pid, by_prompt_id[pid][0].subject, text) for pid, text in batch],
+                    use_cache=use_cache
+                )
+            except ModelUnavailableError as e:
+                logger.error(f"Receipt extraction failed for a batch of {len(batch)} emails: {e}")
+                stats["failed_emails"] += len(batch)
+                return {}
+            except Exception as e:
+                # E.g. a safety block or a rejected prompt: specific to this batch's emails.
+                logger.error(f"Receipt extraction failed for a batch of {len(batch)} emails: {e}", exc_info=True)
+                stats["failed_emails"] += len(batch)
+                return {}
+
+    receipts: List[ExtractedReceipt] = []
+    for batch_result in await asyncio.gather(*(run_batch(batch) for batch in batches)):
+        for pid, raw in batch_result.items():
+            if raw is None:
+                stats["not_receipts"] += 1
+                continue
+            receipt = _to_receipt(raw, by_prompt_id[pid][0], duplicates.get(pid, []))
+            if receipt is not None:
+                receipts.append(receipt)
+
+    logger.info(
+        f"Email ingestion: {stats['emails']} emails, {stats['prefiltered_out']} pre-filtered, {stats['duplicates']} duplicates, "
+        f"{len(receipts)} receipts from {stats['model_batches']} model calls."
+    )
+    return EmailIngestionResult(receipts, [receipt_to_transaction(r) for r in receipts], stats)
@@ -1,34 +1,159 @@
-import google.generativeai as genai
 from app.config import settings
 from app.models.schemas import TransactionInput
-from typing import List, Dict, Any, Optional
-import json
+from app.analysis.prompt_chunker import (
+    CHARS_PER_TOKEN, coerce_transaction_ids, estimate_tokens, format_transaction_line, merge_subscription_lists, plan_transaction_chunks
+)
+from app.analysis.prompt_encoding import CompactTransactionTable, approximate_compact_row, approximate_merchant_entry
+from app.analysis.recurrence_detector import normalize_merchant
+from app.services.cache import ResponseCache, build_response_cache, make_cache_key
+from app.services import metrics
+from app.services.json_stream import IncrementalJSONParser, extract_json_object
+from app.services.model_backends import ModelBackend, build_model_backend
+from app.services.resilience import CircuitBreaker, ModelUnavailableError, ResilientCaller
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, List, Dict, Any, Optional, Tuple
+import asyncio
 import logging
+import time
 
 logger = logging.getLogger(__name__)  # Ensure this is at the module level
 
 class GeminiService:
-    def __init__(self, model_name: str = settings.gemini_model_name):
+    def __init__(
+        self,
+        model_name: str = settings.gemini_model_name,
+        max_concurrency: int = settings.gemini_max_concurrency,
+        backend: Optional[ModelBackend] = None,
+        chunk_max_tokens: int = settings.gemini_chunk_max_tokens,
+        chunk_parallelism: int = settings.gemini_chunk_parallelism,
+        cache: Optional[ResponseCache] = None,
+        resilience: Optional[ResilientCaller] = None,
+        prompt_encoding: str = settings.gemini_prompt_encoding
+    ):
+        self.model_name = model_name
+        self.prompt_encoding = prompt_encoding
+        # Row and merchant dictionary formats of the prompts, for token budgeting.
+        self._format_line = approximate_compact_row if prompt_encoding == "compact" else format_transaction_line
+        self._format_merchant = approximate_merchant_entry if prompt_encoding == "compact" else None
+        self.max_concurrency = max(1, max_concurrency)
+        self.chunk_max_tokens = chunk_max_tokens
+        self.chunk_parallelism = max(1, chunk_parallelism)
+        self.cache = cache if cache is not None else build_response_cache(
+            settings.cache_backend,
+            settings.cache_max_entries,
+            settings.cache_ttl_seconds,
+            settings.cache_sqlite_path,
+            settings.cache_sqlite_prune_interval_seconds
+        )
+        self.resilience = resilience or ResilientCaller(
+            max_attempts=settings.model_retry_max_attempts,
+            base_delay=settings.model_retry_base_delay_seconds,
+            max_delay=settings.model_retry_max_delay_seconds,
+            deadline_seconds=settings.model_call_timeout_seconds,
+            breaker=CircuitBreaker(settings.circuit_breaker_failure_threshold, settings.circuit_breaker_recovery_seconds),
+            hedge_percentile=settings.model_hedge_percentile,
+            hedge_min_samples=settings.model_hedge_min_samples
+        )
+        # Created lazily so it binds to the event loop that actually serves requests.
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        if backend is not None:
+            self.backend = backend
+        else:
+            try:
+                self.backend = build_model_backend(settings, model_name)
+            except Exception as e:
+                logger.error(f"Failed to initialize model backend '{settings.model_backend}' for '{model_name}': {e}")
+                raise
+        logger.info(f"Gemini service initialized with '{self.backend.name}' backend for model '{model_name}'.")
+
+        # Anything that changes the model's answer for the same input belongs here.
+        self._cache_namespace = f"{self.backend.fingerprint()}|chunk={chunk_max_tokens}|enc={prompt_encoding}"
+
+    def warm_up(self, transactions: List[TransactionInput]):
+        """Builds prompts for `transactions` and parses a canned answer once, without calling the model."""
+        for chunk in self._plan_chunks(transactions):
+            self._build_transactions_prompt(chunk, self._encode_transactions(chunk))
+        self._parse_subscriptions_response("[]")
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    @asynccontextmanager
+    async def _model_call_slot(self, prompt: str, kind: str):
+        """
+        Holds one of the `max_concurrency` model call slots (waiting for it if needed)
+        and records the call's prompt size and latency.
+        """
+        metrics.PROMPT_CHARS.inc(len(prompt), kind=kind)
+        metrics.PROMPT_TOKENS.inc(estimate_tokens(prompt), kind=kind)
+        semaphore = self._get_semaphore()
+        with metrics.MODEL_CALLS_WAITING.track_inprogress(), metrics.stage("model_wait"):
+            await semaphore.acquire()
+        started = time.perf_counter()
+        outcome = "error"
         try:
-            self.model = genai.GenerativeModel(
-                model_name,
-                safety_settings=safety_settings,
-                generation_config=generation_config
-            )
-            logger.info(f"Gemini model '{model_name}' initialized successfully.")
-        except Exception as e:
-            logger.error(f"Failed to initialize Gemini model '{model_name}': {e}")
-            raise
+            with metrics.MODEL_CALLS_IN_FLIGHT.track_inprogress(), metrics.stage("model_call"):
+                yield
+            outcome = "ok"
+        finally:
+            metrics.MODEL_CALL_SECONDS.observe(time.perf_counter() - started, kind=kind, outcome=outcome)
+            semaphore.release()
 
-    def analyze_transactions_for_subscriptions(self, transactions: List[TransactionInput]) -> List[Dict[str, Any]]:
-        if not transactions:
-            return []
+    @staticmethod
+    def _record_response_size(chars: int, kind: str):
+        metrics.RESPONSE_CHARS.inc(chars, kind=kind)
+        metrics.RESPONSE_TOKENS.inc(chars // CHARS_PER_TOKEN + 1, kind=kind)
 
-        logger.info(f"Attempting to analyze {len(transactions)} transactions for user: {transactions[0].userId if transactions else 'N/A'}")
-        
-        transaction_data_with_ids_str = "Here is a list of transactions with their IDs:\n"
-        for tx in transactions:
-            transaction_data_with_ids_str += f"- ID: {tx.id}, Date: {tx.transaction_date}, Description: \"{tx.description}\", Amount: {tx.amount} {tx.currency}\n"
+    async def _generate_content_async(self, prompt: str, kind: str = "transactions") -> str:
+        """
+        Runs a model call without blocking the event loop. At most `max_concurrency`
+        calls are in flight at once; the rest wait here. Transient failures are retried
+        (and slow calls hedged) by `self.resilience`, which raises `ModelUnavailableError`
+        when no answer can be had.
+
+        The slot is taken before `self.resilience` starts, so its deadlines and hedge
+        latencies measure the upstream call only, never time queued behind other calls
+        of this worker. Retries keep the slot; a hedged duplicate shares it.
+        """
+        async def attempt() -> str:
+            return await self.backend.generate_async(prompt)
+
+        async with self._model_call_slot(prompt, kind):
+            response_text = await self.resilience.call(attempt)
+        self._record_response_size(len(response_text), kind)
+        return response_text.strip()
+
+    async def _generate_content_stream_async(self, prompt: str, kind: str = "transactions") -> AsyncIterator[str]:
+        """Like `_generate_content_async`, but yields the answer in pieces as they arrive."""
+        received = 0
+        async with self._model_call_slot(prompt, kind):
+            async for piece in self.resilience.stream(lambda: self.backend.generate_stream_async(prompt)):
+                received += len(piece)
+                yield piece
+        self._record_response_size(received, kind)
+
+    def _plan_chunks(self, transactions: List[TransactionInput]) -> List[List[TransactionInput]]:
+        return plan_transaction_chunks(
+            transactions, self.chunk_max_tokens, format_line=self._format_line, format_merchant=self._format_merchant
+        )
+
+    def _encode_transactions(self, transactions: List[TransactionInput]) -> Optional[CompactTransactionTable]:
+        """The compact table for `transactions`, or None when prompts use the verbose format."""
+        if self.prompt_encoding != "compact" or not transactions:
+            return None
+        return CompactTransactionTable(transactions)
+
+    def _build_transactions_prompt(self, transactions: List[TransactionInput], table: Optional[CompactTransactionTable] = None) -> str:
+        if table is not None:
+            transaction_data_with_ids_str = f"The transactions are given as a compact table:\n{table.render()}"
+            ids_description = "A list of the *row_id* values (first column of the rows) of the transactions that belong to this subscription."
+        else:
+            transaction_lines = "\n".join(format_transaction_line(tx) for tx in transactions)
+            transaction_data_with_ids_str = f"Here is a list of transactions with their IDs:\n{transaction_lines}\n"
+            ids_description = "A list of the *original transaction IDs* (provided in the input) that belong to this subscription."
 
         prompt_with_ids = f"""
             You are an expert financial analyst specializing in identifying recurring subscriptions from transaction lists.
@@ -37,7 +162,7 @@ class GeminiService:
 
             For each identified subscription, provide the following information in JSON format:
             - "name": The common name of the subscription service (e.g., "Netflix", "Spotify", "Amazon Prime").
-            - "transaction_ids": A list of the *original transaction IDs* (provided in the input) that belong to this subscription.
+            - "transaction_ids": {ids_description}
             - "average_amount": The average monthly or periodic amount of the subscription as a number.
             - "currency": The currency of the subscription (e.g., "USD").
             - "detected_frequency": The detected recurrence frequency (e.g., "monthly", "yearly", "weekly", "bi-weekly").
@@ -71,40 +196,307 @@ class GeminiService:
         """
         
         logger.debug(f"--- PROMPT SENT TO GEMINI ---:\n{prompt_with_ids}\n--- END OF PROMPT ---")
+        return prompt_with_ids
 
-        try:
-            response = self.model.generate_content(prompt_with_ids)
-            response_text = response.text.strip()
-            
-            logger.debug(f"--- RAW GEMINI RESPONSE ---:\n{response_text}\n--- END OF RAW RESPONSE ---")
-
-            if response_text.startswith("```json"):
-                response_text = response_text[7:]
-            if response_text.endswith("```"):
-                response_text = response_text[:-3]
-            response_text = response_text.strip()
-
-            logger.debug(f"--- CLEANED GEMINI RESPONSE ---:\n{response_text}\n--- END OF CLEANED RESPONSE ---")
-
-            parsed_response = json.loads(response_text)
-            if not isinstance(parsed_response, list):
-                logger.error(f"Gemini response was not a list after parsing: {parsed_response}")
-                return []
-            logger.info(f"Successfully parsed Gemini response. Found {len(parsed_response)} potential subscriptions.")
-            return parsed_response
-
-        except json.JSONDecodeError as e:
-            logger.error(f"JSONDecodeError: Failed to decode JSON from Gemini response. Error: {e}. Response text was: '{response_text}'")
+    def _parse_subscriptions_response(self, response_text: str, table: Optional[CompactTransactionTable] = None) -> List[Dict[str, Any]]:
+        """
+        Extracts the subscription objects from a model answer. Prose and code fences
+        around the JSON list are ignored, and the complete objects of a truncated list
+        are kept instead of discarding the whole answer. With a compact `table`, row IDs
+        are mapped back to the original transaction IDs.
+        """
+        logger.debug(f"--- RAW GEMINI RESPONSE ---:\n{response_text}\n--- END OF RAW RESPONSE ---")
+        parser = IncrementalJSONParser()
+        parsed_response = parser.feed(response_text)
+        self._log_parse_outcome(parser.close(), response_text, "transactions")
+        if table is not None:
+            return [table.restore(sub) for sub in parsed_response]
+        return parsed_response
+
+    def _log_parse_outcome(self, parser: IncrementalJSONParser, response_text: str, kind: str):
+        if not parser.found_array:
+            logger.error(f"Gemini response did not contain a JSON list. Response text was: '{response_text}'")
+            metrics.RESPONSE_PARSE_FAILURES.inc(kind=kind)
+        elif parser.truncated or parser.invalid_objects:
+            logger.warning(
+                f"Salvaged {parser.objects_parsed} objects from a {'truncated' if parser.truncated else 'malformed'} "
+                f"Gemini response ({parser.invalid_objects} undecodable)."
+            )
+            metrics.RESPONSE_PARSE_FAILURES.inc(kind=kind)
+        else:
+            logger.info(f"Successfully parsed Gemini response. Found {parser.objects_parsed} potential subscriptions.")
+
+    def analyze_transactions_for_subscriptions(self, transactions: List[TransactionInput]) -> List[Dict[str, Any]]:
+        """
+        Synchronous analysis. Blocks the calling thread for the whole model round-trip,
+        so request handlers should use `analyze_transactions_for_subscriptions_async`.
+        """
+        if not transactions:
             return []
+
+        logger.info(f"Attempting to analyze {len(transactions)} transactions for user: {transactions[0].userId if transactions else 'N/A'}")
+        table = self._encode_transactions(transactions)
+        prompt_with_ids = self._build_transactions_prompt(transactions, table)
+
+        try:
+            response_text = self.backend.generate(prompt_with_ids)
+            return self._parse_subscriptions_response(response_text.strip(), table)
         except Exception as e:
             logger.error(f"Exception during Gemini API call or processing: {e}", exc_info=True)
             return []
 
-    async def analyze_email_content(self, email_body: str, email_subject: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    async def analyze_transactions_for_subscriptions_async(
+        self,
+        transactions: List[TransactionInput],
+        use_cache: bool = True,
+        on_subscription: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Non-blocking counterpart of `analyze_transactions_for_subscriptions`.
+        Histories larger than `chunk_max_tokens` are split into several prompts that run
+        concurrently (at most `chunk_parallelism` per request) and are merged afterwards.
+        Results are cached by content; `use_cache=False` forces a fresh model call.
+
+        With `on_subscription`, the model's answer is streamed and each raw subscription
+        is passed to the callback as soon as it is parsed (cached results are replayed).
+        Those are per-chunk answers; the returned, merged list is authoritative.
+
+        Raises `ModelUnavailableError` when the model cannot be reached (after retries, or
+        while the circuit breaker is open), so an outage is not mistaken for "no subscriptions".
+        """
+        if not transactions:
+            return []
+
+        logger.info(f"Attempting to analyze {len(transactions)} transactions for user: {transactions[0].userId if transactions else 'N/A'}")
+        if self.cache is None:
+            subscriptions, _ = await self._analyze_transactions_uncached_async(transactions, on_subscription)
+            return subscriptions
+
+        cache_key = self.transactions_cache_key(transactions)
+        computed = False
+        complete = False
+
+        async def compute() -> List[Dict[str, Any]]:
+            nonlocal computed, complete
+            computed = True
+            subscriptions, complete = await self._analyze_transactions_uncached_async(transactions, on_subscription)
+            return subscriptions
+
+        # An answer missing a failed chunk is returned, but not cached as if it were whole.
+        result = await self.cache.get_or_compute(cache_key, compute, bypass=not use_cache, store=lambda: complete)
+        if on_subscription is not None and not computed:
+            for sub in result:
+                on_subscription(sub)
+        return result
+
+    def transactions_cache_key(self, transactions: List[TransactionInput]) -> str:
+        """Content key of an analysis: the same for the same transactions in any order."""
+        normalized = sorted(
+            (tx.id, tx.userId, str(tx.transaction_date), tx.description.strip(), str(tx.amount), tx.currency.upper())
+            for tx in transactions
+        )
+        return make_cache_key("transactions", normalized, self._cache_namespace)
+
+    def estimate_transaction_tokens(self, transactions: List[TransactionInput]) -> int:
+        """Estimated prompt tokens of the transaction rows; up to `chunk_max_tokens` fit one prompt."""
+        tokens = sum(estimate_tokens(self._format_line(tx)) for tx in transactions)
+        if self._format_merchant is not None:
+            merchants = {normalize_merchant(tx.description) for tx in transactions}
+            tokens += sum(estimate_tokens(self._format_merchant(merchant)) for merchant in merchants)
+        return tokens
+
+    async def analyze_transaction_groups_async(self, groups: List[List[TransactionInput]]) -> List[Optional[List[Dict[str, Any]]]]:
+        """
+        Analyzes several independent transaction lists (usually different users) with one
+        model call, one prompt section per list. Returns the raw subscriptions of each
+        list in order; an entry is None when a truncated answer never reached its section,
+        so the caller can retry that list on its own. Together the lists should fit one
+        prompt (see `estimate_transaction_tokens`); results are not cached here.
+        Raises `ModelUnavailableError` when the model cannot be reached.
+        """
+        with metrics.stage("prompt_build"):
+            tables = [self._encode_transactions(group) for group in groups]
+            prompt = self._build_grouped_transactions_prompt(groups, tables)
+        response_text = await self._generate_content_async(prompt, kind="transactions_batch")
+
+        with metrics.stage("response_parse"):
+            parser = IncrementalJSONParser()
+            extracted = parser.feed(response_text)
+            self._log_parse_outcome(parser.close(), response_text, "transactions_batch")
+
+            results: List[Optional[List[Dict[str, Any]]]] = [[] for _ in groups]
+            seen = set()
+            for sub in extracted:
+                section = str(sub.pop("section", "")).strip().lstrip("s")
+                if not section.isdigit() or int(section) >= len(groups):
+                    logger.warning(f"Dropping subscription '{sub.get('name')}' with unknown section in a batched answer.")
+                    continue
+                index = int(section)
+                table = tables[index]
+                if table is not None:
+                    sub = table.restore(sub)
+                else:
+                    # Verbose IDs are only unique within a section; keep the ones that belong to it.
+                    own_ids = {tx.id for tx in groups[index]}
+                    sub["transaction_ids"] = [tx_id for tx_id in coerce_transaction_ids(sub.get("transaction_ids")) if tx_id in own_ids]
+                results[index].append(sub)
+                seen.add(index)
+            if parser.truncated:
+                for index in range(len(groups)):
+                    if index not in seen:
+                        results[index] = None
+        return results
+
+    def _build_grouped_transactions_prompt(
+        self,
+        groups: List[List[TransactionInput]],
+        tables: List[Optional[CompactTransactionTable]]
+    ) -> str:
+        sections = []
+        for index, (transactions, table) in enumerate(zip(groups, tables)):
+            data = table.render() if table is not None else "\n".join(format_transaction_line(tx) for tx in transactions) + "\n"
+            sections.append(f"=== SECTION s{index} (user '{transactions[0].userId}') ===\n{data}=== END SECTION s{index} ===")
+        if any(table is not None for table in tables):
+            ids_description = "The *row_id* values (first column of the rows) of the transactions in this section that belong to this subscription."
+        else:
+            ids_description = "The *original transaction IDs* (as given in this section) that belong to this subscription."
+        sections_str = "\n".join(sections)
+
+        return f"""
+            You are an expert financial analyst specializing in identifying recurring subscriptions from transaction lists.
+            Below are the transactions of several unrelated users, one section each, delimited by
+            "=== SECTION <id> ===" and "=== END SECTION <id> ===". Analyze every section on its own
+            and identify any recurring subscriptions. A subscription never combines transactions from different sections.
+
+            {sections_str}
+
+            For each identified subscription, output one JSON object with:
+            - "section": The id of the section it was found in, exactly as given (e.g. "s0").
+            - "name": The common name of the subscription service (e.g., "Netflix", "Spotify", "Amazon Prime").
+            - "transaction_ids": {ids_description}
+            - "average_amount": The average monthly or periodic amount of the subscription as a number.
+            - "currency": The currency of the subscription (e.g., "USD").
+            - "detected_frequency": The detected recurrence frequency (e.g., "monthly", "yearly", "weekly", "bi-weekly").
+            - "first_transaction_date": The date of the earliest transaction in this group (YYYY-MM-DD).
+            - "last_transaction_date": The date of the latest transaction in this group (YYYY-MM-DD).
+            - "confidence_score": Your confidence in this identification (a number from 0.0 to 1.0).
+            - "potential_next_billing_date": Your best estimate for the next billing date (YYYY-MM-DD), if calculable.
+
+            Return the output strictly as a single JSON list of these objects for all sections.
+            If no subscriptions are found, return an empty JSON list: [].
+            Ensure all monetary amounts are numbers, not strings with currency symbols.
+            Ensure all dates are in YYYY-MM-DD format.
+        """
+
+    async def _analyze_transactions_uncached_async(
+        self,
+        transactions: List[TransactionInput],
+        on_subscription: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """The subscriptions, and whether every chunk was fully answered."""
+        with metrics.stage("chunk_plan"):
+            chunks = self._plan_chunks(transactions)
+        if len(chunks) == 1:
+            return await self._analyze_chunk_async(chunks[0], on_subscription)
+
+        fan_out = asyncio.Semaphore(self.chunk_parallelism)
+
+        async def run_chunk(chunk: List[TransactionInput]) -> Tuple[List[Dict[str, Any]], bool]:
+            async with fan_out:
+                return await self._analyze_chunk_async(chunk, on_subscription)
+
+        tasks = [asyncio.ensure_future(run_chunk(chunk)) for chunk in chunks]
+        try:
+            partial_results = await asyncio.gather(*tasks)
+        except ModelUnavailableError:
+            # The whole analysis fails; stop paying for the chunks still running.
+            for task in tasks:
+                task.cancel()
+            raise
+        with metrics.stage("chunk_merge"):
+            merged = merge_subscription_lists([subscriptions for subscriptions, _ in partial_results], transactions)
+        return merged, all(complete for _, complete in partial_results)
+
+    async def _analyze_chunk_async(
+        self,
+        transactions: List[TransactionInput],
+        on_subscription: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """The chunk's subscriptions, and False if the call failed and they may be missing some."""
+        with metrics.stage("prompt_build"):
+            table = self._encode_transactions(transactions)
+            prompt_with_ids = self._build_transactions_prompt(transactions, table)
+        if on_subscription is not None:
+            return await self._stream_chunk_async(prompt_with_ids, on_subscription, table)
+        try:
+            response_text = await self._generate_content_async(prompt_with_ids)
+            with metrics.stage("response_parse"):
+                return self._parse_subscriptions_response(response_text, table), True
+        except ModelUnavailableError:
+            raise
+        except Exception as e:
+            logger.error(f"Exception during Gemini API call or processing: {e}", exc_info=True)
+            return [], False
+
+    async def _stream_chunk_async(
+        self,
+        prompt: str,
+        on_subscription: Callable[[Dict[str, Any]], None],
+        table: Optional[CompactTransactionTable] = None
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Parses the answer while it streams in. If the answer is cut short, the
+        subscriptions that already arrived (and were passed to `on_subscription`) are
+        kept rather than thrown away with the rest of it, and the chunk is reported as
+        incomplete. `ModelUnavailableError` is only raised when nothing arrived.
+        """
+        parser = IncrementalJSONParser()
+        subscriptions: List[Dict[str, Any]] = []
+        received: List[str] = []
+        started = time.perf_counter()
+        try:
+            async for piece in self._generate_content_stream_async(prompt):
+                received.append(piece)
+                for sub in parser.feed(piece):
+                    if table is not None:
+                        sub = table.restore(sub)
+                    if not subscriptions:
+                        metrics.FIRST_RESULT_SECONDS.observe(time.perf_counter() - started)
+                    subscriptions.append(sub)
+                    on_subscription(sub)
+        except Exception as e:
+            if isinstance(e, ModelUnavailableError) and not subscriptions:
+                raise
+            logger.error(f"Exception during streamed Gemini API call; keeping {len(subscriptions)} subscriptions received so far: {e}", exc_info=True)
+            return subscriptions, False
+        self._log_parse_outcome(parser.close(), "".join(received), "transactions")
+        return subscriptions, True
+
+    async def analyze_email_content(
+        self,
+        email_body: str,
+        email_subject: Optional[str] = None,
+        use_cache: bool = True
+    ) -> Optional[Dict[str, Any]]:
         """
         Analyzes email content to extract potential subscription/transaction details.
         This is a conceptual example; the prompt needs careful crafting.
         """
+        if self.cache is None:
+            return await self._analyze_email_content_uncached(email_body, email_subject)
+
+        cache_key = make_cache_key(
+            "email",
+            {"subject": (email_subject or "").strip(), "body": email_body[:4000].strip()},
+            self._cache_namespace
+        )
+        return await self.cache.get_or_compute(
+            cache_key,
+            lambda: self._analyze_email_content_uncached(email_body, email_subject),
+            bypass=not use_cache
+        )
+
+    async def _analyze_email_content_uncached(self, email_body: str, email_subject: Optional[str] = None) -> Optional[Dict[str, Any]]:
         prompt = f"""
             You are an intelligent assistant that extracts transaction information from emails.
             Analyze the following email content.
@@ -138,41 +530,103 @@ class GeminiService:
             Output only the JSON object or null.
         """
         try:
-            response = self.model.generate_content(prompt)
-            response_text = response.text.strip()
+            response_text = await self._generate_content_async(prompt, kind="email")
 
             if response_text.lower() == "null":
                 return None
 
-            if response_text.startswith("```json"):
-                response_text = response_text[7:]
-            if response_text.endswith("```"):
-                response_text = response_text[:-3]
-            response_text = response_text.strip()
-
-            extracted_data = json.loads(response_text)
+            extracted_data = extract_json_object(response_text)
+            if extracted_data is None and "null" not in response_text.lower():
+                logger.error(f"Gemini email response contained no JSON object. Response text was: '{response_text}'")
+                metrics.RESPONSE_PARSE_FAILURES.inc(kind="email")
             return extracted_data
         except Exception as e:
             logger.error(f"Error analyzing email with Gemini: {e}")
             return None
-genai.configure(api_key=settings.gemini_api_key)
-
-# --- Safety Settings (Adjust as needed) ---
-# See https://ai.google.dev/docs/safety_setting_gemini
-# For financial data, you might want to be cautious.
-# These are examples, review Google's documentation.
-safety_settings = [
-    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-]
-
-generation_config = genai.types.GenerationConfig(
-    # candidate_count=1, # Default
-    # stop_sequences=None, # Default
-    # max_output_tokens=8192, # For Gemini 1.5 Flash
-    temperature=0.3, # Lower for more deterministic, factual output
-    # top_p=1.0, # Default
-    # top_k=None, # Default
-)
\ No newline at end of file
+
+    async def extract_receipts_batch(
+        self,
+        emails: List[Tuple[str, Optional[str], str]],
+        use_cache: bool = True
+    ) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Extracts receipts from several (email id, subject, cleaned body) items with one
+        model call. Returns every id mapped to its receipt dict, or None when the model
+        judged it not to be a receipt. Ids answered from the cache are not sent again.
+        Raises `ModelUnavailableError` if the model cannot be reached.
+        """
+        results: Dict[str, Optional[Dict[str, Any]]] = {}
+        keys: Dict[str, str] = {}
+        pending = []
+        for email_id, subject, body in emails:
+            if self.cache is not None:
+                keys[email_id] = make_cache_key("email_receipt", {"subject": (subject or "").strip(), "body": body}, self._cache_namespace)
+                cached = await self.cache.get_async(keys[email_id]) if use_cache else None
+                if cached is not None:
+                    results[email_id] = cached.get("receipt")
+                    continue
+            pending.append((email_id, subject, body))
+        if not pending:
+            return results
+
+        sections = "\n".join(
+            f"=== EMAIL {email_id} ===\nSubject: {subject or 'N/A'}\n{body}\n=== END EMAIL {email_id} ==="
+            for email_id, subject, body in pending
+        )
+        prompt = f"""
+            You are an intelligent assistant that extracts transaction information from a batch of emails.
+            Each email below is delimited by "=== EMAIL <id> ===" and "=== END EMAIL <id> ===".
+
+            {sections}
+
+            For each email that is a receipt, invoice, or subscription charge/renewal confirmation,
+            output one JSON object with:
+            - "email_id": The email's id exactly as given.
+            - "merchant_name": The name of the merchant or service provider.
+            - "transaction_amount": The total amount charged (as a number).
+            - "currency": The currency code (e.g., "USD", "EUR").
+            - "transaction_date": The date of the transaction or billing (YYYY-MM-DD).
+            - "is_recurring": Boolean, true if this is a recurring charge/subscription.
+            - "recurrence_details": Recurrence if mentioned (e.g., "monthly", "billed annually"), or null.
+            Skip emails that are not receipts.
+            Return the output strictly as a JSON list of these objects, or [] if there are none.
+        """
+        response_text = await self._generate_content_async(prompt, kind="email_batch")
+        parser = IncrementalJSONParser()
+        extracted = parser.feed(response_text)
+        self._log_parse_outcome(parser.close(), response_text, "email_batch")
+
+        by_id = {str(item.get("email_id")): item for item in extracted}
+        for email_id, _, _ in pending:
+            receipt = by_id.get(email_id)
+            results[email_id] = receipt
+            # A truncated answer says nothing about the emails it never reached; don't cache those.
+            if self.cache is not None and (receipt is not None or not parser.truncated):
+                await self.cache.set_async(keys[email_id], {"receipt": receipt})
+        return results
+
+    async def suggest_alternatives(self, service_name: str) -> List[Dict[str, Any]]:
+        """
+        Asks the model for alternatives to a service the alternatives catalog does not know.
+        Returns raw dicts shaped like `AlternativeDetail`, or [] on any failure.
+        """
+        prompt = f"""
+            You are a consumer finance assistant helping people cut subscription costs.
+            Suggest up to 5 alternatives to the subscription service "{service_name}".
+            Return the output strictly as a JSON list of objects with these keys:
+            - "name": The alternative service's name.
+            - "description": One sentence on how it compares.
+            - "category": A short category (e.g., "Streaming Video", "Cloud Storage").
+            - "notes": Optional pricing notes such as a free tier, or null.
+            If you do not recognize the service, return an empty JSON list: [].
+        """
+        try:
+            response_text = await self._generate_content_async(prompt, kind="alternatives")
+            parser = IncrementalJSONParser()
+            parsed = parser.feed(response_text)
+            if not parser.close().found_array:
+                metrics.RESPONSE_PARSE_FAILURES.inc(kind="alternatives")
+            return [alt for alt in parsed if alt.get("name")]
+        except Exception as e:
+            logger.error(f"Error suggesting alternatives for '{service_name}' with Gemini: {e}")
+            return []
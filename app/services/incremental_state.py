@@ -0,0 +1,206 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional, Set
+
+from app.models.schemas import TransactionInput, IdentifiedSubscription
+from app.analysis.incremental_matcher import TrackedSubscription
+from app.services.codecs import TRANSACTION_LIST
+
+logger = logging.getLogger(__name__)
+
+
+class StateConflict(Exception):
+    """The user's state changed (e.g. in another worker process) since it was loaded."""
+
+
+class UserAnalysisState:
+    """Everything remembered about one user between incremental runs."""
+
+    def __init__(
+        self,
+        user_id: str,
+        tracked_subscriptions: List[TrackedSubscription],
+        pending_transactions: List[TransactionInput],
+        version: Optional[int] = None
+    ):
+        self.user_id = user_id
+        # Version of the stored row this state was loaded from (None: no row yet).
+        self.version = version
+        self.tracked_subscriptions = tracked_subscriptions
+        # Unexplained transactions kept so that a new subscription can be detected
+        # once enough of its charges have trickled in across several deltas.
+        self.pending_transactions = pending_transactions
+
+
+class IncrementalStateStore:
+    """
+    SQLite-backed per-user state for incremental analysis.
+
+    Bounded in three ways: users idle for longer than `ttl_seconds` are dropped,
+    at most `max_users` users are kept (least recently updated go first), and each
+    user keeps at most `max_pending_per_user` pending transactions and
+    `max_processed_ids_per_user` processed transaction IDs (oldest go first).
+    Stale and surplus users are evicted on every `evict_every_saves`-th save of this
+    process, so the user count may briefly exceed `max_users` in between.
+
+    Several worker processes share the file, so `save` is a compare-and-swap on the
+    row version `load` saw: if another process saved the user in between, it raises
+    `StateConflict` and writes nothing, and the caller reloads and tries again.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_users: int = 10000,
+        ttl_seconds: float = 90 * 24 * 3600,
+        max_pending_per_user: int = 2000,
+        max_processed_ids_per_user: int = 50000,
+        evict_every_saves: int = 100
+    ):
+        self.path = path
+        self.max_users = max(1, max_users)
+        self.ttl_seconds = ttl_seconds
+        self.max_pending_per_user = max(0, max_pending_per_user)
+        self.max_processed_ids_per_user = max(1, max_processed_ids_per_user)
+        self.evict_every_saves = max(1, evict_every_saves)
+        self._saves = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS user_state ("
+                " user_id TEXT PRIMARY KEY, subscriptions TEXT NOT NULL, pending TEXT NOT NULL, updated_at REAL NOT NULL,"
+                " version INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = {r[1] for r in self._conn.execute("PRAGMA table_info(user_state)")}
+            if "version" not in columns:
+                self._conn.execute("ALTER TABLE user_state ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS user_state_updated_at ON user_state (updated_at)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS processed_transactions ("
+                " user_id TEXT NOT NULL, transaction_id TEXT NOT NULL, seq INTEGER NOT NULL,"
+                " PRIMARY KEY (user_id, transaction_id))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS processed_transactions_seq ON processed_transactions (user_id, seq)")
+
+    def load(self, user_id: str) -> UserAnalysisState:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT subscriptions, pending, updated_at, version FROM user_state WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row is None:
+            return UserAnalysisState(user_id, [], [])
+        if row[2] < time.time() - self.ttl_seconds:
+            return UserAnalysisState(user_id, [], [], version=row[3])
+
+        tracked = [
+            TrackedSubscription(IdentifiedSubscription(**item["subscription"]), set(item["merchant_keys"]))
+            for item in json.loads(row[0])
+        ]
+        pending = TRANSACTION_LIST.validate_json(row[1])
+        return UserAnalysisState(user_id, tracked, pending, version=row[3])
+
+    def unprocessed(self, user_id: str, transactions: Iterable[TransactionInput]) -> List[TransactionInput]:
+        """Filters out transactions this user has already sent in an earlier delta."""
+        candidates = list(transactions)
+        if not candidates:
+            return []
+        seen: Set[str] = set()
+        ids = [tx.id for tx in candidates]
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit.
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                seen.update(
+                    r[0] for r in self._conn.execute(
+                        f"SELECT transaction_id FROM processed_transactions WHERE user_id = ? AND transaction_id IN ({placeholders})",
+                        [user_id] + batch
+                    )
+                )
+        fresh = []
+        for tx in candidates:
+            if tx.id not in seen:
+                seen.add(tx.id)  # Also drops duplicates within the same delta
+                fresh.append(tx)
+        return fresh
+
+    def save(self, state: UserAnalysisState, processed_ids: List[str]):
+        """Stores `state` and marks `processed_ids` processed, or raises `StateConflict`."""
+        pending = sorted(state.pending_transactions, key=lambda t: t.transaction_date)
+        if len(pending) > self.max_pending_per_user:
+            pending = pending[len(pending) - self.max_pending_per_user:]
+
+        subscriptions_json = json.dumps([
+            {"subscription": t.subscription.model_dump(mode="json"), "merchant_keys": sorted(t.merchant_keys)}
+            for t in state.tracked_subscriptions
+        ])
+        pending_json = TRANSACTION_LIST.dump_json(pending).decode("utf-8")
+        now = time.time()
+
+        with self._lock, self._conn:
+            # The first write of the transaction takes SQLite's write lock, so the version
+            # check and everything below happen atomically across processes.
+            if state.version is None:
+                inserted = self._conn.execute(
+                    "INSERT OR IGNORE INTO user_state (user_id, subscriptions, pending, updated_at, version) VALUES (?, ?, ?, ?, 1)",
+                    (state.user_id, subscriptions_json, pending_json, now)
+                ).rowcount
+            else:
+                inserted = self._conn.execute(
+                    "UPDATE user_state SET subscriptions = ?, pending = ?, updated_at = ?, version = version + 1"
+                    " WHERE user_id = ? AND version = ?",
+                    (subscriptions_json, pending_json, now, state.user_id, state.version)
+                ).rowcount
+            if inserted == 0:
+                raise StateConflict(f"Incremental state of user '{state.user_id}' was changed by another worker.")
+            next_seq = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) FROM processed_transactions WHERE user_id = ?", (state.user_id,)
+            ).fetchone()[0] + 1
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO processed_transactions (user_id, transaction_id, seq) VALUES (?, ?, ?)",
+                [(state.user_id, tx_id, next_seq + i) for i, tx_id in enumerate(processed_ids)]
+            )
+            self._conn.execute(
+                "DELETE FROM processed_transactions WHERE user_id = ? AND seq <= ("
+                " SELECT COALESCE(MAX(seq), 0) FROM processed_transactions WHERE user_id = ?) - ?",
+                (state.user_id, state.user_id, self.max_processed_ids_per_user)
+            )
+            self._saves += 1
+            if self._saves >= self.evict_every_saves:
+                self._saves = 0
+                self._evict_locked(now)
+        state.version = 1 if state.version is None else state.version + 1
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _evict_locked(self, now: float):
+        stale_users = [
+            r[0] for r in self._conn.execute(
+                "SELECT user_id FROM user_state WHERE updated_at < ?", (now - self.ttl_seconds,)
+            )
+        ]
+        overflow = self._conn.execute("SELECT COUNT(*) FROM user_state").fetchone()[0] - len(stale_users) - self.max_users
+        if overflow > 0:
+            stale_users.extend(
+                r[0] for r in self._conn.execute(
+                    "SELECT user_id FROM user_state WHERE updated_at >= ? ORDER BY updated_at ASC LIMIT ?",
+                    (now - self.ttl_seconds, overflow)
+                )
+            )
+        if stale_users:
+            self._conn.executemany("DELETE FROM user_state WHERE user_id = ?", [(u,) for u in stale_users])
+            self._conn.executemany("DELETE FROM processed_transactions WHERE user_id = ?", [(u,) for u in stale_users])
+            logger.info(f"Evicted incremental state for {len(stale_users)} stale users.")
+
+    def forget(self, user_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM user_state WHERE user_id = ?", (user_id,))
+            self._conn.execute("DELETE FROM processed_transactions WHERE user_id = ?", (user_id,))
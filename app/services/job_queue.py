@@ -0,0 +1,568 @@
+import asyncio
+import ipaddress
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, AbstractSet, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.services import metrics
+from app.services.codecs import dumps
+from app.services.resilience import ModelUnavailableError
+
+logger = logging.getLogger(__name__)
+
+JOB_STATES = ("queued", "running", "succeeded", "failed", "cancelled")
+FINISHED_STATES = ("succeeded", "failed", "cancelled")
+
+JOB_QUEUE_WAIT_SECONDS = metrics.registry.histogram(
+    "payright_job_queue_wait_seconds",
+    "Time from submitting (or re-queueing) an analysis job to a worker starting it.",
+    buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600)
+)
+JOB_RUN_SECONDS = metrics.registry.histogram(
+    "payright_job_run_seconds",
+    "Time a worker spent on one attempt of an analysis job.",
+    ["outcome"],
+    buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600)
+)
+JOB_CALLBACKS = metrics.registry.counter("payright_job_callbacks_total", "Job completion callbacks sent.", ["outcome"])
+
+_TIMESTAMP_COLUMNS = ("created_at", "queued_at", "started_at", "finished_at", "expires_at")
+_JOB_COLUMNS = (
+    "job_id, user_id, state, priority, transaction_count, use_cache, attempts, created_at, queued_at,"
+    " started_at, finished_at, expires_at, callback_url, callback_state, cancel_requested, error, result"
+)
+
+
+class JobRateLimited(Exception):
+    """A user submitted more jobs than allowed; `retry_after` is a hint in seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class JobStore:
+    """
+    Durable queue of analysis jobs in SQLite, shared by all worker processes on a host.
+
+    A job is "queued" until a worker claims it (highest priority first, then oldest),
+    "running" while that worker holds its lease, and then "succeeded", "failed" or
+    "cancelled". Workers renew their lease while a job runs; a job whose lease runs out
+    (its worker crashed or was killed) is queued again, and a job released by a worker
+    that shuts down goes back to the queue without counting as an attempt. Finished
+    jobs and their results are deleted `result_ttl_seconds` after they finish.
+
+    Per user, at most `max_queued_per_user` jobs may wait and at most
+    `submit_rate_per_minute` may be submitted per minute (`JobRateLimited` otherwise);
+    `claim` starts at most `max_running_per_user` of a user's jobs at once.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        lease_seconds: float = 30.0,
+        max_attempts: int = 3,
+        result_ttl_seconds: float = 24 * 3600,
+        max_queued_per_user: int = 20,
+        submit_rate_per_minute: int = 30,
+        max_running_per_user: int = 1
+    ):
+        self.path = path
+        self.lease_seconds = max(1.0, lease_seconds)
+        self.max_attempts = max(1, max_attempts)
+        self.result_ttl_seconds = result_ttl_seconds
+        self.max_queued_per_user = max(1, max_queued_per_user)
+        self.submit_rate_per_minute = max(1, submit_rate_per_minute)
+        self.max_running_per_user = max(1, max_running_per_user)
+        self._lock = threading.Lock()
+        # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE, so a
+        # claim reads and updates the queue under the write lock, across processes too.
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10.0, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # An accepted job must survive a crash right after the 202.
+        self._conn.execute("PRAGMA synchronous=FULL")
+        with self._transaction():
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " job_id TEXT PRIMARY KEY, user_id TEXT NOT NULL, state TEXT NOT NULL, priority INTEGER NOT NULL,"
+                " transaction_count INTEGER NOT NULL, use_cache INTEGER NOT NULL, attempts INTEGER NOT NULL DEFAULT 0,"
+                " created_at REAL NOT NULL, queued_at REAL NOT NULL, run_after REAL NOT NULL,"
+                " started_at REAL, finished_at REAL, expires_at REAL,"
+                " worker_id TEXT, lease_until REAL, cancel_requested INTEGER NOT NULL DEFAULT 0,"
+                " callback_url TEXT, callback_state TEXT, error TEXT, payload BLOB, result TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (state, priority DESC, created_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_user ON jobs (user_id, state, created_at)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_expiry ON jobs (expires_at)")
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def _describe_row(self, row: Tuple) -> Dict[str, Any]:
+        job = dict(zip((c.strip() for c in _JOB_COLUMNS.split(",")), row))
+        job["use_cache"] = bool(job["use_cache"])
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        for column in _TIMESTAMP_COLUMNS:
+            if job[column] is not None:
+                job[column] = datetime.fromtimestamp(job[column], tz=timezone.utc)
+        return job
+
+    def submit(
+        self,
+        user_id: str,
+        payload: bytes,
+        transaction_count: int,
+        priority: int = 0,
+        use_cache: bool = True,
+        callback_url: Optional[str] = None
+    ) -> Dict[str, Any]:
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._transaction():
+            queued, recent, oldest_recent = self._conn.execute(
+                "SELECT SUM(state = 'queued'), SUM(created_at >= ?), MIN(CASE WHEN created_at >= ? THEN created_at END)"
+                " FROM jobs WHERE user_id = ?",
+                (now - 60.0, now - 60.0, user_id)
+            ).fetchone()
+            if (recent or 0) >= self.submit_rate_per_minute:
+                raise JobRateLimited(
+                    f"User '{user_id}' submitted {recent} jobs in the last minute (limit {self.submit_rate_per_minute}).",
+                    retry_after=max(1.0, oldest_recent + 60.0 - now)
+                )
+            if (queued or 0) >= self.max_queued_per_user:
+                raise JobRateLimited(
+                    f"User '{user_id}' already has {queued} queued jobs (limit {self.max_queued_per_user}).",
+                    retry_after=self.lease_seconds
+                )
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, user_id, state, priority, transaction_count, use_cache, created_at, queued_at,"
+                " run_after, callback_url, payload) VALUES (?, ?, 'queued', ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, user_id, priority, transaction_count, int(use_cache), now, now, now, callback_url, payload)
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The job without its payload, or None if it does not exist or has expired."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_JOB_COLUMNS} FROM jobs WHERE job_id = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (job_id, time.time())
+            ).fetchone()
+        return self._describe_row(row) if row is not None else None
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Cancels a queued job at once. A running job is flagged, and its worker stops it
+        at the next lease renewal (immediately if it runs in this process). Finished jobs
+        are left as they are.
+        """
+        now = time.time()
+        with self._transaction():
+            self._conn.execute(
+                "UPDATE jobs SET state = 'cancelled', finished_at = ?, expires_at = ?, payload = NULL"
+                " WHERE job_id = ? AND state = 'queued'",
+                (now, now + self.result_ttl_seconds, job_id)
+            )
+            self._conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE job_id = ? AND state = 'running'", (job_id,))
+        return self.get(job_id)
+
+    def claim(self, worker_id: str) -> Optional[Tuple[Dict[str, Any], bytes]]:
+        """Starts the next runnable job for `worker_id`: returns (job, payload), or None if there is none."""
+        now = time.time()
+        with self._transaction():
+            self._requeue_lost_locked(now)
+            row = self._conn.execute(
+                "SELECT job_id FROM jobs WHERE state = 'queued' AND run_after <= ? AND user_id NOT IN ("
+                "  SELECT user_id FROM jobs WHERE state = 'running' GROUP BY user_id HAVING COUNT(*) >= ?)"
+                " ORDER BY priority DESC, created_at ASC LIMIT 1",
+                (now, self.max_running_per_user)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE jobs SET state = 'running', worker_id = ?, lease_until = ?, started_at = ?, attempts = attempts + 1"
+                " WHERE job_id = ?",
+                (worker_id, now + self.lease_seconds, now, row[0])
+            )
+            payload = self._conn.execute("SELECT payload FROM jobs WHERE job_id = ?", (row[0],)).fetchone()[0]
+            job = self._describe_row(self._conn.execute(f"SELECT {_JOB_COLUMNS} FROM jobs WHERE job_id = ?", (row[0],)).fetchone())
+        JOB_QUEUE_WAIT_SECONDS.observe(now - job["queued_at"].timestamp())
+        return job, payload
+
+    def renew(self, job_id: str, worker_id: str) -> str:
+        """Extends the lease. Returns "ok", "cancel" when cancellation was requested, or "lost"."""
+        with self._transaction():
+            updated = self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE job_id = ? AND worker_id = ? AND state = 'running'",
+                (time.time() + self.lease_seconds, job_id, worker_id)
+            ).rowcount
+            if not updated:
+                return "lost"
+            cancel_requested = self._conn.execute("SELECT cancel_requested FROM jobs WHERE job_id = ?", (job_id,)).fetchone()[0]
+        return "cancel" if cancel_requested else "ok"
+
+    def finish(self, job_id: str, worker_id: str, state: str, result: Optional[bytes] = None, error: Optional[str] = None) -> bool:
+        """Records the outcome of a running job; False if the worker no longer holds it."""
+        now = time.time()
+        with self._transaction():
+            return bool(self._conn.execute(
+                "UPDATE jobs SET state = ?, finished_at = ?, expires_at = ?, result = ?, error = ?, payload = NULL,"
+                " worker_id = NULL, lease_until = NULL WHERE job_id = ? AND worker_id = ? AND state = 'running'",
+                (state, now, now + self.result_ttl_seconds, result.decode("utf-8") if result else None, error, job_id, worker_id)
+            ).rowcount)
+
+    def retry_later(self, job_id: str, worker_id: str, error: str, delay: float) -> str:
+        """Queues a failed attempt again after `delay` seconds, or fails the job after `max_attempts`."""
+        now = time.time()
+        with self._transaction():
+            row = self._conn.execute(
+                "SELECT attempts FROM jobs WHERE job_id = ? AND worker_id = ? AND state = 'running'", (job_id, worker_id)
+            ).fetchone()
+            if row is None:
+                return "lost"
+            if row[0] >= self.max_attempts:
+                self._conn.execute(
+                    "UPDATE jobs SET state = 'failed', finished_at = ?, expires_at = ?, error = ?, payload = NULL,"
+                    " worker_id = NULL, lease_until = NULL WHERE job_id = ?",
+                    (now, now + self.result_ttl_seconds, f"{error} (gave up after {row[0]} attempts)", job_id)
+                )
+                return "failed"
+            self._conn.execute(
+                "UPDATE jobs SET state = 'queued', queued_at = ?, run_after = ?, error = ?, worker_id = NULL, lease_until = NULL"
+                " WHERE job_id = ?",
+                (now, now + delay, error, job_id)
+            )
+        return "queued"
+
+    def release(self, job_id: str, worker_id: str):
+        """Hands a running job back to the queue without counting the attempt (worker shutting down)."""
+        now = time.time()
+        with self._transaction():
+            self._conn.execute(
+                "UPDATE jobs SET state = 'queued', queued_at = ?, run_after = ?, attempts = MAX(0, attempts - 1),"
+                " worker_id = NULL, lease_until = NULL WHERE job_id = ? AND worker_id = ? AND state = 'running'",
+                (now, now, job_id, worker_id)
+            )
+
+    def set_callback_state(self, job_id: str, callback_state: str):
+        with self._transaction():
+            self._conn.execute("UPDATE jobs SET callback_state = ? WHERE job_id = ?", (callback_state, job_id))
+
+    def _requeue_lost_locked(self, now: float):
+        lost = self._conn.execute(
+            "SELECT job_id, attempts FROM jobs WHERE state = 'running' AND lease_until < ?", (now,)
+        ).fetchall()
+        for job_id, attempts in lost:
+            if attempts >= self.max_attempts:
+                self._conn.execute(
+                    "UPDATE jobs SET state = 'failed', finished_at = ?, expires_at = ?, payload = NULL, worker_id = NULL,"
+                    " lease_until = NULL, error = 'Worker stopped responding while running the job.' WHERE job_id = ?",
+                    (now, now + self.result_ttl_seconds, job_id)
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE jobs SET state = 'queued', queued_at = ?, run_after = ?, worker_id = NULL, lease_until = NULL"
+                    " WHERE job_id = ?",
+                    (now, now, job_id)
+                )
+        if lost:
+            logger.warning(f"Re-queued or failed {len(lost)} jobs whose worker lease expired.")
+
+    def purge_expired(self) -> int:
+        with self._transaction():
+            self._requeue_lost_locked(time.time())
+            deleted = self._conn.execute("DELETE FROM jobs WHERE expires_at <= ?", (time.time(),)).rowcount
+        if deleted:
+            logger.info(f"Deleted {deleted} expired jobs.")
+        return deleted
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        counts = dict.fromkeys(JOB_STATES, 0)
+        counts.update(rows)
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def check_callback_url(url: str, allowed_hosts: AbstractSet[str] = frozenset()) -> None:
+    """
+    Raises ValueError unless `url` is an http(s) URL whose host resolves only to public
+    addresses, so a callback cannot reach this machine, the cloud metadata service
+    (169.254.169.254) or the private network. Hosts in `allowed_hosts` are trusted as is.
+    Blocking: it resolves the host name.
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme.lower() not in ("http", "https") or not parts.hostname:
+        raise ValueError("callback_url must be an http(s) URL.")
+    host = parts.hostname
+    if host in allowed_hosts:
+        return
+    try:
+        port = parts.port or (443 if parts.scheme.lower() == "https" else 80)
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)}
+    except (OSError, UnicodeError, ValueError) as e:
+        raise ValueError(f"callback_url host '{host}' cannot be resolved: {e}") from e
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%", 1)[0])
+        if not ip.is_global or ip.is_multicast:
+            raise ValueError(f"callback_url host '{host}' resolves to a non-public address ({ip}).")
+
+
+class _NoRedirects(urllib.request.HTTPRedirectHandler):
+    # A checked public URL must not bounce the callback to an internal address.
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+_callback_opener = urllib.request.build_opener(_NoRedirects)
+
+
+def _post_json(url: str, body: bytes, timeout: float) -> int:
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"}, method="POST")
+    with _callback_opener.open(request, timeout=timeout) as response:
+        return response.status
+
+
+async def _wait_event(event: asyncio.Event, timeout: float):
+    # Not wait_for: on Python < 3.12 it can swallow a cancellation that races the event.
+    waiter = asyncio.ensure_future(event.wait())
+    try:
+        await asyncio.wait({waiter}, timeout=timeout)
+    finally:
+        waiter.cancel()
+
+
+# Store writes that hit a locked database are retried this often, with a growing delay.
+_STORE_WRITE_ATTEMPTS = 3
+_STORE_WRITE_RETRY_DELAY = 0.5
+_STORE_WRITE_FAILED = object()
+
+
+class JobRunner:
+    """
+    Runs queued jobs in this process: `concurrency` workers claim jobs from the store and
+    run `handler(job, payload)`, which returns the result as JSON bytes. While a job runs,
+    its lease is renewed every third of the lease period, which is also when cancellation
+    requested by another process is noticed.
+
+    `ModelUnavailableError` re-queues the job with exponential backoff (up to the store's
+    `max_attempts`); any other exception fails it. On `stop`, running jobs are handed back
+    to the queue. When a job has a callback URL, its final state is POSTed there
+    (a few attempts with backoff; delivery is recorded as the job's `callback_state`).
+    The URL is checked again before sending (see `check_callback_url`), since its host
+    may resolve differently than at submission.
+
+    Store calls wait for SQLite locks and disk syncs, so they run in threads.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        handler: Callable[[Dict[str, Any], bytes], Awaitable[bytes]],
+        concurrency: int = 2,
+        poll_interval: float = 1.0,
+        retry_base_delay: float = 5.0,
+        callback_timeout: float = 10.0,
+        callback_attempts: int = 3,
+        callback_allowed_hosts: AbstractSet[str] = frozenset(),
+        maintenance_interval: float = 60.0
+    ):
+        self.store = store
+        self.handler = handler
+        self.concurrency = max(0, concurrency)
+        self.poll_interval = poll_interval
+        self.retry_base_delay = retry_base_delay
+        self.callback_timeout = callback_timeout
+        self.callback_attempts = max(1, callback_attempts)
+        self.callback_allowed_hosts = callback_allowed_hosts
+        self.maintenance_interval = maintenance_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._running: Dict[str, "asyncio.Future"] = {}
+        self._loops: List["asyncio.Task"] = []
+        self._callbacks: set = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopped: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    def start(self):
+        if self.concurrency == 0:
+            logger.info("Job runner disabled in this process (job_workers=0); jobs are only accepted here.")
+            return
+        self._wakeup = asyncio.Event()
+        self._stopped = asyncio.Event()
+        self._loops = [asyncio.ensure_future(self._worker_loop()) for _ in range(self.concurrency)]
+        self._loops.append(asyncio.ensure_future(self._maintenance_loop()))
+        logger.info(f"Job runner {self.worker_id} started with {self.concurrency} workers.")
+
+    def notify(self):
+        """Wakes idle workers, e.g. right after a submission, instead of waiting for the next poll."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def cancel_local(self, job_id: str):
+        """Stops a job running in this process right away; the store must already be flagged."""
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+
+    async def stop(self, timeout: float = 10.0):
+        self._stopping = True
+        if self._stopped is not None:
+            self._stopped.set()
+        for task in list(self._running.values()):
+            task.cancel()
+        self.notify()
+        if self._loops:
+            await asyncio.wait(self._loops, timeout=timeout)
+        for task in self._loops:
+            task.cancel()
+        if self._callbacks:
+            await asyncio.wait(self._callbacks, timeout=self.callback_timeout)
+
+    def describe(self) -> Dict[str, Any]:
+        return {"worker_id": self.worker_id, "workers": self.concurrency, "running_here": len(self._running)}
+
+    async def _worker_loop(self):
+        while not self._stopping:
+            try:
+                claimed = await asyncio.to_thread(self.store.claim, self.worker_id)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to claim a job: {e}")
+                claimed = None
+            if claimed is None:
+                await _wait_event(self._wakeup, self.poll_interval)
+                self._wakeup.clear()
+                continue
+            await self._execute(*claimed)
+
+    async def _maintenance_loop(self):
+        while not self._stopping:
+            try:
+                await asyncio.to_thread(self.store.purge_expired)
+            except sqlite3.Error as e:
+                logger.error(f"Job queue maintenance failed: {e}")
+            await _wait_event(self._stopped, self.maintenance_interval)
+
+    async def _store_write(self, action: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Runs a store call in a thread, retrying SQLite errors (e.g. "database is locked")
+        a few times. Returns `_STORE_WRITE_FAILED` when it keeps failing, so one bad write
+        never ends a worker; a job left running is queued again once its lease expires.
+        """
+        for attempt in range(1, _STORE_WRITE_ATTEMPTS + 1):
+            try:
+                return await asyncio.to_thread(fn, *args, **kwargs)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to {action} (attempt {attempt}/{_STORE_WRITE_ATTEMPTS}): {e}")
+                if attempt < _STORE_WRITE_ATTEMPTS:
+                    await asyncio.sleep(_STORE_WRITE_RETRY_DELAY * attempt)
+        return _STORE_WRITE_FAILED
+
+    async def _execute(self, job: Dict[str, Any], payload: bytes):
+        job_id = job["job_id"]
+        started = time.perf_counter()
+        task = asyncio.ensure_future(self.handler(job, payload))
+        self._running[job_id] = task
+        lost = False
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=self.store.lease_seconds / 3)
+                if done:
+                    break
+                try:
+                    lease = await asyncio.to_thread(self.store.renew, job_id, self.worker_id)
+                except sqlite3.Error as e:
+                    logger.error(f"Failed to renew the lease of job {job_id}, retrying: {e}")
+                    continue
+                if lease != "ok":
+                    lost = lease == "lost"
+                    logger.info(f"Stopping job {job_id}: {'lease lost' if lost else 'cancellation requested'}.")
+                    task.cancel()
+        finally:
+            self._running.pop(job_id, None)
+
+        action = f"record the outcome of job {job_id}"
+        recorded: Any = None
+        if lost:
+            outcome = "lost"
+        elif task.cancelled():
+            if self._stopping:
+                recorded = await self._store_write(action, self.store.release, job_id, self.worker_id)
+                outcome = "released"
+            else:
+                recorded = await self._store_write(
+                    action, self.store.finish, job_id, self.worker_id, "cancelled", error="Cancelled by request."
+                )
+                outcome = "cancelled"
+        elif isinstance(task.exception(), ModelUnavailableError):
+            delay = self.retry_base_delay * 2 ** (job["attempts"] - 1)
+            recorded = await self._store_write(action, self.store.retry_later, job_id, self.worker_id, str(task.exception()), delay)
+            outcome = "retry" if recorded == "queued" else recorded
+        elif task.exception() is not None:
+            error = task.exception()
+            logger.error(f"Job {job_id} failed: {error}", exc_info=error)
+            recorded = await self._store_write(action, self.store.finish, job_id, self.worker_id, "failed", error=str(error))
+            outcome = "failed"
+        else:
+            recorded = await self._store_write(action, self.store.finish, job_id, self.worker_id, "succeeded", result=task.result())
+            outcome = "succeeded"
+        if recorded is _STORE_WRITE_FAILED:
+            outcome = "unrecorded"
+        JOB_RUN_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
+        logger.info(f"Job {job_id} of user '{job['user_id']}' attempt {job['attempts']}: {outcome}.")
+
+        if outcome in FINISHED_STATES and job.get("callback_url"):
+            callback = asyncio.ensure_future(self._send_callback(job_id, job["callback_url"]))
+            self._callbacks.add(callback)
+            callback.add_done_callback(self._callbacks.discard)
+
+    async def _send_callback(self, job_id: str, url: str):
+        job = await self._store_write(f"load job {job_id} for its callback", self.store.get, job_id)
+        if job is None or job is _STORE_WRITE_FAILED:
+            return
+        try:
+            await asyncio.to_thread(check_callback_url, url, self.callback_allowed_hosts)
+        except ValueError as e:
+            logger.warning(f"Not sending the callback for job {job_id}: {e}")
+            JOB_CALLBACKS.inc(outcome="rejected")
+            await self._store_write(f"record the callback state of job {job_id}", self.store.set_callback_state, job_id, "rejected")
+            return
+        body = dumps(job)
+        for attempt in range(1, self.callback_attempts + 1):
+            try:
+                status = await asyncio.to_thread(_post_json, url, body, self.callback_timeout)
+                JOB_CALLBACKS.inc(outcome="delivered")
+                await self._store_write(
+                    f"record the callback state of job {job_id}", self.store.set_callback_state, job_id, f"delivered ({status})"
+                )
+                return
+            except (urllib.error.URLError, OSError, ValueError) as e:
+                logger.warning(f"Callback for job {job_id} to {url} failed (attempt {attempt}/{self.callback_attempts}): {e}")
+                if attempt < self.callback_attempts:
+                    await asyncio.sleep(self.retry_base_delay * 2 ** (attempt - 1))
+        JOB_CALLBACKS.inc(outcome="failed")
+        await self._store_write(f"record the callback state of job {job_id}", self.store.set_callback_state, job_id, "failed")
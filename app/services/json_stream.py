@@ -0,0 +1,127 @@
+import json
+import logging
+import re
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Only these characters change the scanner's state; everything between them is skipped in C.
+_SIGNIFICANT = re.compile(r'[\[\]{}"\\]')
+_STRING_SIGNIFICANT = re.compile(r'["\\]')
+
+
+class IncrementalJSONParser:
+    """
+    Extracts JSON objects from model output fed in arbitrary pieces.
+
+    With `require_array` (the subscription and alternatives prompts ask for a JSON
+    list), every top-level object of the first array is returned by `feed` as soon as
+    its closing brace arrives. Text around the array, such as prose or ```json fences,
+    is ignored. Without it, top-level objects are taken wherever they appear.
+
+    An array that closes without containing any object (an empty answer, or brackets in
+    prose) does not end the scan, so a later array is still found. Objects that fail to
+    decode are counted in `invalid_objects` and skipped. If the output stops mid-array,
+    whatever closed before the cut is kept and `truncated` is set by `close()`.
+    """
+
+    def __init__(self, require_array: bool = True):
+        self.require_array = require_array
+        self.found_array = False
+        self.array_closed = False
+        self.truncated = False
+        self.objects_parsed = 0
+        self.invalid_objects = 0
+        self._array_depth = 0
+        self._objects_in_array = 0
+        self._object_depth = 0
+        self._in_string = False
+        self._escape_pending = False
+        self._pieces: List[str] = []
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        completed: List[Dict[str, Any]] = []
+        pos = 0
+        start = 0 if self._object_depth else None
+        if self._escape_pending and text:
+            # The previous piece ended on a backslash inside a string; skip the escaped character.
+            self._escape_pending = False
+            pos = 1
+
+        while pos < len(text) and not self.array_closed:
+            match = (_STRING_SIGNIFICANT if self._in_string else _SIGNIFICANT).search(text, pos)
+            if match is None:
+                break
+            char, index = match.group(), match.start()
+            pos = index + 1
+
+            if self._in_string:
+                if char == "\\":
+                    if pos < len(text):
+                        pos += 1
+                    else:
+                        self._escape_pending = True
+                else:
+                    self._in_string = False
+                continue
+
+            if self._object_depth:
+                if char == '"':
+                    self._in_string = True
+                elif char in "{[":
+                    self._object_depth += 1
+                elif char in "}]":
+                    self._object_depth -= 1
+                    if self._object_depth == 0:
+                        self._pieces.append(text[start:pos])
+                        self._decode("".join(self._pieces), completed)
+                        self._pieces = []
+                        start = None
+                continue
+
+            # Between objects: only array brackets and the start of the next object matter.
+            if char == "[":
+                if not self._array_depth:
+                    self._objects_in_array = 0
+                self._array_depth += 1
+                self.found_array = True
+            elif char == "]" and self._array_depth:
+                self._array_depth -= 1
+                self.array_closed = self._array_depth == 0 and self._objects_in_array > 0
+            elif char == "{" and (self._array_depth or not self.require_array):
+                self._objects_in_array += 1
+                self._object_depth = 1
+                start = index
+
+        if self._object_depth and start is not None:
+            self._pieces.append(text[start:])
+        return completed
+
+    def _decode(self, raw: str, completed: List[Dict[str, Any]]):
+        try:
+            value = json.loads(raw)
+        except json.JSONDecodeError as e:
+            self.invalid_objects += 1
+            logger.warning(f"Skipping undecodable object in model output: {e}. Object text was: '{raw[:200]}'")
+            return
+        if isinstance(value, dict):
+            self.objects_parsed += 1
+            completed.append(value)
+        else:
+            self.invalid_objects += 1
+
+    def close(self) -> "IncrementalJSONParser":
+        """Marks the end of the output; sets `truncated` if it stopped inside the array or an object."""
+        self.truncated = bool(self._object_depth or self._array_depth)
+        if self._object_depth:
+            logger.warning(f"Model output ended inside an object; discarded {sum(len(p) for p in self._pieces)} trailing characters.")
+        self._pieces = []
+        return self
+
+
+def extract_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """The first complete JSON object in `text`, ignoring any prose or fences around it."""
+    parser = IncrementalJSONParser(require_array=False)
+    for value in parser.feed(text):
+        return value
+    return None
@@ -0,0 +1,70 @@
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+STARTUP_SECONDS = metrics.registry.gauge(
+    "payright_startup_seconds", "Seconds from process start to each startup phase of this worker.", ["phase"]
+)
+READY = metrics.registry.gauge("payright_ready", "1 while this worker is warmed up and not draining.")
+
+
+def process_start_time() -> float:
+    """Wall-clock start of this process, so cold start includes interpreter boot and imports."""
+    try:
+        with open("/proc/self/stat", "rb") as f:
+            # Field 22 is the start time in clock ticks since boot; the command name (field 2) may contain spaces.
+            start_ticks = int(f.read().rsplit(b")", 1)[1].split()[19])
+        with open("/proc/uptime", "rb") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - (uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return time.time()
+
+
+class ServiceLifecycle:
+    """
+    Readiness of one worker process: "starting" until its services are built and
+    warmed up, then "ready", then "draining" once shutdown begins. Load balancers
+    should route only to workers whose `/ready` answers 200.
+    """
+
+    def __init__(self, process_started_at: Optional[float] = None):
+        self.process_started_at = process_started_at if process_started_at is not None else process_start_time()
+        self.state = "starting"
+        self.phases: Dict[str, float] = {}
+        READY.set(0)
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state == "ready"
+
+    def mark(self, phase: str) -> float:
+        """Records how long after process start `phase` was reached."""
+        seconds = max(0.0, time.time() - self.process_started_at)
+        self.phases[phase] = round(seconds, 3)
+        STARTUP_SECONDS.set(seconds, phase=phase)
+        return seconds
+
+    def mark_ready(self):
+        seconds = self.mark("ready")
+        self.state = "ready"
+        READY.set(1)
+        logger.info(f"Worker {os.getpid()} ready {seconds:.2f}s after process start ({self.phases}).")
+
+    def begin_drain(self):
+        if self.state == "draining":
+            return
+        self.state = "draining"
+        READY.set(0)
+        logger.info(f"Worker {os.getpid()} draining: finishing in-flight requests.")
+
+    def describe(self) -> Dict[str, Any]:
+        return {"state": self.state, "pid": os.getpid(), "startup_seconds": dict(self.phases)}
+
+
+lifecycle = ServiceLifecycle()
@@ -0,0 +1,335 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets (seconds) shared by the stage and model histograms.
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """
+    Base for labelled metrics. Values are keyed by the label-value tuple and guarded by
+    one lock per metric; recording is a dict lookup plus an add, cheap enough for hot paths.
+    """
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}", *self.samples()]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, value: float, **labels: str):
+        """Overwrites the value; counters only use this to mirror totals kept elsewhere."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels: str):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (non-cumulative, last slot is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class MetricsRegistry:
+    """
+    Holds this worker's metrics and renders them in the Prometheus text exposition format.
+    `collectors` are called at scrape time for values that live elsewhere (e.g. cache stats).
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], None]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.error(f"Metrics collector {collector!r} failed: {e}")
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "payright_stage_duration_seconds",
+    "Time spent in each analysis pipeline stage.",
+    ["stage"]
+)
+MODEL_CALL_SECONDS = registry.histogram(
+    "payright_model_call_duration_seconds",
+    "Model call latency, excluding time spent waiting for a concurrency slot.",
+    ["kind", "outcome"]
+)
+FIRST_RESULT_SECONDS = registry.histogram(
+    "payright_model_first_result_seconds",
+    "Time from starting a streamed chunk analysis to parsing its first subscription."
+)
+MODEL_CALLS_IN_FLIGHT = registry.gauge("payright_model_calls_in_flight", "Model calls currently awaiting a response.")
+MODEL_CALLS_WAITING = registry.gauge("payright_model_calls_waiting", "Model calls queued for a concurrency slot.")
+PROMPT_CHARS = registry.counter("payright_prompt_chars_total", "Characters sent to the model.", ["kind"])
+PROMPT_TOKENS = registry.counter("payright_prompt_tokens_estimated_total", "Estimated tokens sent to the model.", ["kind"])
+RESPONSE_CHARS = registry.counter("payright_response_chars_total", "Characters received from the model.", ["kind"])
+RESPONSE_TOKENS = registry.counter("payright_response_tokens_estimated_total", "Estimated tokens received from the model.", ["kind"])
+RESPONSE_PARSE_FAILURES = registry.counter(
+    "payright_response_parse_failures_total",
+    "Model responses that could not be parsed into the expected JSON shape.",
+    ["kind"]
+)
+VALIDATION_FAILURES = registry.counter(
+    "payright_validation_failures_total",
+    "Model-produced records dropped because they failed schema validation.",
+    ["model"]
+)
+HTTP_REQUESTS = registry.counter("payright_http_requests_total", "HTTP requests handled.", ["method", "path", "status"])
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "payright_http_request_duration_seconds",
+    "Time to handle a request, including streaming the response body.",
+    ["method", "path"]
+)
+HTTP_REQUESTS_IN_FLIGHT = registry.gauge("payright_http_requests_in_flight", "HTTP requests currently being handled.", ["path"])
+
+
+# --- Request-scoped tracing ---
+# A trace is a list of (span name, start offset, duration) bound to the current request
+# through a context variable, so it follows the request across awaits and gather()ed
+# tasks. When no trace is active, `stage()` only feeds the histogram.
+
+_current_trace: contextvars.ContextVar[Optional["RequestTrace"]] = contextvars.ContextVar("payright_trace", default=None)
+
+
+class RequestTrace:
+    __slots__ = ("name", "started", "spans")
+
+    # Large batch requests run thousands of stages; beyond this only the histograms see them.
+    max_spans = 1000
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float, float]] = []
+
+    def server_timing(self, limit: int = 20) -> str:
+        """Aggregated spans as a `Server-Timing` header value (durations in ms)."""
+        totals: Dict[str, float] = {}
+        for name, _, duration in self.spans:
+            totals[name] = totals.get(name, 0.0) + duration
+        return ", ".join(f"{name.replace('.', '_')};dur={duration * 1000:.1f}" for name, duration in list(totals.items())[:limit])
+
+    def summary(self) -> str:
+        return ", ".join(f"{name}@{offset * 1000:.1f}ms+{duration * 1000:.1f}ms" for name, offset, duration in self.spans)
+
+
+@contextmanager
+def stage(name: str):
+    """Times a pipeline stage into `STAGE_SECONDS` and, if a trace is active, records a span."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        STAGE_SECONDS.observe(duration, stage=name)
+        trace = _current_trace.get()
+        if trace is not None and len(trace.spans) < trace.max_spans:
+            trace.spans.append((name, started - trace.started, duration))
+
+
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware (no per-request Request objects) that counts requests, tracks
+    in-flight requests and latency per route, and, with `tracing` on, runs each request
+    under a `RequestTrace`: spans are returned in a `Server-Timing` header and logged
+    for requests slower than `slow_request_seconds`.
+
+    Requests are labelled with the template of the route that served them
+    (`/jobs/{job_id}`), which the router puts in `scope["route"]`; unrouted requests
+    are "other", so scans for random URLs cannot blow up cardinality. A request counts
+    as in flight from the first time its endpoint receives or sends a message.
+    """
+
+    def __init__(self, app, tracing: bool = False, slow_request_seconds: float = 2.0):
+        self.app = app
+        self.tracing = tracing
+        self.slow_request_seconds = slow_request_seconds
+
+    @staticmethod
+    def _path_label(scope) -> Optional[str]:
+        """The route template once the router has matched the request, else None."""
+        route = scope.get("route")
+        return getattr(route, "path", None) if route is not None else None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        state = {"code": 500, "path": None}
+        trace = RequestTrace(method) if self.tracing else None
+
+        def mark_routed():
+            if state["path"] is None:
+                state["path"] = self._path_label(scope)
+                if state["path"] is not None:
+                    HTTP_REQUESTS_IN_FLIGHT.inc(path=state["path"])
+
+        async def receive_wrapper():
+            mark_routed()
+            return await receive()
+
+        async def send_wrapper(message):
+            mark_routed()
+            if message["type"] == "http.response.start":
+                state["code"] = message["status"]
+                if trace is not None and trace.spans:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                    message = dict(message, headers=headers)
+            await send(message)
+
+        started = time.perf_counter()
+        token = _current_trace.set(trace) if trace is not None else None
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            if token is not None:
+                _current_trace.reset(token)
+            duration = time.perf_counter() - started
+            if state["path"] is not None:
+                HTTP_REQUESTS_IN_FLIGHT.dec(path=state["path"])
+            path = state["path"] or self._path_label(scope) or "other"
+            HTTP_REQUESTS.inc(method=method, path=path, status=str(state["code"]))
+            HTTP_REQUEST_SECONDS.observe(duration, method=method, path=path)
+            if trace is not None and duration >= self.slow_request_seconds:
+                logger.warning(f"Slow request {method} {path} took {duration * 1000:.0f}ms: {trace.summary()}")
@@ -0,0 +1,300 @@
+import asyncio
+import json
+import logging
+import random
+import re
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# --- Safety Settings (Adjust as needed) ---
+# See https://ai.google.dev/docs/safety_setting_gemini
+# For financial data, you might want to be cautious.
+# These are examples, review Google's documentation.
+safety_settings = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+]
+
+generation_config = {
+    # "candidate_count": 1, # Default
+    # "stop_sequences": None, # Default
+    # "max_output_tokens": 8192, # For Gemini 1.5 Flash
+    "temperature": 0.3, # Lower for more deterministic, factual output
+    # "top_p": 1.0, # Default
+    # "top_k": None, # Default
+}
+
+
+class ModelBackendError(Exception):
+    """Raised by a backend when a generation call fails."""
+
+
+class ModelBackend:
+    """
+    Text-in, text-out interface that GeminiService talks to.
+    Implementations must provide `generate`; `generate_async` defaults to running
+    it in the event loop's executor so it never blocks request handling.
+    """
+
+    name = "base"
+
+    def fingerprint(self) -> str:
+        """Identifies everything that changes the backend's answers; used in cache keys."""
+        return self.name
+
+    def generate(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    async def generate_async(self, prompt: str) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.generate, prompt)
+
+    async def generate_stream_async(self, prompt: str) -> AsyncIterator[str]:
+        """Yields the answer in pieces as the model produces it; by default all at once."""
+        yield await self.generate_async(prompt)
+
+
+class GeminiBackend(ModelBackend):
+    """Google Gemini via `google.generativeai`, imported only when this backend is built."""
+
+    name = "gemini"
+
+    def __init__(self, model_name: str, api_key: Optional[str]):
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(
+            model_name,
+            safety_settings=safety_settings,
+            generation_config=genai.types.GenerationConfig(**generation_config)
+        )
+
+    def fingerprint(self) -> str:
+        return f"gemini|{self.model_name}|{generation_config!r}|{safety_settings!r}"
+
+    def generate(self, prompt: str) -> str:
+        return self.model.generate_content(prompt).text
+
+    async def generate_async(self, prompt: str) -> str:
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+    async def generate_stream_async(self, prompt: str) -> AsyncIterator[str]:
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            yield chunk.text
+
+
+_TRANSACTION_LINE_RE = re.compile(
+    r'^- ID: (?P<id>[^,]+), Date: (?P<date>\d{4}-\d{2}-\d{2}), Description: "(?P<description>.*)", Amount: (?P<amount>-?[\d.]+) (?P<currency>\S+)\s*$',
+    re.MULTILINE
+)
+_COMPACT_BASE_DATE_RE = re.compile(r"^Base date: (?P<date>\d{4}-\d{2}-\d{2})", re.MULTILINE)
+_COMPACT_CURRENCY_RE = re.compile(r"^Currency: (?P<currency>\S+)", re.MULTILINE)
+_COMPACT_MERCHANT_RE = re.compile(r"^(?P<code>m\d+)=(?P<name>.*)$", re.MULTILINE)
+_COMPACT_ROW_RE = re.compile(
+    r"^(?P<id>\d+)\|(?P<days>-?\d+)\|(?P<merchant>m\d+)\|(?P<amount>-?[\d.]+)(?:\|(?P<currency>\S+))?\s*$",
+    re.MULTILINE
+)
+_TRANSACTION_SECTION_RE = re.compile(
+    r"=== SECTION (?P<id>\S+) .*?===\n(?P<body>.*?)=== END SECTION (?P=id) ===",
+    re.DOTALL
+)
+_EMAIL_SUBJECT_RE = re.compile(r'Email Subject \(if available\): "(?P<subject>.*)"')
+_EMAIL_SECTION_RE = re.compile(
+    r"=== EMAIL (?P<id>.+?) ===\nSubject: (?P<subject>.*?)\n(?P<body>.*?)\n=== END EMAIL (?P=id) ===",
+    re.DOTALL
+)
+_FAKE_AMOUNT_RE = re.compile(r"[$€£]\s?(?P<amount>\d+(?:\.\d{2})?)")
+_FAKE_DATE_RE = re.compile(r"\b\d{4}-\d{2}-\d{2}\b")
+_SUBJECT_STOPWORDS = {"your", "the", "a", "receipt", "invoice", "payment", "for", "from", "order", "subscription", "renewal", "-", ":"}
+_ALTERNATIVES_SERVICE_RE = re.compile(r'alternatives to the subscription service "(?P<service>[^"]+)"')
+
+
+class FakeBackend(ModelBackend):
+    """
+    Deterministic local stand-in for the real model, for offline tests and benchmarks.
+
+    Without `responder`, answers are generated from the prompt by simple rules:
+    transaction prompts (verbose or compact, single or sectioned) return every
+    description seen at least twice as a monthly subscription, email prompts (single
+    or batched) return a receipt when the subject looks like one, and alternatives
+    prompts return an empty list. `latency_ms` (+ uniform `latency_jitter_ms`) is
+    awaited per call and a seeded `error_rate` fraction of calls raise
+    `ModelBackendError`, so runs are reproducible. Streamed answers arrive in
+    `stream_chunk_chars` pieces with the latency spread across them.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        latency_jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+        responder: Optional[Union[str, Callable[[str], str]]] = None,
+        stream_chunk_chars: int = 64
+    ):
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.responder = responder
+        self.stream_chunk_chars = max(1, stream_chunk_chars)
+        self.calls = 0
+        self._rng = random.Random(seed)
+
+    def fingerprint(self) -> str:
+        return f"fake|{self.responder!r}"
+
+    def _next_delay_and_failure(self):
+        self.calls += 1
+        delay = (self.latency_ms + self._rng.uniform(0, self.latency_jitter_ms)) / 1000.0
+        return delay, self._rng.random() < self.error_rate
+
+    def _answer(self, prompt: str) -> str:
+        if callable(self.responder):
+            return self.responder(prompt)
+        if self.responder is not None:
+            return self.responder
+        if "recurring subscriptions" in prompt and "=== SECTION " in prompt:
+            return json.dumps([
+                dict(sub, section=section["id"])
+                for section in _TRANSACTION_SECTION_RE.finditer(prompt)
+                for sub in self._detect_subscriptions(section["body"])
+            ])
+        if "recurring subscriptions" in prompt:
+            return json.dumps(self._detect_subscriptions(prompt))
+        if "extracts transaction information from a batch of emails" in prompt:
+            return json.dumps(self._extract_receipt_batch(prompt))
+        if "extracts transaction information from emails" in prompt:
+            return self._extract_receipt(prompt)
+        if _ALTERNATIVES_SERVICE_RE.search(prompt):
+            return "[]"
+        return "null"
+
+    @staticmethod
+    def _prompt_rows(prompt: str) -> List[Dict[str, str]]:
+        """Transaction rows of a verbose or compact prompt, as id/date/description/amount/currency."""
+        base_date = _COMPACT_BASE_DATE_RE.search(prompt)
+        if base_date is None:
+            return [row.groupdict() for row in _TRANSACTION_LINE_RE.finditer(prompt)]
+        base = date.fromisoformat(base_date["date"])
+        default_currency = _COMPACT_CURRENCY_RE.search(prompt)
+        merchants = {m["code"]: m["name"] for m in _COMPACT_MERCHANT_RE.finditer(prompt)}
+        return [
+            {
+                "id": row["id"],
+                "date": (base + timedelta(days=int(row["days"]))).isoformat(),
+                "description": merchants.get(row["merchant"], row["merchant"]),
+                "amount": row["amount"],
+                "currency": row["currency"] or (default_currency["currency"] if default_currency else "USD"),
+            }
+            for row in _COMPACT_ROW_RE.finditer(prompt)
+        ]
+
+    def _detect_subscriptions(self, prompt: str) -> List[Dict[str, Any]]:
+        groups: Dict[tuple, List[Dict[str, str]]] = defaultdict(list)
+        for row in self._prompt_rows(prompt):
+            groups[(row["description"].strip().lower(), row["currency"])].append(row)
+
+        subscriptions = []
+        for (description, currency), rows in groups.items():
+            if len(rows) < 2:
+                continue
+            rows.sort(key=lambda r: r["date"])
+            amounts = [Decimal(r["amount"]) for r in rows]
+            subscriptions.append({
+                "name": description.title(),
+                "transaction_ids": [r["id"] for r in rows],
+                "average_amount": float(sum(amounts) / len(amounts)),
+                "currency": currency,
+                "detected_frequency": "monthly",
+                "first_transaction_date": rows[0]["date"],
+                "last_transaction_date": rows[-1]["date"],
+                "confidence_score": 0.8,
+                "potential_next_billing_date": None,
+            })
+        return subscriptions
+
+    def _extract_receipt(self, prompt: str) -> str:
+        subject = _EMAIL_SUBJECT_RE.search(prompt)
+        subject_text = subject["subject"] if subject else ""
+        if not re.search(r"receipt|invoice|subscription|payment", subject_text, re.IGNORECASE):
+            return "null"
+        return json.dumps({
+            "merchant_name": subject_text.split()[0] if subject_text.split() else "Unknown",
+            "transaction_amount": 9.99,
+            "currency": "USD",
+            "transaction_date": "2023-03-01",
+            "is_recurring": "subscription" in subject_text.lower(),
+            "recurrence_details": None,
+            "items": [],
+        })
+
+    def _extract_receipt_batch(self, prompt: str) -> List[Dict[str, Any]]:
+        receipts = []
+        for section in _EMAIL_SECTION_RE.finditer(prompt):
+            subject = section["subject"]
+            if not re.search(r"receipt|invoice|subscription|payment|renew", subject, re.IGNORECASE):
+                continue
+            amount = _FAKE_AMOUNT_RE.search(section["body"])
+            charged_on = _FAKE_DATE_RE.search(section["body"])
+            merchant = next((w for w in subject.split() if w.lower() not in _SUBJECT_STOPWORDS), "Unknown")
+            receipts.append({
+                "email_id": section["id"],
+                "merchant_name": merchant,
+                "transaction_amount": float(amount["amount"]) if amount else 9.99,
+                "currency": "USD",
+                "transaction_date": charged_on.group() if charged_on else "2023-03-01",
+                "is_recurring": bool(re.search(r"subscription|renew", subject, re.IGNORECASE)),
+                "recurrence_details": None,
+            })
+        return receipts
+
+    def generate(self, prompt: str) -> str:
+        delay, fail = self._next_delay_and_failure()
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise ModelBackendError("Injected fake backend failure.")
+        return self._answer(prompt)
+
+    async def generate_async(self, prompt: str) -> str:
+        delay, fail = self._next_delay_and_failure()
+        if delay:
+            await asyncio.sleep(delay)
+        if fail:
+            raise ModelBackendError("Injected fake backend failure.")
+        return self._answer(prompt)
+
+    async def generate_stream_async(self, prompt: str) -> AsyncIterator[str]:
+        delay, fail = self._next_delay_and_failure()
+        if fail:
+            await asyncio.sleep(delay)
+            raise ModelBackendError("Injected fake backend failure.")
+        answer = self._answer(prompt)
+        pieces = [answer[i:i + self.stream_chunk_chars] for i in range(0, len(answer), self.stream_chunk_chars)] or [""]
+        for piece in pieces:
+            await asyncio.sleep(delay / len(pieces))
+            yield piece
+
+
+def build_model_backend(settings: Any, model_name: Optional[str] = None) -> ModelBackend:
+    """Creates the backend selected by `settings.model_backend`."""
+    if settings.model_backend == "fake":
+        return FakeBackend(
+            latency_ms=settings.fake_model_latency_ms,
+            latency_jitter_ms=settings.fake_model_latency_jitter_ms,
+            error_rate=settings.fake_model_error_rate,
+            seed=settings.fake_model_seed
+        )
+    return GeminiBackend(model_name or settings.gemini_model_name, settings.gemini_api_key)
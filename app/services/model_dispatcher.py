@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from app.models.schemas import TransactionInput
+from app.services import metrics
+from app.services.resilience import ModelUnavailableError
+
+logger = logging.getLogger(__name__)
+
+DISPATCH_REQUESTS = metrics.registry.counter(
+    "payright_dispatch_requests_total",
+    "Transaction analyses by how the dispatcher served them: direct, batched, coalesced, cached or streamed.",
+    ["route"]
+)
+DISPATCH_BATCH_SIZE = metrics.registry.histogram(
+    "payright_dispatch_batch_requests",
+    "Analyses packed into one batched model call.",
+    buckets=(2, 3, 4, 6, 8, 12, 16, 32)
+)
+DISPATCH_BATCH_WAIT_SECONDS = metrics.registry.histogram(
+    "payright_dispatch_batch_wait_seconds",
+    "Time an analysis waited in the batching window before its model call was sent.",
+    buckets=(0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25)
+)
+DISPATCH_IN_FLIGHT = metrics.registry.gauge(
+    "payright_dispatch_in_flight", "Distinct analyses in flight that identical requests can join."
+)
+
+
+class _Pending:
+    __slots__ = ("transactions", "tokens", "future", "enqueued_at")
+
+    def __init__(self, transactions: List[TransactionInput], tokens: int, future: "asyncio.Future"):
+        self.transactions = transactions
+        self.tokens = tokens
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class ModelCallDispatcher:
+    """
+    Sits in front of `GeminiService` for transaction analyses.
+
+    Coalescing: identical analyses (same transactions and cache flag) that overlap in
+    time share one computation, so client retries and double submits cost one model call.
+
+    Micro-batching: with `window_ms` > 0, an analysis that fits one prompt and is not in
+    the cache waits up to `window_ms` for others. Up to `max_batch_size` of them, with at
+    most the service's `chunk_max_tokens` of transaction data, go out as one model call
+    with a section per analysis, and the answer is split back to the callers. A window
+    that closes with a single analysis sends it the usual way. Analyses whose section a
+    truncated answer never reached, or whose batch failed for another reason than the
+    model being unavailable, are retried on their own.
+
+    Streamed analyses (`on_subscription`) and histories that need several chunks go
+    straight to the service.
+    """
+
+    def __init__(self, service, window_ms: float = 0.0, max_batch_size: int = 8, coalesce: bool = True):
+        self.service = service
+        self.window = max(0.0, window_ms) / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self.coalesce = coalesce
+        self.stats: Dict[str, int] = {"direct": 0, "batched": 0, "coalesced": 0, "cached": 0, "streamed": 0, "batches": 0}
+        self._in_flight: Dict[str, "asyncio.Future"] = {}
+        self._queue: List[_Pending] = []
+        self._queued_tokens = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._batch_tasks: set = set()
+
+    def _count(self, route: str):
+        self.stats[route] += 1
+        DISPATCH_REQUESTS.inc(route=route)
+
+    async def analyze(
+        self,
+        transactions: List[TransactionInput],
+        use_cache: bool = True,
+        on_subscription: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> List[Dict[str, Any]]:
+        """Same contract as `GeminiService.analyze_transactions_for_subscriptions_async`."""
+        if not transactions:
+            return []
+        if on_subscription is not None:
+            self._count("streamed")
+            return await self.service.analyze_transactions_for_subscriptions_async(
+                transactions, use_cache=use_cache, on_subscription=on_subscription
+            )
+
+        cache_key = self.service.transactions_cache_key(transactions)
+        flight_key = f"{cache_key}|{use_cache}"
+        shared = self._in_flight.get(flight_key) if self.coalesce else None
+        if shared is not None:
+            self._count("coalesced")
+            return await asyncio.shield(shared)
+
+        task = asyncio.ensure_future(self._compute(transactions, cache_key, use_cache))
+        if self.coalesce:
+            self._in_flight[flight_key] = task
+            DISPATCH_IN_FLIGHT.set(len(self._in_flight))
+            task.add_done_callback(lambda t: self._forget(flight_key, t))
+        # Shielded so that one caller going away does not cancel the analysis for the others.
+        return await asyncio.shield(task)
+
+    def _forget(self, flight_key: str, task: "asyncio.Future"):
+        if self._in_flight.get(flight_key) is task:
+            del self._in_flight[flight_key]
+        DISPATCH_IN_FLIGHT.set(len(self._in_flight))
+        if not task.cancelled():
+            task.exception()  # Retrieved here so an analysis nobody waits for anymore does not log a warning.
+
+    async def _compute(self, transactions: List[TransactionInput], cache_key: str, use_cache: bool) -> List[Dict[str, Any]]:
+        service = self.service
+        tokens = service.estimate_transaction_tokens(transactions)
+        if self.window <= 0 or self.max_batch_size < 2 or tokens > service.chunk_max_tokens:
+            self._count("direct")
+            return await service.analyze_transactions_for_subscriptions_async(transactions, use_cache=use_cache)
+
+        if service.cache is not None and use_cache:
+            cached = await service.cache.get_async(cache_key)
+            if cached is not None:
+                self._count("cached")
+                return cached
+
+        result = await self._enqueue(transactions, tokens)
+        if result is None:
+            # Alone in its window, or not answered by its batch: the normal path (which also caches).
+            self._count("direct")
+            return await service.analyze_transactions_for_subscriptions_async(transactions, use_cache=False)
+        self._count("batched")
+        if service.cache is not None and result:
+            await service.cache.set_async(cache_key, result)
+        return result
+
+    def _enqueue(self, transactions: List[TransactionInput], tokens: int) -> "asyncio.Future":
+        loop = asyncio.get_running_loop()
+        if self._queue and self._queued_tokens + tokens > self.service.chunk_max_tokens:
+            self._flush()
+        pending = _Pending(transactions, tokens, loop.create_future())
+        self._queue.append(pending)
+        self._queued_tokens += tokens
+        if len(self._queue) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window, self._flush)
+        return pending.future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._queue, self._queued_tokens = self._queue, [], 0
+        now = time.perf_counter()
+        for pending in batch:
+            DISPATCH_BATCH_WAIT_SECONDS.observe(now - pending.enqueued_at)
+        if len(batch) == 1:
+            if not batch[0].future.done():
+                batch[0].future.set_result(None)
+            return
+        if not batch:
+            return
+        self.stats["batches"] += 1
+        DISPATCH_BATCH_SIZE.observe(len(batch))
+        task = asyncio.ensure_future(self._run_batch(batch))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run_batch(self, batch: List[_Pending]):
+        try:
+            results = await self.service.analyze_transaction_groups_async([pending.transactions for pending in batch])
+        except ModelUnavailableError as e:
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+            return
+        except Exception as e:
+            logger.error(f"Batched analysis of {len(batch)} requests failed, retrying them one by one: {e}", exc_info=True)
+            results = [None] * len(batch)
+        for pending, result in zip(batch, results):
+            if not pending.future.done():
+                pending.future.set_result(result)
+
+    def describe(self) -> Dict[str, Any]:
+        return dict(
+            self.stats,
+            window_ms=self.window * 1000.0,
+            max_batch_size=self.max_batch_size,
+            coalesce=self.coalesce,
+            in_flight=len(self._in_flight),
+            queued=len(self._queue)
+        )
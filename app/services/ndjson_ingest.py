@@ -0,0 +1,72 @@
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.models.schemas import TransactionInput
+from app.services.codecs import TRANSACTION
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionLimitExceeded(Exception):
+    """Raised when an upload exceeds the per-request row or line-size limits."""
+
+
+async def iter_ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[bytes]:
+    """
+    Re-frames an arbitrary byte stream (e.g. a chunked request body) into NDJSON lines.
+    Only the current partial line is buffered, and it may not grow past `max_line_bytes`.
+    """
+    buffer = b""
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        buffer += chunk
+        start = 0
+        while True:
+            newline = buffer.find(b"\n", start)
+            if newline < 0:
+                break
+            yield buffer[start:newline]
+            start = newline + 1
+        buffer = buffer[start:]
+        if len(buffer) > max_line_bytes:
+            raise IngestionLimitExceeded(f"A line exceeds the maximum of {max_line_bytes} bytes.")
+    if buffer:
+        yield buffer
+
+
+async def iter_ndjson_transactions(
+    chunks: AsyncIterator[bytes],
+    max_line_bytes: int = 65536,
+    max_rows: int = 250000,
+    errors: Optional[List[Dict[str, Any]]] = None,
+    max_reported_errors: int = 50
+) -> AsyncIterator[TransactionInput]:
+    """
+    Parses and validates `TransactionInput` rows one NDJSON line at a time.
+
+    Invalid lines are skipped; if `errors` is given, up to `max_reported_errors` of
+    them are appended as {"line", "error"} and the rest are only counted in the
+    final log line. Raises `IngestionLimitExceeded` once more than `max_rows` valid
+    rows have been read, so one upload cannot hold unbounded memory.
+    """
+    line_number = 0
+    accepted = 0
+    rejected = 0
+    async for raw_line in iter_ndjson_lines(chunks, max_line_bytes):
+        line_number += 1
+        raw_line = raw_line.strip()
+        if not raw_line:
+            continue
+        try:
+            tx = TRANSACTION.validate_json(raw_line)
+        except Exception as e:
+            rejected += 1
+            if errors is not None and len(errors) < max_reported_errors:
+                errors.append({"line": line_number, "error": str(e)})
+            continue
+        accepted += 1
+        if accepted > max_rows:
+            raise IngestionLimitExceeded(f"Upload exceeds the maximum of {max_rows} transactions per request.")
+        yield tx
+    logger.info(f"NDJSON ingestion read {line_number} lines: {accepted} transactions accepted, {rejected} rejected.")
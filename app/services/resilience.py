@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from app.services import metrics
+from app.services.model_backends import ModelBackendError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# HTTP statuses (as used by google.api_core exceptions) worth retrying.
+_RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+_RETRYABLE_EXCEPTION_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "DeadlineExceeded", "GatewayTimeout", "BadGateway", "RetryError",
+}
+
+RETRIES = metrics.registry.counter("payright_model_retries_total", "Model call attempts retried after a retryable error.")
+HEDGES = metrics.registry.counter("payright_model_hedges_total", "Hedged duplicate model calls.", ["result"])
+CIRCUIT_REJECTIONS = metrics.registry.counter("payright_model_circuit_rejections_total", "Model calls fast-failed by the open circuit.")
+
+
+class ModelUnavailableError(Exception):
+    """The model could not produce an answer: retries exhausted, deadline hit or circuit open."""
+
+
+class CircuitOpenError(ModelUnavailableError):
+    pass
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Timeouts, rate limiting and 5xx responses; request-specific errors (bad prompt, safety block) are not."""
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError, ModelBackendError)):
+        return True
+    code = getattr(exc, "code", None)
+    if isinstance(code, int) and code in _RETRYABLE_STATUS_CODES:
+        return True
+    return type(exc).__name__ in _RETRYABLE_EXCEPTION_NAMES
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `recovery_seconds`. It then lets a single probe call through (half-open):
+    success closes it again, failure re-opens it for another recovery period.
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_seconds: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_seconds = recovery_seconds
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        self._times_opened = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.recovery_seconds:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info("Model circuit breaker closed after a successful probe.")
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._probe_in_flight or (self._opened_at is None and self._consecutive_failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self._times_opened += 1
+                logger.warning(f"Model circuit breaker opened after {self._consecutive_failures} consecutive failures.")
+            self._probe_in_flight = False
+
+    def release_probe(self):
+        """Frees the half-open probe slot when the probe ended without a verdict (e.g. cancelled)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def describe(self) -> Dict[str, Any]:
+        state = self.state
+        return {
+            "state": state,
+            "consecutive_failures": self._consecutive_failures,
+            "times_opened": self._times_opened,
+            "retry_in_seconds": round(max(0.0, self._opened_at + self.recovery_seconds - time.monotonic()), 1) if state == "open" else None,
+        }
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies, for the hedging threshold."""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, fraction: float) -> float:
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ResilientCaller:
+    """
+    Runs model calls with a per-attempt deadline, exponential backoff with full jitter
+    between retryable failures, and a shared circuit breaker. With `hedge_percentile`
+    set, an attempt that is still pending after that percentile of recent latencies
+    gets a duplicate request, and whichever answers first wins. Hedging starts once
+    `hedge_min_samples` latencies have been seen.
+
+    `call` and `stream` raise `ModelUnavailableError` when no answer can be produced.
+    Non-retryable errors are re-raised unchanged and do not count against the circuit.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        deadline_seconds: Optional[float] = 60.0,
+        breaker: Optional[CircuitBreaker] = None,
+        hedge_percentile: Optional[float] = None,
+        hedge_min_samples: int = 50,
+        seed: Optional[int] = None
+    ):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline_seconds = deadline_seconds
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.latencies = LatencyTracker()
+        self._rng = random.Random(seed)
+        self.retries = 0
+        self.hedges_launched = 0
+        self.hedges_won = 0
+
+    def backoff_delay(self, attempt: int) -> float:
+        return self._rng.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _enter(self):
+        if not self.breaker.allow():
+            CIRCUIT_REJECTIONS.inc()
+            raise CircuitOpenError("Model circuit breaker is open; upstream is considered unhealthy.")
+
+    async def _after_failure(self, exc: BaseException, attempt: int, retry_allowed: bool = True):
+        """Records a failed attempt, then either raises or sleeps before the next one."""
+        if not is_retryable(exc):
+            self.breaker.release_probe()
+            raise exc
+        self.breaker.record_failure()
+        if not retry_allowed or attempt + 1 >= self.max_attempts or self.breaker.state != "closed":
+            raise ModelUnavailableError(f"Model call failed after {attempt + 1} attempt(s): {exc!r}") from exc
+        delay = self.backoff_delay(attempt)
+        self.retries += 1
+        RETRIES.inc()
+        logger.warning(f"Retryable model error ({exc!r}); retrying in {delay:.2f}s (attempt {attempt + 2}/{self.max_attempts}).")
+        await asyncio.sleep(delay)
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        attempt = 0
+        while True:
+            self._enter()
+            started = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(self._hedged(fn), self.deadline_seconds)
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                await self._after_failure(e, attempt)
+                attempt += 1
+                continue
+            self.latencies.record(time.perf_counter() - started)
+            self.breaker.record_success()
+            return result
+
+    async def _hedged(self, fn: Callable[[], Awaitable[T]]) -> T:
+        if self.hedge_percentile is None or len(self.latencies) < self.hedge_min_samples:
+            return await fn()
+
+        primary = asyncio.ensure_future(fn())
+        done, _ = await asyncio.wait({primary}, timeout=self.latencies.percentile(self.hedge_percentile))
+        if done:
+            return primary.result()
+
+        self.hedges_launched += 1
+        HEDGES.inc(result="launched")
+        hedge = asyncio.ensure_future(fn())
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedges_won += 1
+                            HEDGES.inc(result="won")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def stream(self, open_stream: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        Streams pieces from `open_stream()`. The deadline applies to the wait for each
+        piece. Failures are retried only until the first piece has been yielded; a
+        later failure raises `ModelUnavailableError`. Streams are never hedged.
+        """
+        attempt = 0
+        while True:
+            self._enter()
+            started = time.perf_counter()
+            iterator = open_stream().__aiter__()
+            yielded = False
+            try:
+                while True:
+                    try:
+                        piece = await asyncio.wait_for(iterator.__anext__(), self.deadline_seconds)
+                    except StopAsyncIteration:
+                        break
+                    yielded = True
+                    yield piece
+            except (asyncio.CancelledError, GeneratorExit):
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                await self._after_failure(e, attempt, retry_allowed=not yielded)
+                attempt += 1
+                continue
+            self.latencies.record(time.perf_counter() - started)
+            self.breaker.record_success()
+            return
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "circuit": self.breaker.describe(),
+            "retries": self.retries,
+            "hedges_launched": self.hedges_launched,
+            "hedges_won": self.hedges_won,
+            "latency_p50_seconds": round(self.latencies.percentile(0.5), 3) if len(self.latencies) else None,
+            "latency_p95_seconds": round(self.latencies.percentile(0.95), 3) if len(self.latencies) else None,
+        }
@@ -0,0 +1,111 @@
+"""
+Compares the in-heap alternatives index with the compiled, memory-mapped catalog.
+
+Reports build/compile, startup and reload timings, per-lookup latency and the Python
+heap each approach holds per worker (tracemalloc; mmap'd pages are shared through the
+OS page cache and do not show up in a worker's heap). Run from the repository root:
+
+    python -m benchmarks.alternatives_catalog --services 5000
+"""
+import argparse
+import json
+import os
+import random
+import string
+import tempfile
+import time
+import tracemalloc
+
+from app.analysis.alternatives_catalog import CompiledAlternativesIndex, ReloadingAlternativesCatalog, compile_catalog
+from app.analysis.alternatives_index import AlternativesIndex
+
+
+def _word(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def synthetic_catalog(services: int, seed: int = 7) -> dict:
+    rng = random.Random(seed)
+    catalog = {}
+    while len(catalog) < services:
+        key = f"{_word(rng, rng.randint(4, 9))} {_word(rng, rng.randint(3, 7))}"
+        catalog[key] = {
+            "aliases": [key.replace(" ", ""), f"{key.split()[0]} {_word(rng, 3)}"],
+            "alternatives": [
+                {
+                    "name": _word(rng, 8).title(),
+                    "description": " ".join(_word(rng, rng.randint(3, 9)) for _ in range(10)),
+                    "category": rng.choice(["Streaming Video", "Music Streaming", "Cloud Storage", "Productivity"]),
+                }
+                for _ in range(4)
+            ],
+        }
+    return catalog
+
+
+def _measure_heap(build):
+    tracemalloc.start()
+    started = time.perf_counter()
+    obj = build()
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, elapsed, current
+
+
+def _lookup_latency_us(index, queries) -> float:
+    started = time.perf_counter()
+    for query in queries:
+        index._lookup_uncached(tuple(query.split()))
+    return (time.perf_counter() - started) / len(queries) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", type=int, default=5000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    catalog = synthetic_catalog(args.services)
+    rng = random.Random(11)
+    keys = list(catalog)
+    queries = [f"{rng.choice(keys)} {_word(rng, 6)} {_word(rng, 5)}" for _ in range(args.lookups)]
+
+    def build_dict_index():
+        # The dict approach keeps both the raw catalog and the index in every worker.
+        raw = json.loads(json.dumps({k: v["alternatives"] for k, v in catalog.items()}))
+        aliases = {k: v["aliases"] for k, v in catalog.items()}
+        return raw, AlternativesIndex(raw, aliases)
+
+    (_, dict_index), dict_build_s, dict_heap = _measure_heap(build_dict_index)
+
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "alternatives.sqlite3")
+    compile_stats = compile_catalog(catalog, path)
+    compiled, open_s, compiled_heap = _measure_heap(lambda: CompiledAlternativesIndex(path))
+
+    reloading = ReloadingAlternativesCatalog(path, check_interval=0.0)
+    compile_catalog(catalog, path)  # Atomic replace, as a deploy would do
+    started = time.perf_counter()
+    reloading.index  # Triggers the reload
+    reload_s = time.perf_counter() - started
+
+    print(json.dumps({
+        "services": args.services,
+        "dict_index": {
+            "build_seconds": round(dict_build_s, 4),
+            "heap_bytes": dict_heap,
+            "lookup_us": round(_lookup_latency_us(dict_index, queries), 2),
+        },
+        "compiled_index": {
+            "compile": compile_stats,
+            "open_seconds": round(open_s, 4),
+            "reload_seconds": round(reload_s, 4),
+            "heap_bytes": compiled_heap,
+            "lookup_us": round(_lookup_latency_us(compiled, queries), 2),
+        },
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
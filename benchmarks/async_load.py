@@ -0,0 +1,91 @@
+"""
+Load test for the non-blocking Gemini path.
+
+Drives `GeminiService.analyze_transactions_for_subscriptions_async` with the local
+fake backend (no network, no API key needed) and reports latency percentiles under
+concurrency. Run from the repository root:
+
+    python -m benchmarks.async_load --requests 2000 --concurrency 500 --latency-ms 50
+"""
+import argparse
+import asyncio
+import decimal
+import json
+import statistics
+import time
+from datetime import date, timedelta
+from typing import List
+
+from app.models.schemas import TransactionInput
+from app.services.gemini_service import GeminiService
+from app.services.model_backends import FakeBackend
+
+
+def _make_transactions(user_id: str, count: int = 12) -> List[TransactionInput]:
+    start = date(2023, 1, 15)
+    return [
+        TransactionInput(
+            id=f"txn_{i}",
+            userId=user_id,
+            transaction_date=start + timedelta(days=30 * i),
+            description="NETFLIX.COM",
+            amount=decimal.Decimal("15.99"),
+            currency="USD",
+        )
+        for i in range(count)
+    ]
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run(requests: int, concurrency: int, latency_ms: float, max_in_flight: int) -> dict:
+    service = GeminiService(
+        model_name="fake-model",
+        max_concurrency=max_in_flight,
+        backend=FakeBackend(latency_ms=latency_ms)
+    )
+    gate = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one_call(i: int):
+        transactions = _make_transactions(f"user_{i}")
+        async with gate:
+            started = time.perf_counter()
+            await service.analyze_transactions_for_subscriptions_async(transactions)
+            latencies.append(time.perf_counter() - started)
+
+    wall_started = time.perf_counter()
+    await asyncio.gather(*(one_call(i) for i in range(requests)))
+    wall = time.perf_counter() - wall_started
+
+    return {
+        "requests": requests,
+        "client_concurrency": concurrency,
+        "max_in_flight": max_in_flight,
+        "model_latency_ms": latency_ms,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(requests / wall, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--max-in-flight", type=int, default=256)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args.requests, args.concurrency, args.latency_ms, args.max_in_flight))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Measures cold start of the production run mode: time from launching
+`python -m app.server` to the first successful request, and to every worker
+reporting ready. Also measures how long a SIGTERM drain takes with a request in flight.
+
+The model backend is the local fake, so no key or network is needed:
+
+    python -m benchmarks.cold_start --workers 1,4 --repeat 3 --output cold_start.json
+"""
+import argparse
+import json
+import os
+import platform
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from benchmarks.pipeline import _git_revision
+
+_FIRST_REQUEST = (
+    "/suggest-alternatives-gemini",
+    json.dumps({"service_name": "Netflix"}).encode(),
+)
+_TRANSACTIONS = json.dumps([
+    {"id": f"t{m}", "userId": "u1", "transaction_date": f"2024-{m:02d}-05", "description": "NETFLIX.COM", "amount": 15.49, "currency": "USD"}
+    for m in range(1, 7)
+]).encode()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _request(port: int, path: str, body: Optional[bytes] = None, timeout: float = 5.0) -> Tuple[int, bytes]:
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}{path}",
+        data=body,
+        headers={"Content-Type": "application/json"} if body is not None else {},
+        method="POST" if body is not None else "GET"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+    except (urllib.error.URLError, ConnectionError, socket.timeout):
+        return 0, b""
+
+
+def run_once(workers: int, timeout: float, model_latency_ms: float) -> Dict[str, Any]:
+    port = _free_port()
+    env = dict(
+        os.environ,
+        MODEL_BACKEND="fake",
+        FAKE_MODEL_LATENCY_MS=str(model_latency_ms),
+        CACHE_BACKEND="none",
+        SERVER_DRAIN_DELAY_SECONDS="0",
+        PYTHONUNBUFFERED="1",
+    )
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "app.server", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    result: Dict[str, Any] = {"workers": workers}
+    try:
+        path, body = _FIRST_REQUEST
+        while time.perf_counter() - started < timeout:
+            status, _ = _request(port, path, body, timeout=timeout)
+            if status == 200:
+                result["first_success_seconds"] = round(time.perf_counter() - started, 3)
+                break
+            time.sleep(0.01)
+        else:
+            raise RuntimeError(f"No successful request within {timeout}s")
+
+        # Each connection lands on some worker; keep asking until every pid has reported ready.
+        ready_pids: Dict[int, Dict[str, float]] = {}
+        while len(ready_pids) < workers and time.perf_counter() - started < timeout:
+            status, payload = _request(port, "/ready")
+            if status == 200:
+                info = json.loads(payload)
+                ready_pids[info["pid"]] = info["startup_seconds"]
+        result["all_ready_seconds"] = round(time.perf_counter() - started, 3)
+        result["worker_startup_seconds"] = list(ready_pids.values())
+
+        # Drain: SIGTERM while an analysis is in flight; it must still complete.
+        outcome: Dict[str, int] = {}
+        in_flight = threading.Thread(
+            target=lambda: outcome.update(status=_request(port, "/analyze-transactions-gemini", _TRANSACTIONS, timeout=timeout)[0])
+        )
+        in_flight.start()
+        time.sleep(min(0.2, model_latency_ms / 2000))
+        stop_started = time.perf_counter()
+        process.send_signal(signal.SIGTERM)
+        in_flight.join(timeout)
+        process.wait(timeout)
+        result["drain_seconds"] = round(time.perf_counter() - stop_started, 3)
+        result["in_flight_status_during_drain"] = outcome.get("status")
+        return result
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", default="1,4", help="Comma-separated worker counts.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--model-latency-ms", type=float, default=500.0, help="Fake model latency of the request in flight during the drain.")
+    parser.add_argument("--output", default="cold_start_output.json")
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "git_revision": _git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "args": vars(args),
+        },
+        "results": [],
+    }
+    for workers in (int(w) for w in args.workers.split(",")):
+        runs = [run_once(workers, args.timeout, args.model_latency_ms) for _ in range(args.repeat)]
+        summary = {
+            "workers": workers,
+            "first_success_median_seconds": round(statistics.median(r["first_success_seconds"] for r in runs), 3),
+            "all_ready_median_seconds": round(statistics.median(r["all_ready_seconds"] for r in runs), 3),
+            "drain_median_seconds": round(statistics.median(r["drain_seconds"] for r in runs), 3),
+            "runs": runs,
+        }
+        report["results"].append(summary)
+        print(
+            f"{workers:>3} workers: first success {summary['first_success_median_seconds']}s, "
+            f"all ready {summary['all_ready_median_seconds']}s, drain {summary['drain_median_seconds']}s "
+            f"(in-flight statuses {[r['in_flight_status_during_drain'] for r in runs]})",
+            flush=True
+        )
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Load test for the model call dispatcher (app/services/model_dispatcher.py): many small
+analyses arriving at a steady rate, a share of them duplicates of a request still in
+flight (client retries, double submits), against the local fake backend.
+
+For each batching window it reports model calls made, how requests were served
+(direct / batched / coalesced) and client latency percentiles. It also checks that every
+request got the same subscriptions as when it is analyzed on its own, and exits with code
+1 otherwise. Window 0 is coalescing only; --no-coalesce gives the plain service baseline.
+
+    python -m benchmarks.dispatch --requests 2000 --rate 500 --latency-ms 300 --windows 0,2,5,10
+"""
+import os
+
+os.environ.setdefault("MODEL_BACKEND", "fake")
+os.environ.setdefault("FAKE_MODEL_LATENCY_MS", "0")
+os.environ.setdefault("CACHE_BACKEND", "none")
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from app.models.schemas import TransactionInput
+from app.services.gemini_service import GeminiService
+from app.services.model_backends import FakeBackend
+from app.services.model_dispatcher import ModelCallDispatcher
+from benchmarks.pipeline import _git_revision
+from benchmarks.synthetic import generate_user_transactions
+
+
+def _signature(subscriptions: List[Dict[str, Any]]) -> List[tuple]:
+    return sorted((sub["name"], tuple(sorted(sub["transaction_ids"]))) for sub in subscriptions)
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+async def run(
+    histories: List[List[TransactionInput]],
+    expected: List[List[tuple]],
+    window_ms: float,
+    coalesce: bool,
+    args: argparse.Namespace
+) -> Dict[str, Any]:
+    backend = FakeBackend(latency_ms=args.latency_ms)
+    service = GeminiService(backend=backend, max_concurrency=args.max_in_flight, prompt_encoding=args.encoding)
+    dispatcher = ModelCallDispatcher(service, window_ms=window_ms, max_batch_size=args.max_batch, coalesce=coalesce)
+    rng = random.Random(args.seed)
+    latencies: List[float] = []
+    mismatches: List[int] = []
+
+    async def one_request(index: int, delay: float):
+        await asyncio.sleep(delay)
+        started = time.perf_counter()
+        result = await dispatcher.analyze(histories[index])
+        latencies.append(time.perf_counter() - started)
+        if _signature(result) != expected[index]:
+            mismatches.append(index)
+
+    # Steady arrivals; a duplicate re-sends one of the last few requests shortly after it.
+    arrivals = []
+    for i in range(args.requests):
+        at = i / args.rate
+        index = i
+        if i and rng.random() < args.duplicates:
+            index = rng.randrange(max(0, i - 5), i)
+            index = arrivals[index][0]
+        arrivals.append((index, at))
+
+    wall_started = time.perf_counter()
+    await asyncio.gather(*(one_request(index, at) for index, at in arrivals))
+    wall = time.perf_counter() - wall_started
+    stats = dispatcher.describe()
+    return {
+        "window_ms": window_ms,
+        "coalesce": coalesce,
+        "model_calls": backend.calls,
+        "requests_per_model_call": round(args.requests / max(1, backend.calls), 2),
+        "served": {route: stats[route] for route in ("direct", "batched", "coalesced")},
+        "wall_s": round(wall, 3),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 1),
+        "mismatched_requests": len(mismatches),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=500.0, help="Arrivals per second.")
+    parser.add_argument("--duplicates", type=float, default=0.05, help="Share of requests that repeat a recent one.")
+    parser.add_argument("--transactions", type=int, default=30, help="Transactions per request.")
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Fake model latency per call.")
+    parser.add_argument("--max-in-flight", type=int, default=32, help="GeminiService max_concurrency.")
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--windows", default="0,2,5,10", help="Comma-separated batching windows in ms.")
+    parser.add_argument("--encoding", choices=["verbose", "compact"], default="verbose")
+    parser.add_argument("--no-coalesce", action="store_true", help="Also run the plain baseline without coalescing.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="dispatch_output.json")
+    args = parser.parse_args()
+
+    histories = [generate_user_transactions(f"user_{i}", args.transactions, seed=args.seed) for i in range(args.requests)]
+    reference = GeminiService(backend=FakeBackend(), prompt_encoding=args.encoding)
+    expected = [_signature(reference.analyze_transactions_for_subscriptions(history)) for history in histories]
+
+    report = {
+        "meta": {
+            "git_revision": _git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "args": vars(args),
+        },
+        "results": [],
+    }
+    runs = [(0.0, False)] if args.no_coalesce else []
+    runs += [(float(w), True) for w in args.windows.split(",")]
+    for window_ms, coalesce in runs:
+        entry = asyncio.run(run(histories, expected, window_ms, coalesce, args))
+        report["results"].append(entry)
+        print(
+            f"window {window_ms:>5}ms coalesce={coalesce!s:<5}: {entry['model_calls']} model calls "
+            f"({entry['requests_per_model_call']} req/call, served {entry['served']}), "
+            f"p50 {entry['p50_ms']}ms p95 {entry['p95_ms']}ms p99 {entry['p99_ms']}ms, "
+            f"{entry['mismatched_requests']} mismatches",
+            flush=True
+        )
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+    if any(entry["mismatched_requests"] for entry in report["results"]):
+        print("FAILED: some requests got different subscriptions than when analyzed alone.", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Import-time budget check for `app.main`, based on `python -X importtime`.
+
+Fails (exit code 1) when importing the app:
+  - pulls in a model SDK (those must only be imported when a model client is built), or
+  - spends more than --app-budget-ms in this repository's own modules, or
+  - takes more than --total-budget-ms overall, frameworks included.
+
+Each figure is the median of --runs fresh interpreters:
+
+    python -m benchmarks.import_budget
+    python -m benchmarks.import_budget --app-budget-ms 200 --total-budget-ms 1200 --output import_budget.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Heavy SDKs that only the Gemini backend needs, loaded when it is built.
+FORBIDDEN_AT_IMPORT = ("google.generativeai", "google.ai", "google.api_core", "google.protobuf", "grpc")
+# Default budgets: this repository's own modules, and the whole import with frameworks.
+APP_BUDGET_MS = 250.0
+TOTAL_BUDGET_MS = 1500.0
+
+
+def profile_import(module: str = "app.main") -> Tuple[float, Dict[str, float]]:
+    """Returns (total seconds, {module: self seconds}) for importing `module` in a fresh interpreter."""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True, env=dict(os.environ, PYTHONWARNINGS="ignore")
+    ).stderr
+    self_us: Dict[str, float] = {}
+    total_us = 0.0
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_part, cumulative_part, name = line[len("import time:"):].split("|", 2)
+        if not name.startswith("  "):  # Top-level imports: their cumulative times add up to the total
+            total_us += float(cumulative_part)
+        self_us[name.strip()] = float(self_part)
+    return total_us / 1e6, {name: us / 1e6 for name, us in self_us.items()}
+
+
+def _is_own(name: str) -> bool:
+    return name == "app" or name.startswith("app.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--app-budget-ms", type=float, default=APP_BUDGET_MS, help="Budget for this repository's own modules.")
+    parser.add_argument("--total-budget-ms", type=float, default=TOTAL_BUDGET_MS, help="Budget for the whole import, frameworks included.")
+    parser.add_argument("--top", type=int, default=10, help="How many of the slowest modules to list.")
+    parser.add_argument("--output", default=None, help="Optional JSON report path.")
+    args = parser.parse_args()
+
+    totals: List[float] = []
+    own: List[float] = []
+    per_module: Dict[str, List[float]] = {}
+    imported = set()
+    for _ in range(args.runs):
+        total, modules = profile_import(args.module)
+        totals.append(total)
+        own.append(sum(seconds for name, seconds in modules.items() if _is_own(name)))
+        imported.update(modules)
+        for name, seconds in modules.items():
+            per_module.setdefault(name, []).append(seconds)
+
+    slowest = sorted(((statistics.median(v), k) for k, v in per_module.items()), reverse=True)[:args.top]
+    report = {
+        "module": args.module,
+        "runs": args.runs,
+        "total_ms": round(statistics.median(totals) * 1000, 1),
+        "app_modules_ms": round(statistics.median(own) * 1000, 1),
+        "forbidden_imported": sorted(
+            name for name in imported if any(name == f or name.startswith(f + ".") for f in FORBIDDEN_AT_IMPORT)
+        ),
+        "slowest_modules_self_ms": {name: round(seconds * 1000, 1) for seconds, name in slowest},
+    }
+    failures = []
+    if report["forbidden_imported"]:
+        failures.append(f"model SDK modules imported eagerly: {', '.join(report['forbidden_imported'][:5])}")
+    if report["app_modules_ms"] > args.app_budget_ms:
+        failures.append(f"app modules took {report['app_modules_ms']}ms (budget {args.app_budget_ms}ms)")
+    if report["total_ms"] > args.total_budget_ms:
+        failures.append(f"import took {report['total_ms']}ms (budget {args.total_budget_ms}ms)")
+    report["failures"] = failures
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if failures:
+        print("FAILED: " + "; ".join(failures), file=sys.stderr)
+        sys.exit(1)
+    print("Import budget OK.")
+
+
+if __name__ == "__main__":
+    main()
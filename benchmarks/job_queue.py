@@ -0,0 +1,93 @@
+"""
+Measures the job queue operations the API and the workers perform (submit, get, claim,
+finish) while a large backlog of queued jobs from many users sits in the SQLite store, to
+check that request latency does not grow with the backlog.
+
+    python -m benchmarks.job_queue --backlogs 0,10000,100000 --output job_queue.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict
+
+from app.services.job_queue import JobStore
+from benchmarks.pipeline import _git_revision, _stats
+
+# Roughly a 30-transaction request body.
+_PAYLOAD = b"[" + b",".join(
+    b'{"id":"t%d","userId":"u","transaction_date":"2024-01-05","description":"NETFLIX.COM","amount":15.49,"currency":"USD"}' % i
+    for i in range(30)
+) + b"]"
+
+
+def bench_backlog(backlog: int, operations: int, directory: str) -> Dict[str, Any]:
+    path = os.path.join(directory, f"jobs_{backlog}.sqlite3")
+    store = JobStore(path, max_queued_per_user=10 ** 9, submit_rate_per_minute=10 ** 9, max_running_per_user=1)
+    # The backlog goes in directly, in one transaction, since filling it is not what is measured.
+    now = time.time()
+    with store._transaction():
+        store._conn.executemany(
+            "INSERT INTO jobs (job_id, user_id, state, priority, transaction_count, use_cache, created_at, queued_at, run_after, payload)"
+            " VALUES (?, ?, 'queued', ?, 30, 1, ?, ?, ?, ?)",
+            ((f"backlog{i}", f"user{i % 5000}", i % 3, now + i * 1e-6, now, now, _PAYLOAD) for i in range(backlog))
+        )
+
+    timings: Dict[str, list] = {"submit": [], "get": [], "claim": [], "finish": []}
+    submitted = []
+    for i in range(operations):
+        started = time.perf_counter()
+        job = store.submit(f"probe{i}", _PAYLOAD, 30, priority=9)
+        timings["submit"].append(time.perf_counter() - started)
+        submitted.append(job["job_id"])
+    for job_id in submitted:
+        started = time.perf_counter()
+        store.get(job_id)
+        timings["get"].append(time.perf_counter() - started)
+    for i in range(operations):
+        started = time.perf_counter()
+        claimed = store.claim(f"worker{i}")
+        timings["claim"].append(time.perf_counter() - started)
+        started = time.perf_counter()
+        store.finish(claimed[0]["job_id"], f"worker{i}", "succeeded", result=b'{"identified_subscriptions": []}')
+        timings["finish"].append(time.perf_counter() - started)
+    store.close()
+    return {"backlog": backlog, "operations": {name: _stats(samples, 1) for name, samples in timings.items()}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backlogs", default="0,10000,100000", help="Comma-separated numbers of queued jobs.")
+    parser.add_argument("--operations", type=int, default=200)
+    parser.add_argument("--output", default="job_queue_output.json")
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "git_revision": _git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "args": vars(args),
+        },
+        "results": [],
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for backlog in (int(b) for b in args.backlogs.split(",")):
+            entry = bench_backlog(backlog, args.operations, directory)
+            report["results"].append(entry)
+            print(f"{backlog:>8} queued: " + ", ".join(
+                f"{name} p50 {stats['median_ms']}ms p95 {stats['p95_ms']}ms" for name, stats in entry["operations"].items()
+            ), flush=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Compares the previous per-item request/response handling with the bulk codecs in
+app/services/codecs.py on large synthetic payloads.
+
+  parse        JSON array body -> List[TransactionInput]
+                 baseline: json.loads + list validation (what a declared body parameter does)
+                 fast:     parse_transactions (validate_json from bytes, GC paused)
+  ndjson_rows  one NDJSON line -> TransactionInput, for every row
+                 baseline: TransactionInput(**json.loads(line))   fast: TRANSACTION.validate_json(line)
+  validation   model answer dicts -> List[IdentifiedSubscription]
+                 baseline: per-item coercion + IdentifiedSubscription(**item)   fast: validate_subscriptions
+  serialize    AnalysisResult -> response bytes
+                 baseline: json.dumps(model_dump(mode="json"))   fast: FastJSONResponse.render
+
+    python -m benchmarks.payloads --sizes 1000,100000 --output payloads.json
+"""
+import os
+
+os.environ.setdefault("MODEL_BACKEND", "fake")
+os.environ.setdefault("FAKE_MODEL_LATENCY_MS", "0")
+os.environ.setdefault("CACHE_BACKEND", "none")
+
+import argparse
+import copy
+import decimal
+import json
+import platform
+import sys
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List
+
+from app.analysis.recurrence_detector import detect_recurring_subscriptions
+from app.models.schemas import AnalysisResult, IdentifiedSubscription, TransactionInput
+from app.services.codecs import TRANSACTION, TRANSACTION_LIST, FastJSONResponse, parse_transactions, validate_subscriptions
+from benchmarks.pipeline import _git_revision, _stats, _time
+from benchmarks.synthetic import generate_population
+
+
+def _baseline_validation(raw: List[Dict[str, Any]]) -> List[IdentifiedSubscription]:
+    validated = []
+    for sub_data in raw:
+        try:
+            if isinstance(sub_data.get("average_amount"), (float, int)):
+                sub_data["average_amount"] = decimal.Decimal(str(sub_data["average_amount"]))
+            for date_field in ["first_transaction_date", "last_transaction_date", "potential_next_billing_date"]:
+                if isinstance(sub_data.get(date_field), str):
+                    sub_data[date_field] = date.fromisoformat(sub_data[date_field])
+            validated.append(IdentifiedSubscription(**sub_data))
+        except Exception:
+            pass
+    return validated
+
+
+def _compare(baseline, fast, repeat: int, items: int, prepare=None) -> Dict[str, Any]:
+    before = _stats(_time(baseline, repeat, prepare), items)
+    after = _stats(_time(fast, repeat, prepare), items)
+    return {"baseline": before, "fast": after, "speedup": round(before["median_ms"] / max(after["median_ms"], 1e-6), 2)}
+
+
+def bench_size(size: int, repeat: int, seed: int) -> Dict[str, Any]:
+    population = generate_population(size, max(1, size // 1000), seed=seed)
+    transactions = [tx for txs in population.values() for tx in txs]
+    rows = [json.dumps(tx.model_dump(mode="json")).encode() for tx in transactions]
+    body = b"[" + b",".join(rows) + b"]"
+
+    results = {
+        "parse": _compare(lambda: TRANSACTION_LIST.validate_python(json.loads(body)), lambda: parse_transactions(body), repeat, size),
+        "ndjson_rows": _compare(
+            lambda: [TransactionInput(**json.loads(row)) for row in rows],
+            lambda: [TRANSACTION.validate_json(row) for row in rows],
+            repeat, size
+        ),
+    }
+
+    subscriptions = [sub for txs in population.values() for sub in detect_recurring_subscriptions(txs).subscriptions]
+    # Shaped like a model answer: plain JSON types, amounts as floats.
+    raw = [dict(sub.model_dump(mode="json"), average_amount=float(sub.average_amount)) for sub in subscriptions]
+    results["validation"] = _compare(_baseline_validation, validate_subscriptions, repeat, max(1, len(raw)), prepare=lambda: copy.deepcopy(raw))
+
+    result = AnalysisResult(user_id="bench", processed_transaction_ids=[tx.id for tx in transactions], identified_subscriptions=subscriptions)
+    render = FastJSONResponse.render.__get__(FastJSONResponse.__new__(FastJSONResponse))
+    if json.loads(render(result)) != json.loads(json.dumps(result.model_dump(mode="json"))):
+        raise AssertionError("FastJSONResponse output differs from the model's JSON serialization")
+    results["serialize"] = _compare(lambda: json.dumps(result.model_dump(mode="json")).encode(), lambda: render(result), repeat, size)
+    return {"transactions": size, "subscriptions": len(subscriptions), "body_bytes": len(body), "stages": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated transaction counts.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="payloads_output.json")
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "git_revision": _git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "args": vars(args),
+        },
+        "results": [],
+    }
+    for size in (int(s) for s in args.sizes.split(",")):
+        entry = bench_size(size, args.repeat, args.seed)
+        report["results"].append(entry)
+        print(f"{size:>8} tx: " + ", ".join(
+            f"{name} {stats['baseline']['median_ms']}ms -> {stats['fast']['median_ms']}ms (x{stats['speedup']})"
+            for name, stats in entry["stages"].items()
+        ), flush=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
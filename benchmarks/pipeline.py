@@ -0,0 +1,213 @@
+"""
+Benchmarks each stage of the analysis pipeline and the full ASGI request path.
+
+Stages, measured separately on synthetic histories (see benchmarks/synthetic.py):
+  chunk_plan + prompt_build   prompt construction for the model
+  response_parse              fence cleanup + json.loads of a model answer
+  validation                  raw dict -> IdentifiedSubscription (as in the endpoint)
+  local_detection             deterministic recurrence detector
+  alternatives_lookup         catalog lookup of every distinct descriptor
+  end_to_end                  HTTP request through the FastAPI app (fake model backend)
+
+The model backend is forced to the local fake with zero latency and the response
+cache is disabled, so numbers reflect this service's own CPU cost. Results are
+written as JSON for comparing runs across commits:
+
+    python -m benchmarks.pipeline --sizes 10,1000,100000 --users 1,100 --output bench.json
+    python -m benchmarks.pipeline --sizes 1000000 --users 10000 --repeat 1
+"""
+import os
+
+# Must be set before app.config is imported.
+os.environ.setdefault("MODEL_BACKEND", "fake")
+os.environ.setdefault("FAKE_MODEL_LATENCY_MS", "0")
+os.environ.setdefault("CACHE_BACKEND", "none")
+
+import argparse
+import asyncio
+import copy
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+from app.analysis.alternatives_suggester import get_gemini_alternatives_batch
+from app.analysis.prompt_chunker import plan_transaction_chunks
+from app.analysis.recurrence_detector import detect_recurring_subscriptions
+from app.services.gemini_service import GeminiService
+from app.services.model_backends import FakeBackend
+from benchmarks.synthetic import generate_population
+
+
+def _stats(samples: List[float], items: int) -> Dict[str, float]:
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    median = statistics.median(ordered)
+    return {
+        "runs": len(ordered),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "median_ms": round(median * 1000, 3),
+        "p95_ms": round(p95 * 1000, 3),
+        "per_item_us": round(median / max(1, items) * 1e6, 3),
+    }
+
+
+def _time(fn: Callable[[], Any], repeat: int, prepare: Callable[[], Any] = None) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        arg = prepare() if prepare else None
+        started = time.perf_counter()
+        fn(arg) if prepare else fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+async def _asgi_request(app, method: str, path: str, body: bytes, content_type: str) -> Tuple[int, bytes]:
+    """Minimal in-process ASGI client, so the benchmark needs no HTTP client library."""
+    request_sent = False
+    status = 0
+    chunks: List[bytes] = []
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.Event().wait()  # Never disconnect while the response streams
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 50000), "server": ("127.0.0.1", 8000),
+    }
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
+
+
+def bench_stages(population: Dict[str, list], repeat: int) -> Dict[str, Dict[str, float]]:
+    from app.main import _validate_gemini_subscriptions
+
+    service = GeminiService(backend=FakeBackend())
+    all_transactions = [tx for txs in population.values() for tx in txs]
+    largest = max(population.values(), key=len)
+    results = {}
+
+    results["chunk_plan"] = _stats(_time(lambda: plan_transaction_chunks(largest, service.chunk_max_tokens), repeat), len(largest))
+    chunks = plan_transaction_chunks(largest, service.chunk_max_tokens)
+    results["prompt_build"] = _stats(_time(lambda: [service._build_transactions_prompt(c) for c in chunks], repeat), len(largest))
+
+    answers = [service.backend.generate(service._build_transactions_prompt(c)) for c in chunks]
+    fenced = [f"```json\n{a}\n```" for a in answers]
+    results["response_parse"] = _stats(_time(lambda: [service._parse_subscriptions_response(a) for a in fenced], repeat), len(largest))
+
+    parsed = [sub for a in answers for sub in json.loads(a)]
+    results["validation"] = _stats(
+        _time(_validate_gemini_subscriptions, repeat, prepare=lambda: copy.deepcopy(parsed)),
+        max(1, len(parsed))
+    )
+
+    results["local_detection"] = _stats(
+        _time(lambda: [detect_recurring_subscriptions(txs) for txs in population.values()], repeat),
+        len(all_transactions)
+    )
+
+    descriptors = sorted({tx.description for tx in all_transactions})
+    results["alternatives_lookup"] = _stats(_time(lambda: get_gemini_alternatives_batch(descriptors), repeat), len(descriptors))
+    return results
+
+
+def bench_end_to_end(population: Dict[str, list], repeat: int) -> Dict[str, float]:
+    from app.main import app
+
+    transactions = [tx for txs in population.values() for tx in txs]
+    if len(population) == 1:
+        path, content_type = "/analyze-transactions-gemini", "application/json"
+        body = json.dumps([tx.model_dump(mode="json") for tx in transactions]).encode()
+    else:
+        path, content_type = "/ingest-transactions", "application/x-ndjson"
+        body = "\n".join(json.dumps(tx.model_dump(mode="json")) for tx in transactions).encode()
+
+    async def run() -> List[float]:
+        await app.router.startup()
+        try:
+            samples = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                status, _ = await _asgi_request(app, "POST", path, body, content_type)
+                samples.append(time.perf_counter() - started)
+                if status != 200:
+                    raise RuntimeError(f"{path} returned HTTP {status}")
+            return samples
+        finally:
+            await app.router.shutdown()
+
+    return dict(_stats(asyncio.run(run()), len(transactions)), path=path, body_bytes=len(body))
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,1000,10000,100000", help="Comma-separated total transaction counts (up to 1000000).")
+    parser.add_argument("--users", default="1,10,100", help="Comma-separated user counts (up to 10000).")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-e2e", action="store_true", help="Only measure the individual stages.")
+    parser.add_argument("--output", default="bench_output.json")
+    args = parser.parse_args()
+
+    report = {
+        "meta": {
+            "git_revision": _git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "args": vars(args),
+        },
+        "results": [],
+    }
+
+    for size in (int(s) for s in args.sizes.split(",")):
+        for users in (int(u) for u in args.users.split(",")):
+            if users > size:
+                continue
+            generated_at = time.perf_counter()
+            population = generate_population(size, users, seed=args.seed)
+            generation_s = time.perf_counter() - generated_at
+            entry = {
+                "transactions": sum(len(t) for t in population.values()),
+                "users": users,
+                "generation_seconds": round(generation_s, 3),
+                "stages": bench_stages(population, args.repeat),
+            }
+            if not args.skip_e2e:
+                entry["stages"]["end_to_end"] = bench_end_to_end(population, args.repeat)
+            report["results"].append(entry)
+            print(f"{entry['transactions']:>8} tx / {users:>5} users: " + ", ".join(
+                f"{name}={stats['median_ms']}ms" for name, stats in entry["stages"].items()
+            ), flush=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
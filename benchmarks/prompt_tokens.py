@@ -0,0 +1,146 @@
+"""
+Compares prompt size of the verbose and compact transaction encodings
+(`GEMINI_PROMPT_ENCODING`) on synthetic histories, and checks that the compact
+encoding's row IDs map back to the original transaction IDs without loss.
+
+Token counts use the same chars/token estimate as chunk planning and the prompt metrics.
+
+  round trip   every row ID of the table restores to its own transaction, all transactions
+               are covered exactly once, and an answer naming every row (plus an unknown
+               one) restores to exactly the original IDs
+  end to end   the fake backend's answer for a compact prompt only names transactions
+               of the request, with first/last dates taken from those transactions
+
+Exits with code 1 if a check fails:
+
+    python -m benchmarks.prompt_tokens --sizes 50,200,1000 --users 20 --output prompt_tokens.json
+"""
+import os
+
+os.environ.setdefault("MODEL_BACKEND", "fake")
+os.environ.setdefault("FAKE_MODEL_LATENCY_MS", "0")
+os.environ.setdefault("CACHE_BACKEND", "none")
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import statistics
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from app.analysis.prompt_chunker import estimate_tokens
+from app.analysis.prompt_encoding import CompactTransactionTable
+from app.models.schemas import TransactionInput
+from app.services.gemini_service import GeminiService
+from app.services.model_backends import FakeBackend
+from benchmarks.pipeline import _git_revision
+from benchmarks.synthetic import generate_population
+
+
+def check_round_trip(transactions: List[TransactionInput]) -> List[str]:
+    """Returns a list of problems (empty when the ID mapping is lossless)."""
+    problems = []
+    table = CompactTransactionTable(transactions)
+    by_id = {tx.id: tx for tx in transactions}
+    if len(table.rows) != len(transactions):
+        problems.append(f"{len(table.rows)} rows for {len(transactions)} transactions")
+    if sorted(tx.id for tx in table.rows.values()) != sorted(by_id):
+        problems.append("row table does not cover every transaction exactly once")
+    for row_id, tx in table.rows.items():
+        if table.original_id(row_id) != tx.id or by_id.get(tx.id) is not tx:
+            problems.append(f"row {row_id} does not map back to {tx.id}")
+            break
+
+    answer = {"name": "All", "transaction_ids": list(table.rows) + [str(len(table.rows) + 1)]}
+    restored = table.restore(answer)
+    if sorted(restored["transaction_ids"]) != sorted(by_id):
+        problems.append("restoring every row ID did not give back exactly the original IDs")
+    return problems
+
+
+async def check_end_to_end(service: GeminiService, transactions: List[TransactionInput]) -> List[str]:
+    problems = []
+    by_id = {tx.id: tx for tx in transactions}
+    for sub in await service.analyze_transactions_for_subscriptions_async(transactions, use_cache=False):
+        members = [by_id.get(tx_id) for tx_id in sub["transaction_ids"]]
+        if not members or None in members:
+            problems.append(f"subscription '{sub['name']}' names unknown transactions {sub['transaction_ids'][:3]}")
+            continue
+        # Single-chunk answers carry ISO strings, merged multi-chunk ones dates.
+        if str(sub["first_transaction_date"]) != min(tx.transaction_date for tx in members).isoformat():
+            problems.append(f"subscription '{sub['name']}' has a first date that is not its earliest transaction")
+    return problems
+
+
+def bench_size(size: int, users: int, seed: int) -> Dict[str, Any]:
+    population = generate_population(size * users, users, seed=seed)
+    verbose = GeminiService(backend=FakeBackend(), prompt_encoding="verbose")
+    compact = GeminiService(backend=FakeBackend(), prompt_encoding="compact")
+
+    verbose_tokens, compact_tokens, ratios, problems = [], [], [], []
+    for transactions in population.values():
+        before = estimate_tokens(verbose._build_transactions_prompt(transactions))
+        after = estimate_tokens(compact._build_transactions_prompt(transactions, compact._encode_transactions(transactions)))
+        verbose_tokens.append(before)
+        compact_tokens.append(after)
+        ratios.append(after / before)
+        problems += check_round_trip(transactions)
+        problems += asyncio.run(check_end_to_end(compact, transactions))
+
+    return {
+        "transactions_per_user": size,
+        "users": len(population),
+        "verbose_prompt_tokens_median": statistics.median(verbose_tokens),
+        "compact_prompt_tokens_median": statistics.median(compact_tokens),
+        "compact_to_verbose_median": round(statistics.median(ratios), 3),
+        "tokens_saved_total": sum(verbose_tokens) - sum(compact_tokens),
+        "problems": problems,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="50,200,1000", help="Comma-separated transactions per user.")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="prompt_tokens_output.json")
+    args = parser.parse_args()
+    # The round-trip check sends an unknown row ID on purpose; its warning is expected.
+    logging.getLogger("app.analysis.prompt_encoding").setLevel(logging.ERROR)
+
+    report = {
+        "meta": {
+            "git_revision": _git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "args": vars(args),
+        },
+        "results": [],
+    }
+    failures = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        entry = bench_size(size, args.users, args.seed)
+        report["results"].append(entry)
+        failures += entry["problems"]
+        print(
+            f"{size:>6} tx/user: verbose {entry['verbose_prompt_tokens_median']} -> compact "
+            f"{entry['compact_prompt_tokens_median']} tokens (x{entry['compact_to_verbose_median']}), "
+            f"{len(entry['problems'])} problems",
+            flush=True
+        )
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+    if failures:
+        print("FAILED: " + "; ".join(failures[:10]), file=sys.stderr)
+        sys.exit(1)
+    print("Round-trip ID mapping is lossless.")
+
+
+if __name__ == "__main__":
+    main()
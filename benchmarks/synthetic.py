@@ -0,0 +1,138 @@
+"""
+Synthetic transaction histories for benchmarks.
+
+Each user gets a handful of subscriptions drawn from a popularity-weighted catalog
+(monthly, yearly, weekly and bi-weekly cadences with date and price jitter, an
+occasional price change and skipped cycle) on top of everyday spending drawn from a
+Zipf-like merchant distribution. Descriptors are decorated the way bank exports do
+it: processor prefixes, reference numbers, store IDs and locations.
+"""
+import calendar
+import decimal
+import random
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, Tuple
+
+from app.models.schemas import TransactionInput
+
+# (descriptor, monthly-equivalent price, cadence, popularity weight)
+SUBSCRIPTION_MERCHANTS: List[Tuple[str, str, str, float]] = [
+    ("NETFLIX.COM", "15.49", "monthly", 30),
+    ("SPOTIFY", "10.99", "monthly", 28),
+    ("AMAZON PRIME", "139.00", "yearly", 25),
+    ("APPLE.COM/BILL", "2.99", "monthly", 22),
+    ("HULU", "7.99", "monthly", 12),
+    ("DISNEY PLUS", "13.99", "monthly", 12),
+    ("HBO MAX", "15.99", "monthly", 9),
+    ("YOUTUBE PREMIUM", "13.99", "monthly", 8),
+    ("MICROSOFT 365", "99.99", "yearly", 8),
+    ("DROPBOX", "11.99", "monthly", 5),
+    ("ADOBE CREATIVE CLOUD", "54.99", "monthly", 4),
+    ("GOOGLE ONE", "2.99", "monthly", 6),
+    ("AUDIBLE", "14.95", "monthly", 4),
+    ("PLANET FITNESS", "10.00", "monthly", 6),
+    ("NYTIMES DIGITAL", "4.00", "weekly", 3),
+    ("HELLOFRESH", "69.99", "bi-weekly", 2),
+]
+
+EVERYDAY_MERCHANTS: List[Tuple[str, float, float]] = [
+    # (descriptor, typical amount, spread)
+    ("STARBUCKS", 6.5, 3.0), ("SHELL OIL", 45.0, 20.0), ("WHOLE FOODS MARKET", 85.0, 50.0),
+    ("UBER TRIP", 22.0, 15.0), ("AMAZON MKTPLACE", 35.0, 30.0), ("TARGET", 60.0, 40.0),
+    ("CHIPOTLE", 13.0, 4.0), ("CVS PHARMACY", 18.0, 12.0), ("DOORDASH", 32.0, 12.0),
+    ("TRADER JOES", 55.0, 25.0), ("COSTCO WHSE", 140.0, 80.0), ("LYFT RIDE", 18.0, 10.0),
+    ("HOME DEPOT", 75.0, 60.0), ("WALGREENS", 15.0, 10.0), ("MCDONALDS", 9.0, 4.0),
+    ("BEST BUY", 120.0, 100.0), ("SAFEWAY", 65.0, 30.0), ("EXXONMOBIL", 40.0, 15.0),
+]
+
+_PREFIXES = ["", "", "", "POS ", "SQ *", "PAYPAL *", "DEBIT CARD PURCHASE "]
+_LOCATIONS = ["", "", "CA", "NY", "SEATTLE WA", "AUSTIN TX", "LONDON GB"]
+_CADENCE_DAYS = {"weekly": 7, "bi-weekly": 14}
+
+
+def _decorate(rng: random.Random, descriptor: str) -> str:
+    parts = [rng.choice(_PREFIXES) + descriptor]
+    if rng.random() < 0.4:
+        parts.append(f"#{rng.randint(100, 99999)}")
+    location = rng.choice(_LOCATIONS)
+    if location:
+        parts.append(location)
+    return " ".join(parts)
+
+
+def _add_months(start: date, months: int) -> date:
+    index = start.month - 1 + months
+    year, month = start.year + index // 12, index % 12 + 1
+    return date(year, month, min(start.day, calendar.monthrange(year, month)[1]))
+
+
+def _subscription_dates(rng: random.Random, cadence: str, start: date, end: date) -> Iterator[date]:
+    step = 0
+    while True:
+        if cadence == "monthly":
+            due = _add_months(start, step)
+        elif cadence == "yearly":
+            due = _add_months(start, 12 * step)
+        else:
+            due = start + timedelta(days=_CADENCE_DAYS[cadence] * step)
+        if due > end:
+            return
+        step += 1
+        if rng.random() < 0.03:
+            continue  # Skipped / failed charge
+        yield due + timedelta(days=rng.choice([0, 0, 0, 1, -1, 2]))
+
+
+def generate_user_transactions(user_id: str, count: int, seed: int = 0, end: date = date(2024, 6, 30)) -> List[TransactionInput]:
+    """Roughly `count` transactions for one user, sorted by date."""
+    rng = random.Random(f"{seed}:{user_id}")
+    # Enough history for the subscription share (~10-25%) to stay realistic at any size.
+    days = max(60, min(3650, count * 2))
+    start = end - timedelta(days=days)
+
+    weights = [w for *_, w in SUBSCRIPTION_MERCHANTS]
+    picked = {m[0]: m for m in rng.choices(SUBSCRIPTION_MERCHANTS, weights=weights, k=rng.randint(2, 7))}
+
+    rows: List[Tuple[date, str, decimal.Decimal]] = []
+    for descriptor, price, cadence, _ in picked.values():
+        amount = decimal.Decimal(price)
+        first = start + timedelta(days=rng.randint(0, 40))
+        for charge_date in _subscription_dates(rng, cadence, first, end):
+            if rng.random() < 0.01:
+                amount = (amount * decimal.Decimal("1.1")).quantize(decimal.Decimal("0.01"))  # Price increase
+            rows.append((charge_date, _decorate(rng, descriptor), amount))
+            if len(rows) >= count:
+                break
+
+    zipf_weights = [1.0 / (rank + 1) for rank in range(len(EVERYDAY_MERCHANTS))]
+    while len(rows) < count:
+        descriptor, typical, spread = rng.choices(EVERYDAY_MERCHANTS, weights=zipf_weights)[0]
+        amount = decimal.Decimal(str(round(max(1.0, rng.gauss(typical, spread / 2)), 2)))
+        rows.append((start + timedelta(days=rng.randint(0, days)), _decorate(rng, descriptor), amount))
+
+    rows.sort(key=lambda r: r[0])
+    return [
+        TransactionInput(
+            id=f"{user_id}_tx{i}",
+            userId=user_id,
+            transaction_date=tx_date,
+            description=description,
+            amount=amount,
+            currency="USD",
+            source="synthetic"
+        )
+        for i, (tx_date, description, amount) in enumerate(rows[:count])
+    ]
+
+
+def generate_population(total_transactions: int, users: int, seed: int = 0) -> Dict[str, List[TransactionInput]]:
+    """Splits `total_transactions` across `users` users with a skewed (long-tail) size distribution."""
+    rng = random.Random(seed)
+    weights = [rng.paretovariate(1.5) for _ in range(users)]
+    scale = total_transactions / sum(weights)
+    sizes = [max(1, int(w * scale)) for w in weights]
+    sizes[0] += max(0, total_transactions - sum(sizes))
+    return {
+        f"user{i:05d}": generate_user_transactions(f"user{i:05d}", size, seed=seed)
+        for i, size in enumerate(sizes)
+    }
@@ -0,0 +1,69 @@
+import sqlite3
+
+import pytest
+
+from app.analysis.alternatives_catalog import CompiledAlternativesIndex, ReloadingAlternativesCatalog, compile_catalog
+from app.analysis.alternatives_suggester import ALTERNATIVES_DB, SERVICE_ALIASES, SERVICE_EXACT_ALIASES, AlternativesIndex
+
+# Descriptors that share a word with a catalog entry but are a different product.
+UNRELATED_DESCRIPTORS = [
+    "Google Play",
+    "AMAZON.COM ORDER",
+    "microsoft xbox",
+    "MAX FITNESS GYM",
+    "LINKEDIN JOBS POSTING",
+    "ADOBE ACROPRO",
+]
+
+KNOWN_DESCRIPTORS = {
+    "Netflix": ("netflix", "exact"),
+    "SPOTIFY P0A1B2 STOCKHOLM": ("spotify", "alias"),
+    "AMZN PRIME VIDEO": ("amazon prime video", "alias"),
+    "DISNEYPLUS": ("disney+", "alias"),
+    "HBO MAX": ("hbo max", "exact"),
+    "Max": ("hbo max", "alias"),
+    "NETFLX": ("netflix", "fuzzy"),
+    "Gogle Drive": ("google drive", "fuzzy"),
+    "microsft 365": ("microsoft 365", "fuzzy"),
+}
+
+
+@pytest.fixture(scope="module", params=["builtin", "compiled"])
+def index(request, tmp_path_factory):
+    if request.param == "builtin":
+        yield AlternativesIndex(ALTERNATIVES_DB, SERVICE_ALIASES, SERVICE_EXACT_ALIASES)
+        return
+    path = str(tmp_path_factory.mktemp("catalog") / "alternatives.sqlite3")
+    compile_catalog(ALTERNATIVES_DB, path, SERVICE_ALIASES, SERVICE_EXACT_ALIASES)
+    compiled = CompiledAlternativesIndex(path)
+    yield compiled
+    compiled.close()
+
+
+@pytest.mark.parametrize("descriptor", UNRELATED_DESCRIPTORS)
+def test_unrelated_descriptor_has_no_match(index, descriptor):
+    assert index.match(descriptor) is None
+    assert index.lookup(descriptor) == []
+
+
+@pytest.mark.parametrize("descriptor, expected", KNOWN_DESCRIPTORS.items())
+def test_known_descriptor_matches(index, descriptor, expected):
+    found = index.match(descriptor)
+    assert found is not None
+    assert (found.key, found.match_type) == expected
+
+
+def test_reload_closes_replaced_index(tmp_path):
+    path = str(tmp_path / "alternatives.sqlite3")
+    compile_catalog(ALTERNATIVES_DB, path, SERVICE_ALIASES)
+    catalog = ReloadingAlternativesCatalog(path, check_interval=0.0)
+    previous = catalog.index
+    assert previous.lookup("Netflix")
+
+    compile_catalog({"netflix": ALTERNATIVES_DB["netflix"]}, path)
+    current = catalog.index
+    assert current is not previous
+    assert len(current) == 1
+    with pytest.raises(sqlite3.ProgrammingError):
+        previous._query("SELECT 1", ())
+    current.close()
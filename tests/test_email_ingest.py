@@ -0,0 +1,33 @@
+import asyncio
+
+from app.models.schemas import EmailInput
+from app.services.email_ingest import extract_receipts
+
+
+class _RejectingService:
+    """Answers every batch except the one with a blocked subject, which raises like a safety block."""
+
+    async def extract_receipts_batch(self, emails, use_cache=True):
+        if any(subject == "Your receipt from Blocked" for _, subject, _ in emails):
+            raise ValueError("Response blocked by safety filters.")
+        return {
+            pid: {"merchant_name": subject.rsplit(" ", 1)[-1], "transaction_amount": "9.99", "currency": "USD", "transaction_date": "2024-05-01"}
+            for pid, subject, _ in emails
+        }
+
+
+def _receipt_email(email_id: str, merchant: str) -> EmailInput:
+    return EmailInput(
+        id=email_id, userId="u1", subject=f"Your receipt from {merchant}",
+        body=f"Thanks for your payment to {merchant}. Total charged: $9.99 on your card."
+    )
+
+
+def test_failing_batch_does_not_drop_other_receipts():
+    emails = [_receipt_email("1", "Netflix"), _receipt_email("2", "Blocked"), _receipt_email("3", "Spotify")]
+
+    result = asyncio.run(extract_receipts(_RejectingService(), emails, batch_max_items=1))
+
+    assert sorted(r.merchant_name for r in result.receipts) == ["Netflix", "Spotify"]
+    assert result.stats["model_batches"] == 3
+    assert result.stats["failed_emails"] == 1
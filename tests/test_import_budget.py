@@ -0,0 +1,31 @@
+from pathlib import Path
+
+import pytest
+
+from benchmarks.import_budget import APP_BUDGET_MS, FORBIDDEN_AT_IMPORT, profile_import
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture(scope="module")
+def import_profile():
+    """`python -X importtime -c "import app.main"` in a fresh interpreter: {module: self seconds}."""
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(REPO_ROOT)
+        patch.setenv("MODEL_BACKEND", "fake")
+        _, modules = profile_import("app.main")
+    return modules
+
+
+def test_import_app_main_does_not_load_model_sdk(import_profile):
+    eager = sorted(name for name in import_profile if any(name == f or name.startswith(f + ".") for f in FORBIDDEN_AT_IMPORT))
+    assert not eager, f"model SDK modules imported eagerly: {eager[:5]}"
+
+
+def test_app_modules_import_within_budget(import_profile):
+    # Self time of this repository's modules only: framework import time varies too much
+    # between machines to assert on.
+    own = {name: seconds for name, seconds in import_profile.items() if name == "app" or name.startswith("app.")}
+    own_ms = sum(own.values()) * 1000
+    slowest = sorted(own, key=own.get, reverse=True)[:5]
+    assert own_ms <= APP_BUDGET_MS, f"app modules took {own_ms:.0f}ms (budget {APP_BUDGET_MS}ms); slowest: {slowest}"
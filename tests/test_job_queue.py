@@ -0,0 +1,94 @@
+import asyncio
+import sqlite3
+from typing import Any, Dict, List
+
+import pytest
+
+from app.services import job_queue
+from app.services.job_queue import JobRunner, JobStore, check_callback_url
+
+REJECTED_CALLBACK_URLS = [
+    "ftp://8.8.8.8/hook",
+    "http:///hook",
+    "http://localhost/hook",
+    "http://127.0.0.1:8000/hook",
+    "http://[::1]/hook",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://10.0.0.5/hook",
+    "http://192.168.1.10/hook",
+    "http://172.16.0.1/hook",
+    "http://[fd00::1]/hook",
+    "http://[::ffff:127.0.0.1]/hook",
+    "http://0.0.0.0/hook",
+    "http://224.0.0.1/hook",
+]
+
+
+@pytest.mark.parametrize("url", REJECTED_CALLBACK_URLS)
+def test_callback_url_to_internal_address_is_rejected(url):
+    with pytest.raises(ValueError):
+        check_callback_url(url)
+
+
+def test_callback_url_to_public_address_is_accepted():
+    check_callback_url("https://8.8.8.8/hook")
+    check_callback_url("http://[2001:4860:4860::8888]:8080/hook")
+
+
+def test_allowed_callback_host_skips_address_check():
+    check_callback_url("http://localhost:9000/hook", allowed_hosts=frozenset({"localhost"}))
+    with pytest.raises(ValueError):
+        check_callback_url("http://localhost:9000/hook", allowed_hosts=frozenset({"example.internal"}))
+
+
+def _run_jobs(store: JobStore, job_count: int) -> List[Dict[str, Any]]:
+    async def handler(job, payload):
+        return b'{"ok": true}'
+
+    async def main():
+        runner = JobRunner(store, handler, concurrency=1, poll_interval=0.01)
+        job_ids = [store.submit(f"user{i}", b"[]", 0)["job_id"] for i in range(job_count)]
+        runner.start()
+        for _ in range(200):
+            jobs = [store.get(job_id) for job_id in job_ids]
+            if all(job["state"] != "queued" for job in jobs) and not runner._running:
+                break
+            await asyncio.sleep(0.01)
+        await runner.stop(timeout=1.0)
+        return jobs
+
+    return asyncio.run(main())
+
+
+def _failing_finish(store: JobStore, failures: int):
+    finish = store.finish
+    calls = {"n": 0}
+
+    def flaky(*args, **kwargs):
+        calls["n"] += 1
+        if calls["n"] <= failures:
+            raise sqlite3.OperationalError("database is locked")
+        return finish(*args, **kwargs)
+
+    store.finish = flaky
+
+
+def test_worker_retries_a_locked_finish(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "_STORE_WRITE_RETRY_DELAY", 0.0)
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    _failing_finish(store, failures=1)
+
+    jobs = _run_jobs(store, 2)
+
+    assert [job["state"] for job in jobs] == ["succeeded", "succeeded"]
+
+
+def test_worker_survives_a_finish_that_keeps_failing(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "_STORE_WRITE_RETRY_DELAY", 0.0)
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    _failing_finish(store, failures=job_queue._STORE_WRITE_ATTEMPTS)
+
+    jobs = _run_jobs(store, 2)
+
+    # The first job stays running until its lease expires; the worker moves on to the next.
+    assert [job["state"] for job in jobs] == ["running", "succeeded"]
@@ -0,0 +1,26 @@
+from datetime import date
+from decimal import Decimal
+
+from app.analysis.prompt_chunker import merge_subscription_lists
+from app.models.schemas import TransactionInput
+
+
+def _transactions():
+    return [
+        TransactionInput(id=tx_id, userId="u1", transaction_date=date(2024, month, 3), description="Netflix", amount=Decimal("15.49"), currency="USD")
+        for month, tx_id in enumerate(["1", "2", "12"], start=1)
+    ]
+
+
+def test_merge_ignores_transaction_ids_that_are_not_lists():
+    partials = [
+        [{"name": "Netflix", "currency": "USD", "confidence_score": 0.9, "transaction_ids": ["1", 2]}],
+        [{"name": "Netflix", "currency": "USD", "confidence_score": "high", "transaction_ids": 12}],
+        [{"name": "Netflix", "currency": "USD", "confidence_score": None, "transaction_ids": "12"}],
+        [{"name": "Hulu", "currency": "USD", "transaction_ids": "12"}],
+    ]
+
+    merged = merge_subscription_lists(partials, _transactions())
+
+    assert [(sub["name"], sub["transaction_ids"]) for sub in merged] == [("Netflix", ["1", "2"])]
+    assert merged[0]["confidence_score"] == 0.9
@@ -0,0 +1,65 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import product
+
+from app.analysis.prompt_chunker import estimate_tokens, plan_transaction_chunks
+from app.analysis.prompt_encoding import CompactTransactionTable, approximate_compact_row, approximate_merchant_entry
+from app.models.schemas import TransactionInput
+from benchmarks.synthetic import generate_user_transactions
+
+
+def _transaction(tx_id: str, description: str, day: int = 0, currency: str = "USD") -> TransactionInput:
+    return TransactionInput(
+        id=tx_id, userId="u1", transaction_date=date(2024, 1, 1) + timedelta(days=day),
+        description=description, amount=Decimal("9.99"), currency=currency
+    )
+
+
+def test_round_trip_restores_original_ids():
+    transactions = generate_user_transactions("u1", 500, seed=7)
+    table = CompactTransactionTable(transactions)
+
+    assert sorted(tx.id for tx in table.rows.values()) == sorted(tx.id for tx in transactions)
+    for row_id, tx in table.rows.items():
+        assert table.original_id(row_id) == tx.id
+
+    restored = table.restore({"name": "All", "transaction_ids": list(table.rows) + ["999999"]})
+    assert sorted(restored["transaction_ids"]) == sorted(tx.id for tx in transactions)
+
+
+def test_round_trip_keeps_ids_with_separators_in_description():
+    transactions = [
+        _transaction("a|1", "|||"),
+        _transaction("b-2", "ACME|PAY\nREF", day=3),
+        _transaction("c 3", "Plain Shop", day=5, currency="eur"),
+    ]
+    table = CompactTransactionTable(transactions)
+    rendered = table.render()
+
+    merchants = rendered.split("Merchants (code=name):\n", 1)[1].split("\nRows", 1)[0].splitlines()
+    assert len(merchants) == len(table.merchant_codes)
+    rows = rendered.split("):\n")[-1].strip().splitlines()
+    assert len(rows) == len(transactions)
+    assert all(len(row.split("|")) in (4, 5) for row in rows)
+
+    restored = table.restore({"name": "All", "transaction_ids": list(table.rows)})
+    assert restored["transaction_ids"] == ["a|1", "b-2", "c 3"]
+
+
+def test_compact_chunks_count_the_merchant_dictionary():
+    # Every transaction has its own long merchant name, so the dictionary outweighs the rows.
+    names = (" ".join(words) for words in product(["northwind", "contoso", "fabrikam", "tailspin"], repeat=3))
+    transactions = [_transaction(f"t{i}", f"{name} subscription services", day=i) for i, name in enumerate(names)]
+    budget = 200
+
+    chunks = plan_transaction_chunks(
+        transactions, budget, format_line=approximate_compact_row, format_merchant=approximate_merchant_entry
+    )
+
+    assert sorted(tx.id for chunk in chunks for tx in chunk) == sorted(tx.id for tx in transactions)
+    for chunk in chunks:
+        table = CompactTransactionTable(chunk)
+        rendered = table.render()
+        merchants = rendered.split("Merchants (code=name):\n", 1)[1].split("\nRows", 1)[0].splitlines()
+        rows = rendered.split("):\n")[-1].strip().splitlines()
+        assert sum(estimate_tokens(line) for line in merchants + rows) <= budget